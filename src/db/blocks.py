@@ -0,0 +1,131 @@
+"""
+压缩时间序列块的编解码（Gorilla风格）
+
+一个块保存一台电机一段时间内的全部采样（时间戳和若干数值列）:
+    - 时间戳: 首个ts + 二阶差分（delta-of-delta），按大小分为0/8/16/64位四档
+    - 数值字段: 首个值 + 与前一个值按位异或，相同的值只占1位，不同的值保存去掉前导零和尾随零后的有效位
+
+与Gorilla原文的区别是控制位（是否变化、前导零个数、有效位长度、时间戳档位）不与数据位交错，
+而是各自以定长位流保存，编码和解码都可以用NumPy整批完成，不需要逐个值的Python循环。
+
+块格式（小端）:
+    uint32 采样数n, uint32 列数
+    uint32 长度 + 时间戳段: int64首个ts | n-1个2位档位 | 各档位宽的zigzag二阶差分
+    每一列: uint32 长度 + 数值段:
+        float64首个值 | n-1位是否变化 | 每个变化值12位（6位前导零个数、6位有效位长度-1） | 有效位
+"""
+
+import struct
+
+import numpy as np
+
+# 时间戳二阶差分的zigzag值小于各上限时使用的档位，档位对应的位宽
+_TS_LIMITS = np.array([1, 1 << 8, 1 << 16], dtype=np.uint64)
+_TS_WIDTHS = np.array([0, 8, 16, 64], dtype=np.int64)
+
+_BITS = np.arange(64)
+
+
+def _pack_bits(values, widths):
+    """每个uint64值取低widths位（高位在前）依次拼接为位流"""
+    if not len(values):
+        return b''
+    widths = np.broadcast_to(widths, values.shape)
+    bits = np.unpackbits(values.astype('>u8').view(np.uint8)).reshape(-1, 64)
+    return np.packbits(bits[_BITS >= (64 - widths)[:, None]]).tobytes()
+
+
+def _unpack_bits(data, widths):
+    """_pack_bits的逆过程，返回uint64数组"""
+    if not len(widths):
+        return np.empty(0, dtype=np.uint64)
+    mask = _BITS >= (64 - widths)[:, None]
+    bits = np.zeros((len(widths), 64), dtype=np.uint8)
+    bits[mask] = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=int(widths.sum()))
+    return np.packbits(bits, axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+def _nbytes(bits):
+    return (int(bits) + 7) // 8
+
+
+def _encode_ts(ts):
+    dod = np.diff(np.diff(ts), prepend=0) if len(ts) > 1 else np.empty(0, dtype=np.int64)
+    zigzag = ((dod << 1) ^ (dod >> 63)).astype(np.uint64)
+    classes = np.searchsorted(_TS_LIMITS, zigzag, side='right')
+    return (struct.pack('<q', ts[0]) + _pack_bits(classes.astype(np.uint64), 2)
+            + _pack_bits(zigzag, _TS_WIDTHS[classes]))
+
+
+def _decode_ts(data, count):
+    first, = struct.unpack_from('<q', data)
+    offset = 8 + _nbytes(2 * (count - 1))
+    classes = _unpack_bits(data[8:offset], np.full(count - 1, 2)).astype(np.int64)
+    zigzag = _unpack_bits(data[offset:], _TS_WIDTHS[classes])
+    dod = (zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(np.int64)
+    return first + np.concatenate(([0], np.cumsum(np.cumsum(dod))))
+
+
+def _encode_values(values):
+    bits = np.ascontiguousarray(values, dtype=np.float64).view(np.uint64)
+    xor = bits[1:] ^ bits[:-1]
+    changed = xor != 0
+    xor = xor[changed]
+    matrix = np.unpackbits(xor.astype('>u8').view(np.uint8)).reshape(-1, 64)
+    lead = matrix.argmax(axis=1)
+    trail = matrix[:, ::-1].argmax(axis=1)
+    length = 64 - lead - trail
+    headers = (lead << 6 | (length - 1)).astype(np.uint64)
+    return (bits[:1].tobytes() + np.packbits(changed).tobytes() + _pack_bits(headers, 12)
+            + _pack_bits(xor >> trail.astype(np.uint64), length))
+
+
+def _decode_values(data, count):
+    offset = 8 + _nbytes(count - 1)
+    changed = np.unpackbits(np.frombuffer(data[8:offset], dtype=np.uint8), count=count - 1).astype(bool)
+    headers_end = offset + _nbytes(12 * changed.sum())
+    headers = _unpack_bits(data[offset:headers_end], np.full(int(changed.sum()), 12)).astype(np.int64)
+    lead, length = headers >> 6, (headers & 63) + 1
+    xor = np.zeros(count, dtype=np.uint64)
+    xor[0] = np.frombuffer(data[:8], dtype=np.uint64)[0]
+    xor[1:][changed] = _unpack_bits(data[headers_end:], length) << (64 - lead - length).astype(np.uint64)
+    return np.bitwise_xor.accumulate(xor).view(np.float64)
+
+
+def encode_block(ts, values):
+    """
+    编码一个块
+
+    Args:
+        ts: 升序的epoch毫秒（int64数组，至少一个）
+        values: (len(ts), 列数)的float64矩阵
+
+    Returns:
+        bytes
+    """
+    ts = np.asarray(ts, dtype=np.int64)
+    sections = [_encode_ts(ts)] + [_encode_values(values[:, column]) for column in range(values.shape[1])]
+    return struct.pack('<II', len(ts), values.shape[1]) + b''.join(
+        struct.pack('<I', len(section)) + section for section in sections)
+
+
+def decode_block(data, columns=None):
+    """
+    解码一个块，只解码columns中的列（列序号，默认全部）
+
+    Returns:
+        (ts数组, {列序号: float64数组})
+    """
+    count, total = struct.unpack_from('<II', data)
+    wanted = range(total) if columns is None else set(columns)
+    offset = 8
+    length, = struct.unpack_from('<I', data, offset)
+    ts = _decode_ts(data[offset + 4:offset + 4 + length], count)
+    offset += 4 + length
+    values = {}
+    for column in range(total):
+        length, = struct.unpack_from('<I', data, offset)
+        if column in wanted:
+            values[column] = _decode_values(data[offset + 4:offset + 4 + length], count)
+        offset += 4 + length
+    return ts, values
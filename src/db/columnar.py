@@ -0,0 +1,220 @@
+"""
+列式归档工具
+
+把已经结束的日期的原始数据转换为按列存储的NumPy文件，分析时用内存映射直接读取，不经过SQLite逐行构造元组和字典:
+
+    <归档目录>/<YYYYMMDD>/motor_<电机>/ts.npy          epoch毫秒，int64，升序（时间索引）
+    <归档目录>/<YYYYMMDD>/motor_<电机>/<字段>.npy      与ts逐元素对应，float64
+
+每天先写入<YYYYMMDD>.tmp目录再改名，读者不会看到写了一半的日期；已归档的日期默认跳过。
+原始数据仍保留在SQLite中，由数据保留任务按retention_days清理。
+
+用法:
+    python columnar.py --db motor_data.db --output columnar/ [--start 2024-01-01] [--end 2025-01-01]
+
+读取:
+    archive = ColumnarArchive('columnar/')
+    for day, columns in archive.iter_days(1, fields=['excitation_current_ratio']):
+        peak = columns['excitation_current_ratio'].max()
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# 添加src目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.database import DatabaseManager, NUMERIC_FIELDS, to_epoch_ms
+
+# 日期目录名，与按天分区的文件名相同（本地时间）
+DAY_FORMAT = '%Y%m%d'
+
+
+def day_key(value):
+    """datetime、ISO字符串或epoch秒所在日期的目录名"""
+    return datetime.fromtimestamp(to_epoch_ms(value) / 1000).strftime(DAY_FORMAT)
+
+
+def day_period(key):
+    """日期覆盖的时间范围(起点, 终点)，datetime，左闭右开"""
+    start = datetime.strptime(key, DAY_FORMAT)
+    return start, start + timedelta(days=1)
+
+
+class ColumnarArchive:
+    """列式归档目录的读写"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, day, motor_id=None):
+        path = os.path.join(self.directory, day)
+        return path if motor_id is None else os.path.join(path, f'motor_{motor_id}')
+
+    def days(self, start_time=None, end_time=None):
+        """与时间范围相交的已归档日期，按时间顺序"""
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            return []
+        first = day_key(start_time) if start_time is not None else None
+        last = day_key(end_time) if end_time is not None else None
+        days = []
+        for name in names:
+            try:
+                day_period(name)
+            except ValueError:
+                continue  # .tmp目录和其他文件
+            if (first is None or name >= first) and (last is None or name <= last):
+                days.append(name)
+        return days
+
+    def motors(self, day):
+        """某天归档中的电机编号"""
+        return sorted(int(name[len('motor_'):]) for name in os.listdir(self.path(day)) if name.startswith('motor_'))
+
+    def load(self, motor_id, day, fields=None):
+        """
+        一台电机一天的数据
+
+        Returns:
+            {'ts': 时间索引, 字段: 数值}，均为只读的np.memmap（不读入内存）；当天没有该电机时返回None
+        """
+        path = self.path(day, motor_id)
+        if not os.path.isdir(path):
+            return None
+        columns = {'ts': np.load(os.path.join(path, 'ts.npy'), mmap_mode='r')}
+        for field in fields or NUMERIC_FIELDS:
+            columns[field] = np.load(os.path.join(path, f'{field}.npy'), mmap_mode='r')
+        return columns
+
+    def iter_days(self, motor_id, start_time=None, end_time=None, fields=None):
+        """
+        按日期顺序迭代(日期, load()的结果)
+
+        首尾两天按时间范围（两端都包含）切片，切片仍是内存映射，不复制数据
+        """
+        start_ms = to_epoch_ms(start_time) if start_time is not None else None
+        end_ms = to_epoch_ms(end_time) if end_time is not None else None
+        for day in self.days(start_time, end_time):
+            columns = self.load(motor_id, day, fields)
+            if columns is None:
+                continue
+            ts = columns['ts']
+            first = int(np.searchsorted(ts, start_ms, 'left')) if start_ms is not None else 0
+            last = int(np.searchsorted(ts, end_ms, 'right')) if end_ms is not None else len(ts)
+            if first or last < len(ts):
+                columns = {name: column[first:last] for name, column in columns.items()}
+            if len(columns['ts']):
+                yield day, columns
+
+    def read(self, motor_id, start_time=None, end_time=None, fields=None):
+        """时间范围内的数据拼接为一组数组（复制到内存），没有数据时为空数组"""
+        fields = list(fields or NUMERIC_FIELDS)
+        chunks = [columns for _, columns in self.iter_days(motor_id, start_time, end_time, fields)]
+        result = {'ts': np.concatenate([c['ts'] for c in chunks]) if chunks else np.empty(0, dtype=np.int64)}
+        for field in fields:
+            result[field] = np.concatenate([c[field] for c in chunks]) if chunks else np.empty(0)
+        return result
+
+    def write_day(self, day, samples):
+        """
+        写入一天的数据，替换已有的同一天
+
+        Args:
+            samples: DatabaseManager.get_samples返回的矩阵（按电机、时间排序）
+
+        Returns:
+            写入的电机数
+        """
+        target = self.path(day)
+        tmp = target + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        motor_ids = samples[:, 0].astype(np.int64)
+        starts = np.flatnonzero(np.concatenate(([True], motor_ids[1:] != motor_ids[:-1]))) if len(samples) else []
+        ends = np.append(starts[1:], len(samples))
+        for start, end in zip(starts, ends):
+            motor_path = os.path.join(tmp, f'motor_{motor_ids[start]}')
+            os.makedirs(motor_path)
+            np.save(os.path.join(motor_path, 'ts.npy'), samples[start:end, 1].astype(np.int64))
+            for column, field in enumerate(NUMERIC_FIELDS, start=2):
+                np.save(os.path.join(motor_path, f'{field}.npy'), np.ascontiguousarray(samples[start:end, column]))
+        # 目录不能用os.replace覆盖非空目录，先移走旧的再改名
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.replace(tmp, target)
+        return len(starts)
+
+
+def compact(db_manager, archive, start_time=None, end_time=None, overwrite=False, progress=None):
+    """
+    把已经结束的日期（今天之前）逐天写入列式归档
+
+    Args:
+        db_manager: DatabaseManager
+        archive: ColumnarArchive
+        start_time/end_time: 日期范围，默认为统计表中最早的数据到昨天
+        overwrite: 是否重新生成已归档的日期
+        progress: 每处理完一天调用progress(日期, 电机数, 采样数)
+
+    Returns:
+        写入的采样数
+    """
+    if start_time is None:
+        start_time = db_manager.get_database_stats().get('time_range', (None, None))[0]
+        if start_time is None:
+            return 0
+    today = datetime.now().strftime(DAY_FORMAT)
+    last = min(day_key(end_time), today) if end_time is not None else today
+    day = day_key(start_time)
+    existing = set(archive.days())
+    total = 0
+    while day < last:
+        period = day_period(day)
+        if overwrite or day not in existing:
+            samples = db_manager.get_samples(*period)
+            if len(samples):
+                motors = archive.write_day(day, samples)
+                total += len(samples)
+                if progress:
+                    progress(day, motors, len(samples))
+        day = period[1].strftime(DAY_FORMAT)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='电机数据列式归档工具')
+    parser.add_argument('--db', required=True, help='数据库文件路径')
+    parser.add_argument('--layout', choices=('row', 'wide'), default='row', help='存储布局（与采集服务的database.layout相同）')
+    parser.add_argument('--station', default='', help='宽表中的站点标识')
+    parser.add_argument('--partition', choices=('', 'day', 'week'), default='', help='原始数据分区粒度')
+    parser.add_argument('--output', default='columnar', help='列式归档目录')
+    parser.add_argument('--start', help='起始日期（ISO格式），默认最早的数据')
+    parser.add_argument('--end', help='结束日期（不含），默认今天；今天及之后的日期不归档')
+    parser.add_argument('--overwrite', action='store_true', help='重新生成已归档的日期')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"数据库文件 {args.db} 不存在")
+        return
+
+    db_manager = DatabaseManager(args.db, args.layout, args.station, args.partition)
+    archive = ColumnarArchive(args.output)
+    started = time.time()
+
+    def report(day, motors, samples):
+        print(f"{day}: {motors} 台电机 {samples} 条，已用时 {time.time() - started:.1f} 秒")
+
+    total = compact(db_manager, archive, args.start, args.end, args.overwrite, report)
+    print(f"共归档 {total} 条记录到 {args.output}，耗时 {time.time() - started:.1f} 秒")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,718 @@
 import sqlite3
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
+import heapq
+import itertools
 import logging
 import sys
+import time
+from operator import itemgetter
+
+import numpy as np
+
+from metrics import REGISTRY
+from db.blocks import decode_block, encode_block
+from db.deadband import CompressionSpec, interpolate
 
 logger = logging.getLogger(__name__)
 
+WRITE_SECONDS = REGISTRY.histogram('db_write_duration_seconds', '一次数据库写入事务的耗时')
+ROWS_WRITTEN = REGISTRY.counter('db_rows_written_total', '写入数据库的行数')
+WRITE_ERRORS = REGISTRY.counter('db_write_errors_total', '失败的数据库写入次数')
+QUERY_SECONDS = REGISTRY.histogram('db_query_duration_seconds', '时间范围查询的耗时')
+
+# 表结构版本，记录在PRAGMA user_version中（旧版ISO文本时间戳的表为1），升级见migrate.py
+SCHEMA_VERSION = 9
+
+# 存储布局: row为每台电机一行(motor_data)，wide为每次轮询一行(poll_snapshots)
+LAYOUTS = ('row', 'wide')
+
+# 以(motor_id, ts)为主键的WITHOUT ROWID表：每次插入只更新一棵B树，
+# 同一电机的时间范围查询是主键上的连续扫描；ts为epoch毫秒
+CREATE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        motor_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        phase_a_current REAL,
+        phase_b_current REAL,
+        phase_c_current REAL,
+        frequency REAL,
+        reactive_power REAL,
+        active_power REAL,
+        line_voltage REAL,
+        excitation_voltage REAL,
+        excitation_current REAL,
+        calculated_excitation_current REAL,
+        excitation_current_ratio REAL,
+        PRIMARY KEY (motor_id, ts)
+    ) WITHOUT ROWID
+'''
+
+# 同一电机同一毫秒的重复采样以最后一次为准；{table}为motor_data或<附加库名>.motor_data
+INSERT_SQL = '''
+    INSERT OR REPLACE INTO {table} (
+        motor_id, ts, phase_a_current, phase_b_current,
+        phase_c_current, frequency, reactive_power, active_power,
+        line_voltage, excitation_voltage, excitation_current,
+        calculated_excitation_current, excitation_current_ratio
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# motor_data中的数值列
+NUMERIC_FIELDS = (
+    'phase_a_current', 'phase_b_current', 'phase_c_current', 'frequency',
+    'reactive_power', 'active_power', 'line_voltage', 'excitation_voltage',
+    'excitation_current', 'calculated_excitation_current', 'excitation_current_ratio'
+)
+
+# 宽表：每个站点每次轮询一行，所有电机打包为float32矩阵（每台电机一行: motor_id + 数值列，缺失值为NaN）
+CREATE_SNAPSHOT_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS poll_snapshots (
+        station TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        motor_count INTEGER NOT NULL,
+        data BLOB NOT NULL,
+        PRIMARY KEY (station, ts)
+    ) WITHOUT ROWID
+'''
+
+INSERT_SNAPSHOT_SQL = '''
+    INSERT OR REPLACE INTO {table} (station, ts, motor_count, data) VALUES (?, ?, ?, ?)
+'''
+
+SNAPSHOT_COLUMNS = ('motor_id',) + NUMERIC_FIELDS
+_SNAPSHOT_DTYPE = np.dtype('<f4')
+
+# 每台电机最新的一行，写入原始数据时在同一事务中覆盖，"所有电机最新数据"查询与归档大小无关
+CREATE_LATEST_TABLE_SQL = f'''
+    CREATE TABLE IF NOT EXISTS motor_latest (
+        station TEXT NOT NULL,
+        motor_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        {', '.join(f'{field} REAL' for field in NUMERIC_FIELDS)},
+        PRIMARY KEY (station, motor_id)
+    ) WITHOUT ROWID
+'''
+
+# 补写的旧数据不会覆盖更新的一行
+UPSERT_LATEST_SQL = f'''
+    INSERT INTO motor_latest (station, motor_id, ts, {', '.join(NUMERIC_FIELDS)})
+    VALUES ({', '.join('?' * (3 + len(NUMERIC_FIELDS)))})
+    ON CONFLICT (station, motor_id) DO UPDATE SET
+        ts = excluded.ts,
+        {', '.join(f'{field} = excluded.{field}' for field in NUMERIC_FIELDS)}
+    WHERE excluded.ts >= motor_latest.ts
+'''
+
+# 每台电机的记录数和时间范围，写入时在同一事务中累加、清理时扣减，统计信息不再需要全表扫描；
+# 同一采样被覆盖写入时会重复计数，get_database_stats(exact=True)全表重新统计后校正
+CREATE_STATS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS motor_stats (
+        station TEXT NOT NULL,
+        motor_id INTEGER NOT NULL,
+        record_count INTEGER NOT NULL,
+        first_ts INTEGER NOT NULL,
+        last_ts INTEGER NOT NULL,
+        PRIMARY KEY (station, motor_id)
+    ) WITHOUT ROWID
+'''
+
+UPSERT_STATS_SQL = '''
+    INSERT INTO motor_stats (station, motor_id, record_count, first_ts, last_ts) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (station, motor_id) DO UPDATE SET
+        record_count = record_count + excluded.record_count,
+        first_ts = min(first_ts, excluded.first_ts),
+        last_ts = max(last_ts, excluded.last_ts)
+'''
+
+# 压缩块（编码见blocks.py）: 已经结束的时间块中每台电机一行，ts/last_ts为块内第一个/最后一个采样的时间。
+# 块大小可达几百KB，用普通的rowid表，主键索引只保存键
+CREATE_BLOCK_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS motor_blocks (
+        station TEXT NOT NULL,
+        motor_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        last_ts INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        data BLOB NOT NULL,
+        PRIMARY KEY (station, motor_id, ts)
+    )
+'''
+
+# 写入端记录的设置（如死区/旋转门压缩的各字段方法，读取时据此插值重建），每个站点每项一行，value为JSON
+CREATE_SETTINGS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS archive_settings (
+        station TEXT NOT NULL,
+        name TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (station, name)
+    ) WITHOUT ROWID
+'''
+
+UPSERT_SETTING_SQL = '''
+    INSERT OR REPLACE INTO archive_settings (station, name, value) VALUES (?, ?, ?)
+'''
+
+LATEST_COLUMNS = ', '.join(('motor_id', 'ts') + NUMERIC_FIELDS)
+
+# 原始数据的分区粒度: 空字符串表示不分区，day/week为每天/每周一个文件（本地时间）
+PARTITIONS = ('', 'day', 'week')
+_PARTITION_FORMATS = {'day': '%Y%m%d', 'week': '%G-W%V'}
+
+# 汇总表的时间粒度（秒），从细到粗
+ROLLUP_RESOLUTIONS = (60, 900, 3600)
+# count为该字段在桶内的有效（非缺失）采样数，均值为sum / count
+ROLLUP_STATS = ('min', 'max', 'sum', 'last', 'count')
+_ROLLUP_COLUMNS = [f'{field}_{stat}' for field in NUMERIC_FIELDS for stat in ROLLUP_STATS]
+
+# 降采样汇总表：每个粒度、每台电机、每个时间桶一行，bucket为桶起点(epoch毫秒)，
+# last_ts为桶内最后一个采样的时间；两种布局写入时都在同一事务中增量更新
+CREATE_ROLLUP_TABLE_SQL = f'''
+    CREATE TABLE IF NOT EXISTS motor_rollups (
+        station TEXT NOT NULL,
+        resolution INTEGER NOT NULL,
+        motor_id INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        last_ts INTEGER NOT NULL,
+        {', '.join(f"{column} {'INTEGER' if column.endswith('_count') else 'REAL'}" for column in _ROLLUP_COLUMNS)},
+        PRIMARY KEY (station, resolution, motor_id, bucket)
+    ) WITHOUT ROWID
+'''
+
+# 新的部分汇总与已有的桶合并；覆盖写入同一采样（INSERT OR REPLACE）时该采样会被重复计数。
+# 桶内全部缺失的字段min/max为NULL，SQLite的min()/max()有一个参数为NULL时返回NULL，用coalesce取另一方
+UPSERT_ROLLUP_SQL = f'''
+    INSERT INTO motor_rollups (station, resolution, motor_id, bucket, count, last_ts, {', '.join(_ROLLUP_COLUMNS)})
+    VALUES ({', '.join('?' * (6 + len(_ROLLUP_COLUMNS)))})
+    ON CONFLICT (station, resolution, motor_id, bucket) DO UPDATE SET
+        count = count + excluded.count,
+        last_ts = max(last_ts, excluded.last_ts),
+        {', '.join(
+            f'{field}_min = coalesce(min({field}_min, excluded.{field}_min), {field}_min, excluded.{field}_min), '
+            f'{field}_max = coalesce(max({field}_max, excluded.{field}_max), {field}_max, excluded.{field}_max), '
+            f'{field}_sum = {field}_sum + excluded.{field}_sum, '
+            f'{field}_count = {field}_count + excluded.{field}_count, '
+            f'{field}_last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.{field}_last ELSE {field}_last END'
+            for field in NUMERIC_FIELDS
+        )}
+'''
+
+
+def to_epoch_ms(value):
+    """把datetime、ISO字符串或epoch秒转换为epoch毫秒整数"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        value = value.timestamp()
+    return int(value * 1000)
+
+
+def from_epoch_ms(ts):
+    """epoch毫秒转换为本地时间的ISO字符串"""
+    return datetime.fromtimestamp(ts / 1000).isoformat(timespec='milliseconds')
+
+
+def get_schema_version(conn):
+    """
+    数据库的表结构版本
+
+    0表示还没有motor_data表；旧版表没有设置user_version，按是否有timestamp列识别为1
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version:
+        return version
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(motor_data)')]
+    if not columns:
+        return 0
+    return 1 if 'timestamp' in columns else SCHEMA_VERSION
+
+
+def _row_to_dict(row):
+    """查询结果转换为字典，附带ISO格式的timestamp便于显示"""
+    data = dict(row)
+    data['timestamp'] = from_epoch_ms(data['ts'])
+    return data
+
+
+def snapshot_row(motors, station=''):
+    """把一轮MotorData对象列表打包为INSERT_SNAPSHOT_SQL的参数元组"""
+    matrix = np.array(
+        [[motor.motor_id] + [getattr(motor, field) for field in NUMERIC_FIELDS] for motor in motors],
+        dtype=_SNAPSHOT_DTYPE
+    )
+    last_update = motors[0].last_update if motors else None
+    return (station, to_epoch_ms(last_update or datetime.now()), len(motors), matrix.tobytes())
+
+
+def unpack_snapshot(data, motor_count):
+    """宽表data列还原为(电机数量, len(SNAPSHOT_COLUMNS))的矩阵"""
+    return np.frombuffer(data, dtype=_SNAPSHOT_DTYPE).reshape(motor_count, len(SNAPSHOT_COLUMNS))
+
+
+def _merge_by_ts(blocks, raw):
+    """
+    按ts合并压缩块和原始数据中的行
+
+    块压缩后原始表中仍可能有更早的迟到或补写的采样，两者各自有序，但不能简单地先后拼接
+    """
+    return heapq.merge(blocks, raw, key=itemgetter('ts'))
+
+
+def _merge_newest(raw, blocks, limit):
+    """按时间倒序的原始数据和压缩块数据按ts合并，取最新的limit条（原因同_merge_by_ts）"""
+    return list(itertools.islice(heapq.merge(raw, blocks, key=itemgetter('ts'), reverse=True), limit))
+
+
+def _iter_snapshot_batch(rows, motor_id, fields):
+    """
+    从一批宽表行中取出一台电机的数据
+
+    电机数量相同的连续行拼接为一个三维数组一次解包，避免逐行调用NumPy
+    """
+    columns = [SNAPSHOT_COLUMNS.index(field) for field in fields]
+    start = 0
+    while start < len(rows):
+        count = rows[start][2]
+        end = start
+        while end < len(rows) and rows[end][2] == count:
+            end += 1
+        group = rows[start:end]
+        matrix = np.frombuffer(b''.join(row[1] for row in group), dtype=_SNAPSHOT_DTYPE)
+        matrix = matrix.reshape(len(group), count, len(SNAPSHOT_COLUMNS))
+        matches = matrix[:, :, 0] == motor_id
+        positions = matches.argmax(axis=1)
+        present = matches[np.arange(len(group)), positions].tolist()
+        values = matrix[np.arange(len(group)), positions][:, columns].tolist()
+        for (ts, _, _), found, row in zip(group, present, values):
+            if found:
+                motor = {'motor_id': motor_id, 'ts': ts}
+                motor.update((field, None if value != value else value) for field, value in zip(fields, row))
+                yield motor
+        start = end
+
+
+def batch_samples(rows, layout='row'):
+    """
+    一批待写入（或已存储）的行转换为float64矩阵，每个采样一行: motor_id, ts, 数值列
+
+    rows为motor_row元组（row布局）或INSERT_SNAPSHOT_SQL参数元组（wide布局）；缺失值（NULL）为NaN
+    """
+    if layout == 'wide':
+        parts = []
+        for _, ts, motor_count, data in rows:
+            matrix = unpack_snapshot(data, motor_count)
+            parts.append(np.column_stack((matrix[:, 0], np.full(motor_count, ts), matrix[:, 1:])))
+        samples = np.concatenate(parts) if parts else np.empty((0, 2 + len(NUMERIC_FIELDS)))
+    else:
+        samples = np.array(rows, dtype=np.float64).reshape(-1, 2 + len(NUMERIC_FIELDS))
+    return samples
+
+
+def rollup_rows(samples, station=''):
+    """
+    把一批采样按各粒度分桶汇总为UPSERT_ROLLUP_SQL的参数元组
+
+    每个(粒度, 电机, 桶)一行，分组和min/max/sum都在NumPy中完成；缺失值（NaN）不参与min/max/sum，
+    也不计入该字段的有效采样数，桶内全部缺失的字段min/max为NULL
+    """
+    rows = []
+    if not len(samples):
+        return rows
+    motor_ids = samples[:, 0].astype(np.int64)
+    ts = samples[:, 1].astype(np.int64)
+    values = samples[:, 2:]
+    for resolution in ROLLUP_RESOLUTIONS:
+        width = resolution * 1000
+        buckets = ts - ts % width
+        order = np.lexsort((ts, buckets, motor_ids))
+        group_ids, group_buckets, group_ts, group_values = motor_ids[order], buckets[order], ts[order], values[order]
+        changed = (group_ids[1:] != group_ids[:-1]) | (group_buckets[1:] != group_buckets[:-1])
+        starts = np.flatnonzero(np.concatenate(([True], changed)))
+        ends = np.append(starts[1:], len(order))
+        present = ~np.isnan(group_values)
+        stats = np.stack((
+            np.fmin.reduceat(group_values, starts),
+            np.fmax.reduceat(group_values, starts),
+            np.add.reduceat(np.where(present, group_values, 0.0), starts),
+            group_values[ends - 1],
+            np.add.reduceat(present, starts),
+        ), axis=2).reshape(len(starts), -1)  # 每个字段依次为min, max, sum, last, count（NaN写入后为NULL）
+        for motor_id, bucket, count, last_ts, stat in zip(
+                group_ids[starts].tolist(), group_buckets[starts].tolist(),
+                (ends - starts).tolist(), group_ts[ends - 1].tolist(), stats.tolist()):
+            rows.append((station, resolution, motor_id, bucket, count, last_ts, *stat))
+    return rows
+
+
+def update_rollups(conn, samples, station=''):
+    """在调用方的事务中把一批采样合并进汇总表"""
+    conn.executemany(UPSERT_ROLLUP_SQL, rollup_rows(samples, station))
+
+
+def latest_rows(samples, station=''):
+    """每台电机在这批采样中最新的一行，转换为UPSERT_LATEST_SQL的参数元组；缺失值（NaN）写为NULL"""
+    if not len(samples):
+        return []
+    ordered = samples[np.lexsort((samples[:, 1], samples[:, 0]))]
+    motor_ids = ordered[:, 0]
+    last = np.flatnonzero(np.append(motor_ids[1:] != motor_ids[:-1], True))
+    return [(station, int(row[0]), int(row[1]), *(None if value != value else value for value in row[2:]))
+            for row in ordered[last].tolist()]
+
+
+def update_latest(conn, samples, station=''):
+    """在调用方的事务中用一批采样更新最新值表"""
+    conn.executemany(UPSERT_LATEST_SQL, latest_rows(samples, station))
+
+
+def stats_rows(samples, station=''):
+    """每台电机在这批采样中的(记录数, 最早ts, 最新ts)，转换为UPSERT_STATS_SQL的参数元组"""
+    if not len(samples):
+        return []
+    ordered = samples[np.lexsort((samples[:, 1], samples[:, 0]))]
+    motor_ids = ordered[:, 0].astype(np.int64)
+    ts = ordered[:, 1].astype(np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], motor_ids[1:] != motor_ids[:-1])))
+    ends = np.append(starts[1:], len(ordered))
+    return [
+        (station, motor_id, count, first_ts, last_ts)
+        for motor_id, count, first_ts, last_ts in zip(
+            motor_ids[starts].tolist(), (ends - starts).tolist(), ts[starts].tolist(), ts[ends - 1].tolist())
+    ]
+
+
+def update_summaries(conn, samples, station='', stored=None):
+    """
+    写入原始数据的同一事务中更新由它派生的表（汇总表、最新值表、统计表）
+
+    死区/旋转门压缩时stored为实际写入原始数据表的采样，统计表按它计数，汇总表和最新值表仍使用全部采样
+    """
+    update_rollups(conn, samples, station)
+    update_latest(conn, samples, station)
+    conn.executemany(UPSERT_STATS_SQL, stats_rows(samples if stored is None else stored, station))
+
+
+def subtract_stats(conn, table, key, rows, first_ts):
+    """
+    从统计表中扣减删除的原始数据
+
+    table为motor_data时key为电机编号；为poll_snapshots时key为站点，按每次轮询包含该站点所有电机计算，
+    该站点每台电机各扣减rows次；为motor_blocks时key为(站点, 电机编号)。
+    first_ts为删除后该表剩余数据的最早时间（的下界），压缩块中更早的数据也会被考虑
+    """
+    if table == 'motor_data':
+        where, params = "station = '' AND motor_id = ?", (key,)
+    elif table == 'motor_blocks':
+        where, params = 'station = ? AND motor_id = ?', tuple(key)
+    else:
+        where, params = 'station = ?', (key,)
+    block_ts = conn.execute(f'SELECT MIN(ts) FROM motor_blocks WHERE {where}', params).fetchone()[0]
+    if block_ts is not None:
+        first_ts = min(first_ts, block_ts)
+    conn.execute(f'''
+        UPDATE motor_stats SET record_count = max(record_count - ?, 0), first_ts = max(first_ts, ?)
+        WHERE {where}
+    ''', (rows, first_ts) + params)
+    conn.execute(f'DELETE FROM motor_stats WHERE record_count = 0 AND {where}', params)
+
+
+def recount_stats(conn):
+    """
+    全表扫描统计连接上的原始数据（包括压缩块）
+
+    Returns:
+        {(站点, 电机编号): [记录数, 最早ts, 最新ts]}，逐行布局的站点为空字符串
+    """
+    stats = {}
+    for motor_id, count, first_ts, last_ts in conn.execute(
+            'SELECT motor_id, COUNT(*), MIN(ts), MAX(ts) FROM motor_data GROUP BY motor_id'):
+        stats[('', motor_id)] = [count, first_ts, last_ts]
+    # 宽表需要解包每次轮询的矩阵才能知道其中的电机
+    cursor = conn.execute('SELECT station, ts, motor_count, data FROM poll_snapshots')
+    while True:
+        rows = cursor.fetchmany(5000)
+        if not rows:
+            break
+        for station, group in itertools.groupby(rows, key=lambda row: row[0]):
+            for _, motor_id, count, first_ts, last_ts in stats_rows(batch_samples(list(group), 'wide'), station):
+                merge_stats(stats, {(station, motor_id): [count, first_ts, last_ts]})
+    # 压缩块只在主数据库中
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'motor_blocks'").fetchone():
+        for station, motor_id, count, first_ts, last_ts in conn.execute('''
+            SELECT station, motor_id, SUM(count), MIN(ts), MAX(last_ts) FROM motor_blocks GROUP BY station, motor_id
+        '''):
+            merge_stats(stats, {(station, motor_id): [count, first_ts, last_ts]})
+    return stats
+
+
+def merge_stats(total, stats):
+    """把recount_stats的结果合并进total"""
+    for key, (count, first_ts, last_ts) in stats.items():
+        if key in total:
+            entry = total[key]
+            total[key] = [entry[0] + count, min(entry[1], first_ts), max(entry[2], last_ts)]
+        else:
+            total[key] = [count, first_ts, last_ts]
+
+
+def write_stats(conn, stats):
+    """用recount_stats的结果替换统计表（在调用方的事务中）"""
+    conn.execute('DELETE FROM motor_stats')
+    conn.executemany(UPSERT_STATS_SQL, [
+        (station, motor_id, count, first_ts, last_ts)
+        for (station, motor_id), (count, first_ts, last_ts) in stats.items()
+    ])
+
+
+def choose_rollup_resolution(start_time, end_time, max_points):
+    """
+    按时间范围和点数预算选择数据来源
+
+    返回桶数仍不少于max_points的最粗粒度（秒）；最细的粒度也不足max_points个桶时返回0，表示读取原始数据
+    """
+    if not max_points or max_points <= 0:
+        return 0
+    span = to_epoch_ms(end_time) / 1000 - to_epoch_ms(start_time) / 1000
+    for resolution in reversed(ROLLUP_RESOLUTIONS):
+        if span / resolution >= max_points:
+            return resolution
+    return 0
+
+
+def delete_before(conn, table, key_column, cutoff, batch_rows=10000):
+    """
+    分批删除table中ts早于cutoff（epoch毫秒）的行，生成器，每删除一批返回该批的电机记录数
+    （逐行布局为行数，宽表为各次轮询的电机数之和，与压缩块和分区文件的返回值单位相同）
+
+    表的主键为(key_column, ts)：逐个键值先定位本批最后一行的ts，再删除主键上的一段连续范围，
+    每批一个短事务；调用方可以在批次之间暂停，让写入线程拿到写锁
+    """
+    key = conn.execute(f'SELECT MIN({key_column}) FROM {table}').fetchone()[0]
+    while key is not None:
+        while True:
+            boundary = conn.execute(f'''
+                SELECT ts FROM {table} WHERE {key_column} = ? AND ts < ? ORDER BY ts LIMIT 1 OFFSET ?
+            ''', (key, cutoff, batch_rows - 1)).fetchone()
+            end = boundary[0] + 1 if boundary else cutoff
+            with conn:
+                records = None
+                if table == 'poll_snapshots':
+                    records = conn.execute(f'''
+                        SELECT COALESCE(SUM(motor_count), 0) FROM {table} WHERE {key_column} = ? AND ts < ?
+                    ''', (key, end)).fetchone()[0]
+                deleted = conn.execute(f'DELETE FROM {table} WHERE {key_column} = ? AND ts < ?', (key, end)).rowcount
+                if deleted:
+                    first_ts = conn.execute(f'SELECT MIN(ts) FROM {table} WHERE {key_column} = ?', (key,)).fetchone()[0]
+                    subtract_stats(conn, table, key, deleted, end if first_ts is None else first_ts)
+            if deleted:
+                yield deleted if records is None else records
+            if boundary is None:
+                break
+        key = conn.execute(f'SELECT MIN({key_column}) FROM {table} WHERE {key_column} > ?', (key,)).fetchone()[0]
+
+
+# 每个表按主键第一列分批删除
+RETENTION_TABLES = (('motor_data', 'motor_id'), ('poll_snapshots', 'station'))
+
+
+def delete_blocks_before(conn, cutoff):
+    """删除最后一个采样早于cutoff的压缩块，生成器，每台电机一个短事务，返回删除的采样数"""
+    keys = conn.execute('SELECT DISTINCT station, motor_id FROM motor_blocks').fetchall()
+    for key in keys:
+        with conn:
+            count = conn.execute('''
+                SELECT COALESCE(SUM(count), 0) FROM motor_blocks 
+                WHERE station = ? AND motor_id = ? AND ts < ? AND last_ts < ?
+            ''', key + (cutoff, cutoff)).fetchone()[0]
+            if count:
+                conn.execute('''
+                    DELETE FROM motor_blocks WHERE station = ? AND motor_id = ? AND ts < ? AND last_ts < ?
+                ''', key + (cutoff, cutoff))
+                subtract_stats(conn, 'motor_blocks', key, count, cutoff)
+        if count:
+            yield count
+
+
+def retention_batches(conn, cutoff, batch_rows=10000):
+    """主数据库中早于cutoff的数据的全部删除批次: 先删除过期的压缩块，再分批删除各原始数据表（见delete_before）"""
+    yield from delete_blocks_before(conn, cutoff)
+    for table, key_column in RETENTION_TABLES:
+        yield from delete_before(conn, table, key_column, cutoff, batch_rows)
+
+
+def encode_samples(samples):
+    """一台电机按时间排序的采样（batch_samples的列）编码为压缩块，缺失值按NaN原样保存"""
+    return encode_block(samples[:, 1], samples[:, 2:])
+
+
+def decode_samples(motor_id, data):
+    """压缩块还原为batch_samples列的矩阵"""
+    ts, values = decode_block(data)
+    return np.column_stack([np.full(len(ts), motor_id, dtype=np.float64), ts] + [values[i] for i in range(len(values))])
+
+
+def _iter_block_batch(blocks, motor_id, fields, start_ms, end_ms):
+    """从一批压缩块中取出时间范围内（两端都包含）的采样，逐行返回字典"""
+    columns = [NUMERIC_FIELDS.index(field) for field in fields]
+    for data, in blocks:
+        ts, values = decode_block(data, columns)
+        first, last = np.searchsorted(ts, start_ms, 'left'), np.searchsorted(ts, end_ms, 'right')
+        for row in zip(ts[first:last].tolist(), *[values[column][first:last].tolist() for column in columns]):
+            motor = {'motor_id': motor_id, 'ts': row[0]}
+            motor.update((field, None if value != value else value) for field, value in zip(fields, row[1:]))
+            yield motor
+
+
+def motor_row(motor):
+    """把MotorData对象转换为INSERT_SQL的参数元组"""
+    return (
+        motor.motor_id,
+        to_epoch_ms(motor.last_update if motor.last_update else datetime.now()),
+        motor.phase_a_current,
+        motor.phase_b_current,
+        motor.phase_c_current,
+        motor.frequency,
+        motor.reactive_power,
+        motor.active_power,
+        motor.line_voltage,
+        motor.excitation_voltage,
+        motor.excitation_current,
+        motor.calculated_excitation_current,
+        motor.excitation_current_ratio
+    )
+
+
+class ArchivePartitions:
+    """
+    按时间分区的原始数据文件
+
+    主数据库旁的<主文件名>_partitions目录中每天或每周一个SQLite文件，文件名为分区名（如20240115.db、2024-W03.db），
+    表结构与主数据库的motor_data/poll_snapshots相同；汇总表仍在主数据库中。
+    写入时用ATTACH把分区附加到主数据库的连接上，同一事务写入原始数据和汇总表；过期数据按文件整体删除。
+    """
+
+    def __init__(self, db_path, partition):
+        if partition not in _PARTITION_FORMATS:
+            raise ValueError(f"未知的分区粒度: {partition}")
+        self.partition = partition
+        self.directory = os.path.splitext(db_path)[0] + '_partitions'
+        self._current = (0, 0, None)  # 最近一次命中的分区: (起点, 终点, 分区名)
+
+    def key(self, ts):
+        """epoch毫秒所在分区的名称"""
+        start, end, key = self._current
+        if not start <= ts < end:
+            key = datetime.fromtimestamp(ts / 1000).strftime(_PARTITION_FORMATS[self.partition])
+            self._current = self.period(key) + (key,)
+        return key
+
+    def period(self, key):
+        """分区覆盖的时间范围(起点, 终点)，epoch毫秒，左闭右开"""
+        if self.partition == 'day':
+            start = datetime.strptime(key, '%Y%m%d')
+            end = start + timedelta(days=1)
+        else:
+            start = datetime.strptime(key + '-1', '%G-W%V-%u')
+            end = start + timedelta(weeks=1)
+        return to_epoch_ms(start), to_epoch_ms(end)
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.db')
+
+    def keys(self, start_ms=None, end_ms=None):
+        """与时间范围相交的已有分区，按时间顺序"""
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            return []
+        keys = []
+        for name in names:
+            key, ext = os.path.splitext(name)
+            if ext != '.db':
+                continue
+            try:
+                first, last = self.period(key)
+            except ValueError:
+                continue
+            if (start_ms is None or last > start_ms) and (end_ms is None or first <= end_ms):
+                keys.append(key)
+        return keys
+
+    def group(self, rows):
+        """按ts（每行第二列）所在分区分组"""
+        groups = {}
+        for row in rows:
+            groups.setdefault(self.key(row[1]), []).append(row)
+        return groups
+
+    def attach(self, conn, key):
+        """把分区文件附加到conn上（不存在时先创建），返回附加库名；须在事务之外调用"""
+        path = self.path(key)
+        if not os.path.exists(path):
+            # 先在临时文件中建表再改名，读者不会看到没有表的分区
+            os.makedirs(self.directory, exist_ok=True)
+            part = sqlite3.connect(path + '.tmp')
+            try:
+                part.execute('PRAGMA journal_mode=WAL')
+                part.execute(CREATE_TABLE_SQL.format(table='motor_data'))
+                part.execute(CREATE_SNAPSHOT_TABLE_SQL)
+                part.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+                part.commit()
+            finally:
+                part.close()
+            os.replace(path + '.tmp', path)
+        alias = 'part_' + key.replace('-', '_')
+        conn.execute(f'ATTACH DATABASE ? AS {alias}', (path,))
+        conn.execute(f'PRAGMA {alias}.synchronous=NORMAL')
+        return alias
+
+    def drop(self, key):
+        """
+        删除一个分区文件
+
+        Returns:
+            分区中的数据[(表名, 键, 行数, 原始记录数)]，键为motor_data的电机编号或poll_snapshots的站点，
+            供调用方用subtract_stats扣减统计表
+        """
+        path = self.path(key)
+        with sqlite3.connect(path) as conn:
+            counts = [('motor_data', motor_id, rows, rows) for motor_id, rows in conn.execute(
+                'SELECT motor_id, COUNT(*) FROM motor_data GROUP BY motor_id')]
+            counts += [('poll_snapshots', station, rows, records) for station, rows, records in conn.execute(
+                'SELECT station, COUNT(*), SUM(motor_count) FROM poll_snapshots GROUP BY station')]
+        conn.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        return counts
+
+
 class DatabaseManager:
-    def __init__(self, db_path=None):
-        """初始化数据库管理器"""
+    def __init__(self, db_path=None, layout='row', station='', partition='', block_seconds=0):
+        """
+        初始化数据库管理器
+
+        Args:
+            db_path: 数据库文件路径，默认使用启动脚本目录下的motor_data.db
+            layout: 存储布局，row为每台电机一行，wide为每次轮询一行（读取接口两种布局相同）
+            station: 宽表中的站点标识，多个站点可以写入同一个数据库
+            partition: 原始数据分区粒度，day/week时每天/每周写入一个单独的文件（见ArchivePartitions），
+                       主数据库中未分区时写入的数据仍可读取
+            block_seconds: 大于0时compress_blocks把已经结束的每block_seconds秒的原始数据压缩为块（见blocks.py），
+                           不能与分区同时使用；读取接口始终合并压缩块和原始数据
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f"未知的存储布局: {layout}")
+        if partition not in PARTITIONS:
+            raise ValueError(f"未知的分区粒度: {partition}")
+        if partition and block_seconds:
+            raise ValueError("压缩块不能与按时间分区同时使用")
+        self.layout = layout
+        self.station = station
+        self.block_seconds = block_seconds
+        # 逐行布局的表中没有站点，汇总表和最新值表中的站点为空
+        self.summary_station = station if layout == 'wide' else ''
         if db_path is None:
             # 使用启动程序的目录下的motor_data.db
             # 获取启动脚本的目录
@@ -16,6 +720,7 @@ class DatabaseManager:
             self.db_path = os.path.join(script_dir, "motor_data.db")
         else:
             self.db_path = db_path
+        self.partitions = ArchivePartitions(self.db_path, partition) if partition else None
         
         self.init_database()
     
@@ -66,42 +771,24 @@ class DatabaseManager:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 
-                # 创建电机数据表
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS motor_data (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        motor_id INTEGER NOT NULL,
-                        timestamp DATETIME NOT NULL,
-                        phase_a_current REAL,
-                        phase_b_current REAL,
-                        phase_c_current REAL,
-                        frequency REAL,
-                        reactive_power REAL,
-                        active_power REAL,
-                        line_voltage REAL,
-                        excitation_voltage REAL,
-                        excitation_current REAL,
-                        calculated_excitation_current REAL,
-                        excitation_current_ratio REAL,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                # 创建索引以提高查询性能
-                cursor.execute('''
-                    CREATE INDEX IF NOT EXISTS idx_motor_data_motor_id 
-                    ON motor_data(motor_id)
-                ''')
+                version = get_schema_version(conn)
+                if version == 0:
+                    # 新建的数据库：删除数据后可用PRAGMA incremental_vacuum逐步回收空间（须在建表前设置）
+                    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                if 0 < version < SCHEMA_VERSION:
+                    # 旧版表结构原地升级
+                    from db.migrate import migrate
+                    logger.warning(f"数据库表结构为版本 {version}，开始升级到版本 {SCHEMA_VERSION}: {self.db_path}")
+                    migrate(conn)
                 
-                cursor.execute('''
-                    CREATE INDEX IF NOT EXISTS idx_motor_data_timestamp 
-                    ON motor_data(timestamp)
-                ''')
-                
-                cursor.execute('''
-                    CREATE INDEX IF NOT EXISTS idx_motor_data_motor_timestamp 
-                    ON motor_data(motor_id, timestamp)
-                ''')
+                cursor.execute(CREATE_TABLE_SQL.format(table='motor_data'))
+                cursor.execute(CREATE_SNAPSHOT_TABLE_SQL)
+                cursor.execute(CREATE_ROLLUP_TABLE_SQL)
+                cursor.execute(CREATE_LATEST_TABLE_SQL)
+                cursor.execute(CREATE_STATS_TABLE_SQL)
+                cursor.execute(CREATE_BLOCK_TABLE_SQL)
+                cursor.execute(CREATE_SETTINGS_TABLE_SQL)
+                cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
                 
                 conn.commit()
                 # # logger.info("数据库初始化完成")
@@ -112,215 +799,571 @@ class DatabaseManager:
     
     def save_motor_data(self, motor_data):
         """保存单个电机数据到数据库"""
+        if self.layout == 'wide':
+            self.save_all_motors_data([motor_data])
+            return
+        started = time.perf_counter()
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    INSERT INTO motor_data (
-                        motor_id, timestamp, phase_a_current, phase_b_current, 
-                        phase_c_current, frequency, reactive_power, active_power,
-                        line_voltage, excitation_voltage, excitation_current,
-                        calculated_excitation_current, excitation_current_ratio
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    motor_data.motor_id,
-                    motor_data.last_update.isoformat() if motor_data.last_update else datetime.now().isoformat(),
-                    motor_data.phase_a_current,
-                    motor_data.phase_b_current,
-                    motor_data.phase_c_current,
-                    motor_data.frequency,
-                    motor_data.reactive_power,
-                    motor_data.active_power,
-                    motor_data.line_voltage,
-                    motor_data.excitation_voltage,
-                    motor_data.excitation_current,
-                    motor_data.calculated_excitation_current,
-                    motor_data.excitation_current_ratio
-                ))
-                
-                conn.commit()
-                # logger.info(f"电机 {motor_data.motor_id} 数据已保存到数据库")
+            self._write([motor_row(motor_data)])
+            # logger.info(f"电机 {motor_data.motor_id} 数据已保存到数据库")
+            ROWS_WRITTEN.inc()
+            WRITE_SECONDS.observe(time.perf_counter() - started)
                 
         except Exception as e:
+            WRITE_ERRORS.inc()
             logger.error(f"保存电机 {motor_data.motor_id} 数据失败: {str(e)}")
     
     def save_all_motors_data(self, motors):
         """保存所有电机数据到数据库"""
+        started = time.perf_counter()
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                for motor in motors:
-                    cursor.execute('''
-                        INSERT INTO motor_data (
-                            motor_id, timestamp, phase_a_current, phase_b_current, 
-                            phase_c_current, frequency, reactive_power, active_power,
-                            line_voltage, excitation_voltage, excitation_current,
-                            calculated_excitation_current, excitation_current_ratio
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        motor.motor_id,
-                        motor.last_update.isoformat() if motor.last_update else datetime.now().isoformat(),
-                        motor.phase_a_current,
-                        motor.phase_b_current,
-                        motor.phase_c_current,
-                        motor.frequency,
-                        motor.reactive_power,
-                        motor.active_power,
-                        motor.line_voltage,
-                        motor.excitation_voltage,
-                        motor.excitation_current,
-                        motor.calculated_excitation_current,
-                        motor.excitation_current_ratio
-                    ))
-                
-                conn.commit()
+            if self.layout == 'wide':
+                self._write([snapshot_row(motors, self.station)])
+            else:
+                self._write([motor_row(motor) for motor in motors])
+            ROWS_WRITTEN.inc(1 if self.layout == 'wide' else len(motors))
+            WRITE_SECONDS.observe(time.perf_counter() - started)
                 
         except Exception as e:
+            WRITE_ERRORS.inc()
             logger.error(f"保存所有电机数据失败: {str(e)}")
     
+    def _write(self, rows):
+        """在一个事务中写入原始数据（分区时写入各自的分区文件）并合并进汇总表"""
+        table = 'poll_snapshots' if self.layout == 'wide' else 'motor_data'
+        insert_sql = INSERT_SNAPSHOT_SQL if self.layout == 'wide' else INSERT_SQL
+        with sqlite3.connect(self.db_path) as conn:
+            if self.partitions:
+                groups = [(self.partitions.attach(conn, key), part)
+                          for key, part in self.partitions.group(rows).items()]
+            else:
+                groups = [('main', rows)]
+            for schema, part in groups:
+                conn.executemany(insert_sql.format(table=f'{schema}.{table}'), part)
+            update_summaries(conn, batch_samples(rows, self.layout), self.summary_station)
+            conn.commit()
+        conn.close()
+    
+    def _raw_paths(self, start_time=None, end_time=None):
+        """
+        保存原始数据的文件，按时间顺序
+
+        主数据库（未分区时写入的数据）在前，其后是与时间范围相交的分区文件
+        """
+        paths = [self.db_path]
+        if self.partitions:
+            start_ms = to_epoch_ms(start_time) if start_time is not None else None
+            end_ms = to_epoch_ms(end_time) if end_time is not None else None
+            paths += [self.partitions.path(key) for key in self.partitions.keys(start_ms, end_ms)]
+        return paths
+    
     def get_motor_data(self, motor_id, limit=100):
         """获取指定电机的历史数据"""
+        if self.layout == 'wide':
+            return self._get_snapshot_motor_data(motor_id, limit)
+        rows = []
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                # 设置row_factory以返回字典格式
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT * FROM motor_data 
-                    WHERE motor_id = ? 
-                    ORDER BY timestamp DESC 
-                    LIMIT ?
-                ''', (motor_id, limit))
-                
-                rows = cursor.fetchall()
-                # 转换为字典列表
-                return [dict(row) for row in rows]
+            # 从最新的分区往前读，够limit条即停止
+            for path in reversed(self._raw_paths()):
+                with sqlite3.connect(path) as conn:
+                    # 设置row_factory以返回字典格式
+                    conn.row_factory = sqlite3.Row
+                    cursor = conn.cursor()
+                    
+                    cursor.execute('''
+                        SELECT * FROM motor_data 
+                        WHERE motor_id = ? 
+                        ORDER BY ts DESC 
+                        LIMIT ?
+                    ''', (motor_id, limit - len(rows)))
+                    
+                    # 转换为字典列表
+                    rows += [_row_to_dict(row) for row in cursor.fetchall()]
+                if len(rows) >= limit:
+                    break
+            return _merge_newest(rows, self._get_block_motor_data(motor_id, limit), limit)
                 
         except Exception as e:
             logger.error(f"获取电机 {motor_id} 数据失败: {str(e)}")
             return []
     
     def get_latest_motor_data(self, motor_id):
-        """获取指定电机的最新数据"""
+        """获取指定电机的最新数据（从最新值表读取，与归档大小无关）"""
         try:
             with sqlite3.connect(self.db_path) as conn:
-                # 设置row_factory以返回字典格式
                 conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT * FROM motor_data 
-                    WHERE motor_id = ? 
-                    ORDER BY timestamp DESC 
-                    LIMIT 1
-                ''', (motor_id,))
-                
-                row = cursor.fetchone()
-                if row:
-                    return dict(row)
-                return None
+                row = conn.execute(f'''
+                    SELECT {LATEST_COLUMNS} FROM motor_latest 
+                    WHERE station = ? AND motor_id = ?
+                ''', (self.summary_station, motor_id)).fetchone()
+                return _row_to_dict(row) if row else None
                 
         except Exception as e:
             logger.error(f"获取电机 {motor_id} 最新数据失败: {str(e)}")
             return None
     
-    def get_data_by_time_range(self, motor_id, start_time, end_time):
-        """获取指定时间范围内的电机数据"""
+    def get_all_latest_motor_data(self):
+        """获取所有电机的最新数据，按电机编号排序"""
         try:
             with sqlite3.connect(self.db_path) as conn:
-                # 设置row_factory以返回字典格式
                 conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT * FROM motor_data 
-                    WHERE motor_id = ? AND timestamp BETWEEN ? AND ?
-                    ORDER BY timestamp ASC
-                ''', (motor_id, start_time.isoformat(), end_time.isoformat()))
-                
-                rows = cursor.fetchall()
-                # 转换为字典列表
-                return [dict(row) for row in rows]
+                rows = conn.execute(f'''
+                    SELECT {LATEST_COLUMNS} FROM motor_latest 
+                    WHERE station = ? 
+                    ORDER BY motor_id
+                ''', (self.summary_station,)).fetchall()
+                return [_row_to_dict(row) for row in rows]
                 
         except Exception as e:
-            logger.error(f"获取电机 {motor_id} 时间范围数据失败: {str(e)}")
+            logger.error(f"获取所有电机最新数据失败: {str(e)}")
             return []
     
-    def get_database_stats(self):
-        """获取数据库统计信息"""
+    def _get_snapshot_motor_data(self, motor_id, limit):
+        """宽表中某台电机最近limit次轮询的数据（按时间倒序）"""
+        rows = []
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            for path in reversed(self._raw_paths()):
+                with sqlite3.connect(path) as conn:
+                    cursor = conn.execute('''
+                        SELECT ts, data, motor_count FROM poll_snapshots 
+                        WHERE station = ? 
+                        ORDER BY ts DESC 
+                        LIMIT ?
+                    ''', (self.station, limit - len(rows)))
+                    rows += [_row_to_dict(row) for row in _iter_snapshot_batch(cursor.fetchall(), motor_id, NUMERIC_FIELDS)]
+                if len(rows) >= limit:
+                    break
+            return _merge_newest(rows, self._get_block_motor_data(motor_id, limit), limit)
+        except Exception as e:
+            logger.error(f"获取电机 {motor_id} 数据失败: {str(e)}")
+            return []
+    
+    def _get_block_motor_data(self, motor_id, limit):
+        """压缩块中最新的limit条数据（按时间倒序）"""
+        rows = []
+        if limit <= 0:
+            return rows
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute('''
+                SELECT data FROM motor_blocks WHERE station = ? AND motor_id = ? ORDER BY ts DESC
+            ''', (self.summary_station, motor_id))
+            for data, in cursor:
+                for sample in decode_samples(motor_id, data)[::-1][:limit - len(rows)].tolist():
+                    row = {'motor_id': motor_id, 'ts': int(sample[1])}
+                    row.update((field, None if value != value else value) for field, value in zip(NUMERIC_FIELDS, sample[2:]))
+                    rows.append(_row_to_dict(row))
+                if len(rows) >= limit:
+                    break
+        conn.close()
+        return rows
+    
+    def get_data_by_time_range(self, motor_id, start_time, end_time, max_points=None):
+        """
+        获取指定时间范围内的电机数据
+
+        指定max_points时按范围自动选择汇总粒度（见choose_rollup_resolution），返回每个时间桶一行
+        """
+        started = time.perf_counter()
+        rows = [_row_to_dict(row) for row in self.iter_data_by_time_range(
+            motor_id, start_time, end_time, max_points=max_points)]
+        QUERY_SECONDS.observe(time.perf_counter() - started)
+        return rows
+    
+    def iter_data_by_time_range(self, motor_id, start_time, end_time, batch_size=1000, fields=None,
+                                max_points=None):
+        """
+        分批迭代指定时间范围内的电机数据，内存占用与时间范围大小无关
+
+        start_time/end_time可以是datetime或epoch秒；每行为字典，ts为epoch毫秒，
+        指定fields时只读取这些列；指定max_points时按范围自动从汇总表读取（见iter_rollups_by_time_range）。
+        分区时依次读取范围覆盖的各分区文件
+        """
+        resolution = choose_rollup_resolution(start_time, end_time, max_points)
+        if resolution:
+            yield from self.iter_rollups_by_time_range(motor_id, start_time, end_time, resolution, batch_size, fields)
+            return
+        if self.layout == 'wide':
+            yield from self._iter_snapshots_by_time_range(motor_id, start_time, end_time, batch_size, fields)
+            return
+        columns = ', '.join(['ts'] + [field for field in fields if field in NUMERIC_FIELDS]) if fields else '*'
+        try:
+            yield from _merge_by_ts(self._iter_blocks(motor_id, start_time, end_time, fields),
+                                    self._iter_raw_rows(motor_id, start_time, end_time, batch_size, columns))
+        except Exception as e:
+            logger.error(f"迭代电机 {motor_id} 时间范围数据失败: {str(e)}")
+
+    def _iter_raw_rows(self, motor_id, start_time, end_time, batch_size, columns):
+        """逐行布局中时间范围内的原始数据（不含压缩块），按ts升序"""
+        for path in self._raw_paths(start_time, end_time):
+            with sqlite3.connect(path) as conn:
+                conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 
-                # 获取总记录数
-                cursor.execute('SELECT COUNT(*) FROM motor_data')
-                total_records = cursor.fetchone()[0]
-                
-                # 获取电机数量
-                cursor.execute('SELECT COUNT(DISTINCT motor_id) FROM motor_data')
-                motor_count = cursor.fetchone()[0]
+                cursor.execute(f'''
+                    SELECT {columns} FROM motor_data 
+                    WHERE motor_id = ? AND ts BETWEEN ? AND ?
+                    ORDER BY ts ASC
+                ''', (motor_id, to_epoch_ms(start_time), to_epoch_ms(end_time)))
                 
-                # 获取数据时间范围
-                cursor.execute('SELECT MIN(timestamp), MAX(timestamp) FROM motor_data')
-                time_range = cursor.fetchone()
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield dict(row)
+    
+    def _iter_snapshots_by_time_range(self, motor_id, start_time, end_time, batch_size, fields):
+        """从宽表分批读取时间范围内的轮询，逐行取出指定电机"""
+        fields = [field for field in fields if field in NUMERIC_FIELDS] if fields else NUMERIC_FIELDS
+        try:
+            yield from _merge_by_ts(self._iter_blocks(motor_id, start_time, end_time, fields),
+                                    self._iter_raw_snapshots(motor_id, start_time, end_time, batch_size, fields))
+        except Exception as e:
+            logger.error(f"迭代电机 {motor_id} 时间范围数据失败: {str(e)}")
+
+    def _iter_raw_snapshots(self, motor_id, start_time, end_time, batch_size, fields):
+        """宽表中时间范围内指定电机的原始数据（不含压缩块），按ts升序"""
+        for path in self._raw_paths(start_time, end_time):
+            with sqlite3.connect(path) as conn:
+                cursor = conn.execute('''
+                    SELECT ts, data, motor_count FROM poll_snapshots 
+                    WHERE station = ? AND ts BETWEEN ? AND ?
+                    ORDER BY ts ASC
+                ''', (self.station, to_epoch_ms(start_time), to_epoch_ms(end_time)))
                 
-                # 获取数据库文件大小
-                file_size = os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from _iter_snapshot_batch(rows, motor_id, fields)
+
+    def _iter_blocks(self, motor_id, start_time, end_time, fields):
+        """压缩块中时间范围内的采样，逐行返回字典，按ts升序"""
+        fields = [field for field in fields if field in NUMERIC_FIELDS] if fields else NUMERIC_FIELDS
+        start_ms, end_ms = to_epoch_ms(start_time), to_epoch_ms(end_time)
+        with sqlite3.connect(self.db_path) as conn:
+            # 从范围起点所在的块开始（块的ts为块内第一个采样的时间）
+            first = conn.execute('''
+                SELECT MAX(ts) FROM motor_blocks WHERE station = ? AND motor_id = ? AND ts <= ?
+            ''', (self.summary_station, motor_id, start_ms)).fetchone()[0]
+            cursor = conn.execute('''
+                SELECT data FROM motor_blocks 
+                WHERE station = ? AND motor_id = ? AND ts BETWEEN ? AND ? 
+                ORDER BY ts ASC
+            ''', (self.summary_station, motor_id, start_ms if first is None else first, end_ms))
+            while True:
+                blocks = cursor.fetchmany(16)
+                if not blocks:
+                    break
+                yield from _iter_block_batch(blocks, motor_id, fields, start_ms, end_ms)
+        conn.close()
+
+    def get_samples(self, start_time, end_time):
+        """
+        时间范围内（左闭右开）所有电机的原始采样，不逐行构造字典
+
+        Returns:
+            float64矩阵，列同batch_samples（motor_id, ts, 数值字段），按电机、时间排序；
+            内存占用与范围内的数据量成正比，大范围请分段（如按天）读取。失败时抛出异常
+        """
+        start_ms, end_ms = to_epoch_ms(start_time), to_epoch_ms(end_time)
+        parts = []
+        with sqlite3.connect(self.db_path) as conn:
+            for motor_id, data in conn.execute('''
+                SELECT motor_id, data FROM motor_blocks WHERE station = ? AND ts < ? AND last_ts >= ?
+            ''', (self.summary_station, end_ms, start_ms)):
+                samples = decode_samples(motor_id, data)
+                parts.append(samples[(samples[:, 1] >= start_ms) & (samples[:, 1] < end_ms)])
+        conn.close()
+        for path in self._raw_paths(start_time, end_time):
+            with sqlite3.connect(path) as conn:
+                if self.layout == 'wide':
+                    rows = conn.execute('''
+                        SELECT station, ts, motor_count, data FROM poll_snapshots
+                        WHERE station = ? AND ts >= ? AND ts < ?
+                    ''', (self.station, start_ms, end_ms)).fetchall()
+                    parts.append(batch_samples(rows, 'wide'))
+                else:
+                    # 主键为(motor_id, ts)：逐台电机读取主键上的一段连续范围，不扫描整表
+                    motor_id = conn.execute('SELECT MIN(motor_id) FROM motor_data').fetchone()[0]
+                    while motor_id is not None:
+                        rows = conn.execute(f'''
+                            SELECT {LATEST_COLUMNS} FROM motor_data
+                            WHERE motor_id = ? AND ts >= ? AND ts < ?
+                        ''', (motor_id, start_ms, end_ms)).fetchall()
+                        parts.append(batch_samples(rows))
+                        motor_id = conn.execute('SELECT MIN(motor_id) FROM motor_data WHERE motor_id > ?',
+                                                (motor_id,)).fetchone()[0]
+            conn.close()
+        samples = np.concatenate(parts) if parts else np.empty((0, 2 + len(NUMERIC_FIELDS)))
+        return samples[np.lexsort((samples[:, 1], samples[:, 0]))]
+
+    def get_compression(self):
+        """写入端记录的死区/旋转门压缩设置（CompressionSpec），没有开启过压缩时返回None"""
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute('''
+                SELECT value FROM archive_settings WHERE station = ? AND name = 'compression'
+            ''', (self.summary_station,)).fetchone()
+        conn.close()
+        return CompressionSpec.from_json(row[0], NUMERIC_FIELDS) if row else None
+
+    def iter_interpolated(self, motor_id, start_time, end_time, interval=None, fields=None, batch_size=1000):
+        """
+        按固定间隔插值重建时间范围内的采样（见deadband.py）
+
+        死区/旋转门压缩后归档中只有部分采样: 旋转门字段在相邻两个保存的采样之间线性插值，其余字段取前一个保存的值；
+        相邻两个保存的采样相隔超过max_interval时视为采集中断，其间不输出。没有开启过压缩时按原始采样取前一个值。
+        interval为重建间隔（秒），默认为写入时的采集间隔；每行为字典，ts为epoch毫秒，时刻为start_time + k * interval
+        """
+        spec = self.get_compression() or CompressionSpec(NUMERIC_FIELDS)
+        fields = [field for field in fields if field in NUMERIC_FIELDS] if fields else list(NUMERIC_FIELDS)
+        step = max(1, int(round((interval or spec.interval) * 1000)))
+        start_ms, end_ms = to_epoch_ms(start_time), to_epoch_ms(end_time)
+        linear = spec.linear_mask(fields)
+        # 多读一个最长保存间隔，范围起点之前和终点之后各至少有一个保存的采样
+        rows = self.iter_data_by_time_range(motor_id, (start_ms - spec.max_interval_ms) / 1000,
+                                            (end_ms + spec.max_interval_ms) / 1000, batch_size, fields)
+        ts, values = np.empty(0, dtype=np.int64), np.empty((0, len(fields)))
+        grid_start = start_ms
+        try:
+            while grid_start <= end_ms:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                # 上一批的最后一个采样作为这一批的起点
+                ts = np.concatenate((ts[-1:], [row['ts'] for row in batch]))
+                values = np.concatenate((values[-1:], np.array(
+                    [[row[field] for field in fields] for row in batch], dtype=np.float64).reshape(-1, len(fields))))
+                grid = np.arange(grid_start, min(ts[-1], end_ms) + 1, step, dtype=np.int64)
+                if not len(grid):
+                    continue
+                grid_start = int(grid[-1]) + step
+                valid, result = interpolate(ts, values, grid, linear, spec.max_interval_ms)
+                for point, row in zip(grid[valid].tolist(), result[valid].tolist()):
+                    motor = {'motor_id': motor_id, 'ts': point}
+                    motor.update((field, None if value != value else value) for field, value in zip(fields, row))
+                    yield motor
+        finally:
+            rows.close()
+
+    def iter_rollups_by_time_range(self, motor_id, start_time, end_time, resolution, batch_size=1000, fields=None):
+        """
+        分批迭代汇总表中与时间范围相交的时间桶
+
+        每行为字典: ts为桶起点(epoch毫秒)，count为桶内采样数，每个字段给出均值（字段名本身）
+        以及<字段>_min、<字段>_max、<字段>_last；首尾两个桶可能包含范围外的采样
+        """
+        fields = [field for field in fields if field in NUMERIC_FIELDS] if fields else NUMERIC_FIELDS
+        width = resolution * 1000
+        start_ms = to_epoch_ms(start_time)
+        columns = ', '.join(['bucket AS ts', 'count'] + [
+            f'{field}_sum / {field}_count AS {field}, {field}_min, {field}_max, {field}_last' for field in fields
+        ])
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.execute(f'''
+                    SELECT {columns} FROM motor_rollups 
+                    WHERE station = ? AND resolution = ? AND motor_id = ? AND bucket BETWEEN ? AND ?
+                    ORDER BY bucket ASC
+                ''', (self.summary_station, resolution, motor_id, start_ms - start_ms % width, to_epoch_ms(end_time)))
                 
-                # 获取每个电机的记录数
-                cursor.execute('''
-                    SELECT motor_id, COUNT(*) as record_count 
-                    FROM motor_data 
-                    GROUP BY motor_id 
-                    ORDER BY motor_id
-                ''')
-                motor_records = cursor.fetchall()
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield dict(row)
                 
-                return {
-                    'total_records': total_records,
-                    'motor_count': motor_count,
-                    'time_range': time_range,
-                    'file_size_bytes': file_size,
-                    'file_size_mb': round(file_size / (1024 * 1024), 2),
-                    'motor_records': motor_records,
-                    'avg_record_size_bytes': round(file_size / total_records, 2) if total_records > 0 else 0
-                }
+        except Exception as e:
+            logger.error(f"迭代电机 {motor_id} 汇总数据失败: {str(e)}")
+    
+    def get_database_stats(self, exact=False):
+        """
+        获取数据库统计信息（分区时汇总主数据库和所有分区文件）
+
+        默认读取写入时维护的motor_stats表，与数据量无关；exact=True时全表扫描重新统计所有原始数据，
+        并用结果替换motor_stats（校正覆盖写入造成的重复计数、升级前的分区数据等）
+        """
+        try:
+            paths = self._raw_paths()
+            if exact:
+                stats = {}
+                for path in paths:
+                    with sqlite3.connect(path) as conn:
+                        merge_stats(stats, recount_stats(conn))
+                    conn.close()
+                with sqlite3.connect(self.db_path) as conn:
+                    write_stats(conn, stats)
+                conn.close()
+                per_motor = sorted((motor_id, entry) for (station, motor_id), entry in stats.items()
+                                   if station == self.summary_station)
+            else:
+                with sqlite3.connect(self.db_path) as conn:
+                    per_motor = [(motor_id, entry) for motor_id, *entry in conn.execute('''
+                        SELECT motor_id, record_count, first_ts, last_ts 
+                        FROM motor_stats WHERE station = ? ORDER BY motor_id
+                    ''', (self.summary_station,))]
+                conn.close()
+            
+            motor_records = [(motor_id, count) for motor_id, (count, _, _) in per_motor]
+            total_records = sum(count for _, count in motor_records)
+            first_ts = min((entry[1] for _, entry in per_motor), default=None)
+            last_ts = max((entry[2] for _, entry in per_motor), default=None)
+            time_range = tuple(from_epoch_ms(ts) if ts is not None else None for ts in (first_ts, last_ts))
+            
+            # 获取数据库文件大小
+            file_size = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+            
+            return {
+                'total_records': total_records,
+                'motor_count': len(motor_records),
+                'time_range': time_range,
+                'file_size_bytes': file_size,
+                'file_size_mb': round(file_size / (1024 * 1024), 2),
+                'motor_records': motor_records,
+                'partitions': len(paths) - 1,
+                'avg_record_size_bytes': round(file_size / total_records, 2) if total_records > 0 else 0
+            }
                 
         except Exception as e:
             logger.error(f"获取数据库统计信息失败: {str(e)}")
             return {}
     
-    def cleanup_old_data(self, days_to_keep=90):
-        """清理指定天数之前的数据"""
+    def cleanup_old_data(self, days_to_keep=90, batch_rows=10000):
+        """
+        清理指定天数之前的数据
+
+        主数据库中按batch_rows行一批分多个短事务删除（见delete_before），写入线程最多等待一批；
+        分区时整个早于截止时间的分区文件直接删除，不执行DELETE，也不需要VACUUM。
+        需要在批次之间暂停或回收空间时使用后台的RetentionTask
+
+        Returns:
+            删除的电机记录数（每台电机每个采样一条，与布局、分区和压缩块无关）
+        """
         try:
+            # 计算截止日期
+            cutoff = to_epoch_ms(datetime.now() - timedelta(days=days_to_keep))
+            deleted_count = 0
+            
+            if self.partitions:
+                for key in self.partitions.keys():
+                    if self.partitions.period(key)[1] <= cutoff:
+                        deleted_count += self.drop_partition(key)
+            
             with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # 计算截止日期
-                from datetime import timedelta
-                cutoff_date = (datetime.now() - timedelta(days=days_to_keep)).isoformat()
-                
-                # 删除旧数据
-                cursor.execute('''
-                    DELETE FROM motor_data 
-                    WHERE timestamp < ?
-                ''', (cutoff_date,))
-                
-                deleted_count = cursor.rowcount
-                conn.commit()
-                
-                # logger.info(f"清理了 {deleted_count} 条旧数据（保留最近 {days_to_keep} 天）")
-                return deleted_count
+                # 删除旧数据（含压缩块）；汇总表体积很小，不随原始数据清理，超出保留期的长期趋势仍可查询
+                deleted_count += sum(retention_batches(conn, cutoff, batch_rows))
+            conn.close()
+            
+            # logger.info(f"清理了 {deleted_count} 条旧数据（保留最近 {days_to_keep} 天）")
+            return deleted_count
                 
         except Exception as e:
             logger.error(f"清理旧数据失败: {str(e)}")
             return 0
     
+    def drop_partition(self, key):
+        """删除一个分区文件并从统计表中扣减其中的数据，返回删除的原始记录数"""
+        counts = self.partitions.drop(key)
+        end = self.partitions.period(key)[1]
+        with sqlite3.connect(self.db_path) as conn:
+            # 分区之后的数据从下一个分区开始，以分区终点作为剩余数据最早时间的下界
+            for table, key_value, rows, _ in counts:
+                subtract_stats(conn, table, key_value, rows, end)
+        conn.close()
+        return sum(records for _, _, _, records in counts)
+    
+    def iter_compress_blocks(self, before=None):
+        """
+        把已经结束的时间块中的原始数据压缩进motor_blocks，生成器，每压缩一个时间块返回其中的采样数
+
+        时间块按block_seconds对齐（UTC），只处理早于before（默认当前时间）所在块的块。每个时间块一个写事务：
+        读取原始数据，与该块已有的压缩块合并（同一时刻以原始数据为准），写入新的压缩块后删除原始数据；
+        统计表、汇总表和最新值表不变
+        """
+        if not self.block_seconds:
+            return
+        block_ms = self.block_seconds * 1000
+        limit = to_epoch_ms(before if before is not None else datetime.now()) // block_ms * block_ms
+        if self.layout == 'wide':
+            table, key_column = 'poll_snapshots', 'station'
+            select_sql = '''
+                SELECT station, ts, motor_count, data FROM poll_snapshots WHERE station = ? AND ts >= ? AND ts < ?
+            '''
+        else:
+            table, key_column = 'motor_data', 'motor_id'
+            select_sql = f'SELECT {LATEST_COLUMNS} FROM motor_data WHERE motor_id = ? AND ts >= ? AND ts < ?'
+        conn = sqlite3.connect(self.db_path, isolation_level=None)  # 手动管理事务，读取和删除在同一个写事务中
+        try:
+            if self.layout == 'wide':
+                keys = [self.station]
+            else:
+                # 逐个跳到下一台电机，不扫描整表
+                keys = []
+                motor_id = conn.execute('SELECT MIN(motor_id) FROM motor_data').fetchone()[0]
+                while motor_id is not None:
+                    keys.append(motor_id)
+                    motor_id = conn.execute('SELECT MIN(motor_id) FROM motor_data WHERE motor_id > ?',
+                                            (motor_id,)).fetchone()[0]
+            for key in keys:
+                ts = conn.execute(f'SELECT MIN(ts) FROM {table} WHERE {key_column} = ? AND ts < ?',
+                                  (key, limit)).fetchone()[0]
+                while ts is not None:
+                    start = ts // block_ms * block_ms
+                    end = start + block_ms
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        samples = batch_samples(conn.execute(select_sql, (key, start, end)).fetchall(), self.layout)
+                        self._merge_blocks(conn, samples, start, end)
+                        conn.execute(f'DELETE FROM {table} WHERE {key_column} = ? AND ts >= ? AND ts < ?',
+                                     (key, start, end))
+                        conn.execute('COMMIT')
+                    except Exception:
+                        conn.execute('ROLLBACK')
+                        raise
+                    yield len(samples)
+                    ts = conn.execute(f'SELECT MIN(ts) FROM {table} WHERE {key_column} = ? AND ts >= ? AND ts < ?',
+                                      (key, end, limit)).fetchone()[0]
+        finally:
+            conn.close()
+    
+    def _merge_blocks(self, conn, samples, start, end):
+        """把一个时间块的采样按电机写入压缩块，与该时间块已有的压缩块合并"""
+        samples = samples[np.lexsort((samples[:, 1], samples[:, 0]))]
+        motor_ids = samples[:, 0].astype(np.int64)
+        starts = np.flatnonzero(np.concatenate(([True], motor_ids[1:] != motor_ids[:-1]))) if len(samples) else []
+        for first, last in zip(starts, np.append(starts[1:], len(samples))):
+            motor_id = int(motor_ids[first])
+            key = (self.summary_station, motor_id, start, end)
+            parts = [decode_samples(motor_id, data) for data, in conn.execute('''
+                SELECT data FROM motor_blocks WHERE station = ? AND motor_id = ? AND ts >= ? AND ts < ?
+            ''', key)]
+            merged = np.concatenate(parts + [samples[first:last]])
+            if parts:
+                # 稳定排序后同一时刻的最后一个（原始数据）保留
+                merged = merged[np.argsort(merged[:, 1], kind='stable')]
+                merged = merged[np.append(merged[1:, 1] != merged[:-1, 1], True)]
+                conn.execute('DELETE FROM motor_blocks WHERE station = ? AND motor_id = ? AND ts >= ? AND ts < ?', key)
+            conn.execute('''
+                INSERT INTO motor_blocks (station, motor_id, ts, last_ts, count, data) VALUES (?, ?, ?, ?, ?, ?)
+            ''', (self.summary_station, motor_id, int(merged[0, 1]), int(merged[-1, 1]), len(merged),
+                  encode_samples(merged)))
+    
+    def compress_blocks(self, before=None):
+        """压缩全部已经结束的时间块（见iter_compress_blocks），返回压缩的采样数"""
+        try:
+            return sum(self.iter_compress_blocks(before))
+        except Exception as e:
+            logger.error(f"压缩原始数据失败: {str(e)}")
+            return 0
+    
     def optimize_database(self):
-        """优化数据库（压缩和重建索引）"""
+        """
+        优化数据库（压缩和重建索引）
+
+        分区时只处理主数据库（汇总表和分区前的数据），分区文件只追加写入、按文件删除，不需要压缩
+        """
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
@@ -328,7 +1371,8 @@ class DatabaseManager:
                 # 获取优化前的文件大小
                 size_before = os.path.getsize(self.db_path)
                 
-                # 执行VACUUM命令压缩数据库
+                # 执行VACUUM命令压缩数据库，同时把旧数据库转换为增量回收模式
+                cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
                 cursor.execute('VACUUM')
                 
                 # 重新分析表统计信息
@@ -4,6 +4,16 @@ import sys
 from datetime import datetime
 import argparse
 
+def ts_sql(expr='ts'):
+    """motor_data.ts为epoch毫秒，显示时在SQL中转换为本地时间"""
+    return f"strftime('%Y-%m-%d %H:%M:%f', {expr} / 1000.0, 'unixepoch', 'localtime')"
+
+def format_values(row):
+    """数值列（最后一列为励磁电流比值）格式化为显示文本，缺失值（NULL）显示为-"""
+    cells = ['-' if value is None else f"{value:.2f}" for value in row[:-1]]
+    cells.append('-' if row[-1] is None else f"{row[-1]*100:.2f}%")
+    return ' | '.join(cells)
+
 def get_script_directory():
     """获取启动脚本的目录"""
     try:
@@ -50,11 +60,15 @@ def get_default_db_path():
     script_dir = get_script_directory()
     return os.path.join(script_dir, "motor_data.db")
 
-def view_database_stats(db_path=None):
-    """查看数据库统计信息"""
+def view_database_stats(db_path=None, exact=False):
+    """查看数据库统计信息（默认读取写入时维护的统计表，exact=True时全表扫描主数据库）"""
     if db_path is None:
         db_path = get_default_db_path()
     
+    if not exact:
+        view_maintained_stats(db_path)
+        return
+    
     try:
         with sqlite3.connect(db_path) as conn:
             cursor = conn.cursor()
@@ -68,7 +82,7 @@ def view_database_stats(db_path=None):
             motor_count = cursor.fetchone()[0]
             
             # 获取数据时间范围
-            cursor.execute('SELECT MIN(timestamp), MAX(timestamp) FROM motor_data')
+            cursor.execute(f"SELECT {ts_sql('MIN(ts)')}, {ts_sql('MAX(ts)')} FROM motor_data")
             time_range = cursor.fetchone()
             
             print("=== 数据库统计信息 ===")
@@ -77,6 +91,39 @@ def view_database_stats(db_path=None):
             print(f"电机数量: {motor_count}")
             if time_range[0] and time_range[1]:
                 print(f"数据时间范围: {time_range[0]} 到 {time_range[1]}")
+            
+            # 宽表布局（每次轮询一行）
+            cursor.execute(f"SELECT station, COUNT(*), {ts_sql('MIN(ts)')}, {ts_sql('MAX(ts)')} FROM poll_snapshots GROUP BY station")
+            for station, polls, first, last in cursor.fetchall():
+                print(f"宽表站点 '{station}': {polls} 次轮询，{first} 到 {last}")
+            print("=====================")
+            
+    except Exception as e:
+        print(f"查看数据库统计信息失败: {str(e)}")
+
+def view_maintained_stats(db_path):
+    """从motor_stats表读取统计信息，与数据量无关；覆盖写入的重复计数在 --exact 重新统计后校正"""
+    try:
+        with sqlite3.connect(db_path) as conn:
+            cursor = conn.cursor()
+            
+            # 每个站点一行，逐行布局的站点为空字符串
+            cursor.execute(f'''
+                SELECT station, SUM(record_count), COUNT(*), {ts_sql('MIN(first_ts)')}, {ts_sql('MAX(last_ts)')}
+                FROM motor_stats GROUP BY station
+            ''')
+            stations = cursor.fetchall()
+            
+            print("=== 数据库统计信息 ===")
+            print(f"数据库路径: {db_path}")
+            if not stations:
+                print("总记录数: 0")
+            for station, total_records, motor_count, first, last in stations:
+                if station:
+                    print(f"宽表站点 '{station}':")
+                print(f"总记录数: {total_records}")
+                print(f"电机数量: {motor_count}")
+                print(f"数据时间范围: {first} 到 {last}")
             print("=====================")
             
     except Exception as e:
@@ -91,14 +138,14 @@ def view_motor_data(motor_id, limit=10, db_path=None):
         with sqlite3.connect(db_path) as conn:
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT motor_id, timestamp, phase_a_current, phase_b_current, 
+            cursor.execute(f'''
+                SELECT motor_id, {ts_sql()}, phase_a_current, phase_b_current,
                        phase_c_current, frequency, reactive_power, active_power,
                        line_voltage, excitation_voltage, excitation_current,
                        calculated_excitation_current, excitation_current_ratio
                 FROM motor_data 
                 WHERE motor_id = ? 
-                ORDER BY timestamp DESC 
+                ORDER BY ts DESC 
                 LIMIT ?
             ''', (motor_id, limit))
             
@@ -113,7 +160,7 @@ def view_motor_data(motor_id, limit=10, db_path=None):
             print("-" * 150)
             
             for row in rows:
-                print(f"{row[1]} | {row[2]:.2f} | {row[3]:.2f} | {row[4]:.2f} | {row[5]:.2f} | {row[6]:.2f} | {row[7]:.2f} | {row[8]:.2f} | {row[9]:.2f} | {row[10]:.2f} | {row[11]:.2f} | {row[12]*100:.2f}%")
+                print(f"{row[1]} | {format_values(row[2:])}")
             
             print("=" * 150)
             
@@ -129,19 +176,14 @@ def view_all_motors_latest(db_path=None):
         with sqlite3.connect(db_path) as conn:
             cursor = conn.cursor()
             
-            # 获取所有电机的最新数据
-            cursor.execute('''
-                SELECT motor_id, timestamp, phase_a_current, phase_b_current, 
+            # 获取所有电机的最新数据（最新值表每台电机一行，宽表布局按站点分别保存）
+            cursor.execute(f'''
+                SELECT motor_id, {ts_sql()}, phase_a_current, phase_b_current,
                        phase_c_current, frequency, reactive_power, active_power,
                        line_voltage, excitation_voltage, excitation_current,
                        calculated_excitation_current, excitation_current_ratio
-                FROM motor_data m1
-                WHERE timestamp = (
-                    SELECT MAX(timestamp) 
-                    FROM motor_data m2 
-                    WHERE m2.motor_id = m1.motor_id
-                )
-                ORDER BY motor_id
+                FROM motor_latest
+                ORDER BY station, motor_id
             ''')
             
             rows = cursor.fetchall()
@@ -155,7 +197,7 @@ def view_all_motors_latest(db_path=None):
             print("-" * 160)
             
             for row in rows:
-                print(f"{row[0]} | {row[1]} | {row[2]:.2f} | {row[3]:.2f} | {row[4]:.2f} | {row[5]:.2f} | {row[6]:.2f} | {row[7]:.2f} | {row[8]:.2f} | {row[9]:.2f} | {row[10]:.2f} | {row[11]:.2f} | {row[12]*100:.2f}%")
+                print(f"{row[0]} | {row[1]} | {format_values(row[2:])}")
             
             print("=" * 160)
             
@@ -163,7 +205,11 @@ def view_all_motors_latest(db_path=None):
         print(f"查看所有电机最新数据失败: {str(e)}")
 
 def export_data_to_csv(motor_id, output_file, db_path=None):
-    """导出指定电机的数据到CSV文件"""
+    """
+    导出指定电机的数据到CSV文件（主数据库中逐行布局的数据，分批读取）
+
+    按时间范围、全部电机并行、NDJSON或gzip导出以及宽表和分区数据见export.py
+    """
     if db_path is None:
         db_path = get_default_db_path()
     
@@ -173,23 +219,24 @@ def export_data_to_csv(motor_id, output_file, db_path=None):
         with sqlite3.connect(db_path) as conn:
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT motor_id, timestamp, phase_a_current, phase_b_current, 
+            cursor.execute(f'''
+                SELECT motor_id, {ts_sql()}, phase_a_current, phase_b_current,
                        phase_c_current, frequency, reactive_power, active_power,
                        line_voltage, excitation_voltage, excitation_current,
                        calculated_excitation_current, excitation_current_ratio
                 FROM motor_data 
                 WHERE motor_id = ? 
-                ORDER BY timestamp ASC
+                ORDER BY ts ASC
             ''', (motor_id,))
             
-            rows = cursor.fetchall()
+            rows = cursor.fetchmany(5000)
             
             if not rows:
                 print(f"电机 {motor_id} 没有数据可导出")
                 return
             
-            with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
+            count = 0
+            with open(output_file, 'w', newline='', encoding='utf-8', buffering=1 << 20) as csvfile:
                 writer = csv.writer(csvfile)
                 
                 # 写入表头
@@ -199,15 +246,17 @@ def export_data_to_csv(motor_id, output_file, db_path=None):
                     '励磁电流', '计算励磁电流', '励磁电流比值'
                 ])
                 
-                # 写入数据
-                for row in rows:
-                    writer.writerow([
+                # 分批写入数据，内存占用与记录数无关
+                while rows:
+                    writer.writerows([
                         row[0], row[1], row[2], row[3], row[4], row[5], 
                         row[6], row[7], row[8], row[9], row[10], row[11], 
-                        f"{row[12]*100:.2f}%"
-                    ])
+                        '' if row[12] is None else f"{row[12]*100:.2f}%"
+                    ] for row in rows)
+                    count += len(rows)
+                    rows = cursor.fetchmany(5000)
             
-            print(f"电机 {motor_id} 的数据已导出到 {output_file}，共 {len(rows)} 条记录")
+            print(f"电机 {motor_id} 的数据已导出到 {output_file}，共 {count} 条记录")
             
     except Exception as e:
         print(f"导出数据失败: {str(e)}")
@@ -216,6 +265,7 @@ def main():
     parser = argparse.ArgumentParser(description='电机数据数据库查看工具')
     parser.add_argument('--db', help='数据库文件路径（默认使用启动脚本目录下的motor_data.db）')
     parser.add_argument('--stats', action='store_true', help='查看数据库统计信息')
+    parser.add_argument('--exact', action='store_true', help='统计信息改为全表扫描重新计数（数据量大时较慢）')
     parser.add_argument('--motor', type=int, help='查看指定电机的数据')
     parser.add_argument('--limit', type=int, default=10, help='显示记录数量限制')
     parser.add_argument('--all', action='store_true', help='查看所有电机的最新数据')
@@ -234,8 +284,13 @@ def main():
         print(f"数据库文件 {db_path} 不存在")
         return
     
+    with sqlite3.connect(db_path) as conn:
+        if conn.execute('PRAGMA user_version').fetchone()[0] < 7:
+            print(f"数据库为旧版表结构，请先升级: python migrate.py --db {db_path}")
+            return
+    
     if args.stats:
-        view_database_stats(db_path)
+        view_database_stats(db_path, args.exact)
     elif args.motor:
         view_motor_data(args.motor, args.limit, db_path)
     elif args.all:
@@ -0,0 +1,230 @@
+"""
+写入前的死区/旋转门压缩，以及读取时的插值重建
+
+每个字段可以单独配置压缩方法和容差:
+    - deadband: 绝对死区，与上一个保存的值相差超过容差时才保存
+    - percent: 百分比死区，容差为上一个保存的值的绝对值的百分之几
+    - swinging_door: 旋转门，只要从上一个保存的采样到当前采样的直线与其间每个采样的偏差都不超过容差，中间的采样就不保存
+
+一个采样（一行）只要有一个字段需要保存就整行保存，保存的行是所有字段的新起点。读取时按字段插值:
+旋转门字段在相邻两个保存的采样之间线性插值，死区字段取前一个保存的值，重建值与原始采样的偏差不超过容差
+（百分比死区为保存时的容差）。
+
+与常见的旋转门实现不同，这里检查的是"上一个保存的点到候选点的直线"是否落在所有中间采样的容差内
+（中间采样的可行斜率区间的交集），而不是只看两扇门是否张开，因此保存的点都是原始采样，误差界严格成立。
+
+另外距上一次保存超过max_interval秒时强制保存，读取时相邻两个保存的采样相隔超过max_interval视为采集中断。
+"""
+
+import copy
+import json
+
+import numpy as np
+
+METHODS = ('deadband', 'percent', 'swinging_door')
+
+# 没有配置的字段: 值变化就保存（取前一个值重建时没有误差）
+DEFAULT_SETTING = {'method': 'deadband', 'tolerance': 0}
+
+
+class CompressionSpec:
+    """各字段的压缩方法和容差"""
+
+    def __init__(self, fields, settings=None, default=None, max_interval=60, interval=1):
+        """
+        Args:
+            fields: 字段名，顺序与写入的数值列相同
+            settings: {字段: {'method': METHODS之一, 'tolerance': 容差}}，百分比死区的容差单位为%
+            default: 没有在settings中的字段的设置，默认值变化就保存
+            max_interval: 两次保存之间的最长间隔（秒）
+            interval: 采集间隔（秒），读取时默认按该间隔重建
+        """
+        if max_interval <= 0:
+            raise ValueError("max_interval必须大于0")
+        self.fields = tuple(fields)
+        self.settings = {}
+        for field in self.fields:
+            setting = dict((settings or {}).get(field) or default or DEFAULT_SETTING)
+            if setting.get('method') not in METHODS:
+                raise ValueError(f"字段 {field} 的压缩方法未知: {setting.get('method')}")
+            if setting.get('tolerance', 0) < 0:
+                raise ValueError(f"字段 {field} 的容差不能为负数")
+            self.settings[field] = setting
+        self.max_interval = max_interval
+        self.interval = interval
+        methods = np.array([self.settings[field]['method'] for field in self.fields])
+        tolerance = np.array([self.settings[field].get('tolerance', 0) for field in self.fields], dtype=np.float64)
+        self.linear = methods == 'swinging_door'
+        self.percent = methods == 'percent'
+        self.tolerance = np.where(self.percent, tolerance / 100, tolerance)
+        self.max_interval_ms = int(max_interval * 1000)
+
+    @classmethod
+    def from_config(cls, config, fields, interval=1):
+        """由config.json中database.compression节创建，enabled为0时返回None"""
+        if not config or not config.get('enabled', 0):
+            return None
+        return cls(fields, config.get('fields'), config.get('default'), config.get('max_interval_s', 60), interval)
+
+    def to_json(self):
+        return json.dumps({
+            'fields': self.settings, 'max_interval': self.max_interval, 'interval': self.interval
+        }, ensure_ascii=False, sort_keys=True)
+
+    @classmethod
+    def from_json(cls, text, fields):
+        data = json.loads(text)
+        return cls(fields, data['fields'], None, data['max_interval'], data['interval'])
+
+    def linear_mask(self, fields):
+        """读取fields时哪些字段线性插值"""
+        return np.array([self.settings[field]['method'] == 'swinging_door' for field in fields], dtype=bool)
+
+
+class _Segment:
+    """一个序列（一台电机或一个站点）从上一个保存的采样开始的压缩状态"""
+
+    __slots__ = ('ts', 'values', 'nan', 'tolerance', 'low', 'high', 'pending_ts', 'pending', 'pending_row')
+
+    def __init__(self, spec, ts, values):
+        self.restart(spec, ts, values)
+
+    def restart(self, spec, ts, values):
+        """以刚保存的采样为新起点"""
+        self.ts = ts
+        self.nan = np.isnan(values)
+        self.values = np.nan_to_num(values)
+        self.tolerance = np.where(spec.percent, np.abs(self.values) * spec.tolerance, spec.tolerance)
+        # 旋转门: 从起点出发、与所有中间采样的偏差都不超过容差的直线的斜率区间
+        self.low = np.full(self.values.shape, -np.inf)
+        self.high = np.full(self.values.shape, np.inf)
+        self.pending_ts = self.pending = self.pending_row = None
+
+    @property
+    def last_ts(self):
+        return self.ts if self.pending_ts is None else self.pending_ts
+
+    def narrow(self):
+        """未保存的上一个采样成为中间采样，收窄斜率区间"""
+        elapsed = self.pending_ts - self.ts
+        pending = np.nan_to_num(self.pending)
+        self.low = np.maximum(self.low, (pending - self.values - self.tolerance) / elapsed)
+        self.high = np.minimum(self.high, (pending - self.values + self.tolerance) / elapsed)
+
+    def fits(self, spec, ts, values):
+        """从起点到(ts, values)的直线是否满足所有中间采样，且没有超过最长保存间隔"""
+        if ts - self.ts > spec.max_interval_ms:
+            return False
+        slope = (values - self.values) / (ts - self.ts)
+        return bool(np.all(~spec.linear | ((slope >= self.low) & (slope <= self.high))))
+
+    def exceeds(self, spec, ts, values, nan):
+        """死区字段超出容差、缺失值变化或超过最长保存间隔时必须保存(ts, values)"""
+        if ts - self.ts > spec.max_interval_ms or np.any(nan != self.nan):
+            return True
+        return bool(np.any(~spec.linear & (np.abs(values - self.values) > self.tolerance)))
+
+
+class DeadbandFilter:
+    """
+    按CompressionSpec决定每个采样是否需要保存
+
+    每个序列只保留起点和最近一个未保存的采样，旋转门判定需要保存上一个采样时，它随下一个采样一起返回。
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.segments = {}
+        self.skipped = 0  # 累计没有保存的采样数
+
+    def add(self, key, ts, values, row):
+        """
+        加入序列key的一个采样
+
+        Args:
+            key: 序列标识（如电机编号）
+            ts: epoch毫秒
+            values: 数值字段（最后一维与spec.fields对应），缺失值为NaN
+            row: 需要保存时原样返回的行
+
+        Returns:
+            需要保存的行（按时间顺序，可能包含之前暂缓的行）
+        """
+        segment = self.segments.get(key)
+        if segment is None:
+            self.segments[key] = _Segment(self.spec, ts, values)
+            return [row]
+        if ts <= segment.last_ts:
+            # 重复或乱序的采样原样保存，保存的最新采样成为新起点
+            rows = []
+            if segment.pending_row is not None and segment.pending_ts != ts:
+                rows.append(segment.pending_row)
+                segment.restart(self.spec, segment.pending_ts, segment.pending)
+            if ts == segment.last_ts:
+                segment.restart(self.spec, ts, values)
+            return rows + [row]
+
+        rows = []
+        nan = np.isnan(values)
+        current = np.nan_to_num(values)
+        if segment.pending_row is not None:
+            segment.narrow()
+            if np.any(nan != segment.nan) or not segment.fits(self.spec, ts, current):
+                rows.append(segment.pending_row)
+                segment.restart(self.spec, segment.pending_ts, segment.pending)
+            else:
+                self.skipped += 1
+        if segment.exceeds(self.spec, ts, current, nan):
+            rows.append(row)
+            segment.restart(self.spec, ts, values)
+        else:
+            segment.pending_ts, segment.pending, segment.pending_row = ts, values, row
+        return rows
+
+    def checkpoint(self):
+        """
+        当前状态的副本，本批写入失败时交给rollback恢复
+
+        _Segment的方法总是替换而不是原地修改数组，浅复制每个序列即可
+        """
+        return {key: copy.copy(segment) for key, segment in self.segments.items()}, self.skipped
+
+    def rollback(self, state):
+        """恢复到checkpoint时的状态，写入失败的采样视为没有出现过，之后的采样仍以已经保存的采样为起点"""
+        self.segments, self.skipped = state
+
+    def flush(self):
+        """返回所有序列暂缓的最后一个采样（停止写入前调用）"""
+        rows = []
+        for segment in self.segments.values():
+            if segment.pending_row is not None:
+                rows.append(segment.pending_row)
+                segment.restart(self.spec, segment.pending_ts, segment.pending)
+        return rows
+
+
+def interpolate(ts, values, grid, linear, max_gap):
+    """
+    由保存的采样重建grid时刻的值
+
+    Args:
+        ts: 保存的采样时间（升序）
+        values: (len(ts), 字段数)矩阵
+        grid: 需要重建的时刻
+        linear: 每个字段是否线性插值，否则取前一个保存的值
+        max_gap: 相邻两个保存的采样相隔超过该值时其间无法重建
+
+    Returns:
+        (grid中可以重建的掩码, (len(grid), 字段数)的值矩阵)
+    """
+    before = np.searchsorted(ts, grid, 'right') - 1
+    valid = before >= 0
+    before = np.maximum(before, 0)
+    after = np.minimum(before + 1, len(ts) - 1)
+    gap = ts[after] - ts[before]
+    valid &= (ts[before] == grid) | ((after > before) & (gap <= max_gap))
+    weight = (grid - ts[before]) / np.where(gap > 0, gap, 1)
+    previous = values[before]
+    # 正好落在保存的采样上时直接取该值（相邻采样缺失时插值结果为NaN）
+    result = np.where(linear & (weight[:, None] > 0), previous + weight[:, None] * (values[after] - previous), previous)
+    return valid, result
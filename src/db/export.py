@@ -0,0 +1,221 @@
+"""
+电机数据导出工具
+
+按时间范围把归档数据流式导出为CSV或NDJSON（每行一个JSON对象），可选gzip压缩:
+    - 通过DatabaseManager.iter_data_by_time_range分批读取，两种存储布局和分区文件都支持，内存占用与数据量无关
+    - 导出全部电机时每台电机一个文件，多个进程并行导出
+    - 指定--interval时按固定间隔插值重建采样（死区/旋转门压缩后归档中只有部分采样，见deadband.py）
+
+用法:
+    python export.py --db motor_data.db --motor 1 --output motor_1.csv
+    python export.py --db motor_data.db --all --output export/ --format ndjson --gzip --start 2024-01-01 --end 2025-01-01
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# 添加src目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.database import DatabaseManager, NUMERIC_FIELDS, from_epoch_ms
+
+FORMATS = ('csv', 'ndjson')
+
+# 每批从数据库读取的行数
+EXPORT_BATCH = 5000
+
+# 输出文件的写缓冲区大小
+WRITE_BUFFER = 1 << 20
+
+# 与db_viewer.py导出的CSV相同的表头，最后一列为百分比
+CSV_HEADER = [
+    '电机ID', '时间戳', 'A相电流', 'B相电流', 'C相电流',
+    '频率', '无功功率', '有功功率', '线电压', '励磁电压',
+    '励磁电流', '计算励磁电流', '励磁电流比值'
+]
+
+
+def _open_output(path, compress):
+    """打开文本输出文件，compress时写入gzip"""
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=6)
+    return open(path, 'w', encoding='utf-8', newline='', buffering=WRITE_BUFFER)
+
+
+def _percent(value):
+    """比值格式化为百分比，缺失值（NULL或NaN）为空单元格"""
+    return '' if value is None or value != value else f"{value * 100:.2f}%"
+
+
+def output_name(motor_id, fmt='csv', compress=False):
+    """导出全部电机时每台电机的文件名"""
+    return f"motor_{motor_id}.{fmt}" + ('.gz' if compress else '')
+
+
+def export_motor(db_manager, motor_id, output_file, start_time, end_time, fmt='csv', compress=False,
+                 progress=None, interval=0):
+    """
+    把一台电机在时间范围内的数据流式写入文件
+
+    Args:
+        db_manager: DatabaseManager
+        motor_id: 电机编号
+        output_file: 输出文件路径
+        start_time/end_time: 时间范围（datetime、ISO字符串或epoch秒，两端都包含）
+        fmt: csv或ndjson
+        compress: 是否gzip压缩
+        progress: 每写完一批调用progress(已写入行数)
+        interval: 大于0时按该间隔（秒）插值重建（DatabaseManager.iter_interpolated），否则导出保存的采样
+
+    Returns:
+        写入的行数
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"未知的导出格式: {fmt}")
+    if interval:
+        rows = db_manager.iter_interpolated(motor_id, start_time, end_time, interval, batch_size=EXPORT_BATCH)
+    else:
+        rows = db_manager.iter_data_by_time_range(motor_id, start_time, end_time, batch_size=EXPORT_BATCH)
+    count = 0
+    with _open_output(output_file, compress) as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+        while True:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= EXPORT_BATCH:
+                    break
+            if not batch:
+                break
+            if fmt == 'csv':
+                writer.writerows(
+                    [row['motor_id'], from_epoch_ms(row['ts']).replace('T', ' ')]
+                    + [row[field] for field in NUMERIC_FIELDS[:-1]]
+                    + [_percent(row['excitation_current_ratio'])]
+                    for row in batch
+                )
+            else:
+                f.write(''.join(
+                    json.dumps(dict(row, timestamp=from_epoch_ms(row['ts'])), ensure_ascii=False) + '\n'
+                    for row in batch
+                ))
+            count += len(batch)
+            if progress:
+                progress(count)
+    return count
+
+
+def _export_worker(db_args, motor_id, output_file, start_time, end_time, fmt, compress, interval):
+    """子进程中打开自己的数据库连接导出一台电机，返回(电机编号, 行数, 文件大小)"""
+    db_manager = DatabaseManager(*db_args)
+    count = export_motor(db_manager, motor_id, output_file, start_time, end_time, fmt, compress, interval=interval)
+    return motor_id, count, os.path.getsize(output_file)
+
+
+def export_all_motors(db_manager, output_dir, start_time=None, end_time=None, fmt='csv', compress=False,
+                      workers=None, progress=None, interval=0):
+    """
+    每台电机导出为output_dir下的一个文件（见output_name），workers个进程并行
+
+    电机列表和默认时间范围取自统计表（get_database_stats），不扫描原始数据。
+
+    Args:
+        progress: 每导出完一台电机调用progress(已完成电机数, 电机总数, 电机编号, 行数)
+        interval: 见export_motor
+
+    Returns:
+        {电机编号: 行数}
+    """
+    stats = db_manager.get_database_stats()
+    motor_ids = [motor_id for motor_id, _ in stats.get('motor_records', [])]
+    if not motor_ids:
+        return {}
+    first, last = stats['time_range']
+    start_time = first if start_time is None else start_time
+    end_time = last if end_time is None else end_time
+
+    os.makedirs(output_dir, exist_ok=True)
+    db_args = (db_manager.db_path, db_manager.layout, db_manager.station,
+               db_manager.partitions.partition if db_manager.partitions else '')
+    counts = {}
+    with ProcessPoolExecutor(max_workers=workers or min(len(motor_ids), os.cpu_count() or 1)) as executor:
+        futures = [
+            executor.submit(_export_worker, db_args, motor_id,
+                            os.path.join(output_dir, output_name(motor_id, fmt, compress)),
+                            start_time, end_time, fmt, compress, interval)
+            for motor_id in motor_ids
+        ]
+        for future in as_completed(futures):
+            motor_id, count, _ = future.result()
+            counts[motor_id] = count
+            if progress:
+                progress(len(counts), len(motor_ids), motor_id, count)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='电机数据导出工具')
+    parser.add_argument('--db', required=True, help='数据库文件路径')
+    parser.add_argument('--layout', choices=('row', 'wide'), default='row', help='存储布局（与采集服务的database.layout相同）')
+    parser.add_argument('--station', default='', help='宽表中的站点标识')
+    parser.add_argument('--partition', choices=('', 'day', 'week'), default='', help='原始数据分区粒度')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--motor', type=int, help='导出指定电机')
+    target.add_argument('--all', action='store_true', help='导出全部电机，每台电机一个文件')
+    parser.add_argument('--output', help='输出文件（--motor）或目录（--all），默认motor_<电机>.<格式>或export/')
+    parser.add_argument('--start', help='起始时间（ISO格式，如2024-01-01或2024-01-01T08:00:00），默认最早的数据')
+    parser.add_argument('--end', help='结束时间（ISO格式），默认最新的数据')
+    parser.add_argument('--format', choices=FORMATS, default='csv', help='导出格式')
+    parser.add_argument('--gzip', action='store_true', help='gzip压缩输出')
+    parser.add_argument('--workers', type=int, help='--all时并行导出的进程数，默认CPU核数')
+    parser.add_argument('--interval', type=float, default=0,
+                        help='按固定间隔（秒）插值重建采样（死区/旋转门压缩的归档），默认导出保存的采样')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"数据库文件 {args.db} 不存在")
+        return
+
+    db_manager = DatabaseManager(args.db, args.layout, args.station, args.partition)
+    started = time.time()
+
+    if args.all:
+        output_dir = args.output or 'export'
+
+        def report(done, total, motor_id, count):
+            print(f"[{done}/{total}] 电机 {motor_id}: {count} 条，已用时 {time.time() - started:.1f} 秒")
+
+        counts = export_all_motors(db_manager, output_dir, args.start, args.end, args.format, args.gzip,
+                                   args.workers, report, args.interval)
+        print(f"共导出 {len(counts)} 台电机 {sum(counts.values())} 条记录到 {output_dir}，"
+              f"耗时 {time.time() - started:.1f} 秒")
+        return
+
+    output_file = args.output or output_name(args.motor, args.format, args.gzip)
+    start_time, end_time = args.start, args.end
+    if start_time is None or end_time is None:
+        first, last = db_manager.get_database_stats().get('time_range', (None, None))
+        if first is None:
+            print("数据库中没有数据可导出")
+            return
+        start_time = start_time or first
+        end_time = end_time or last
+
+    def report(count):
+        print(f"\r已导出 {count} 条", end='', flush=True)
+
+    count = export_motor(db_manager, args.motor, output_file, start_time, end_time, args.format, args.gzip, report,
+                         args.interval)
+    print(f"\r电机 {args.motor} 的数据已导出到 {output_file}，共 {count} 条记录，耗时 {time.time() - started:.1f} 秒")
+
+
+if __name__ == '__main__':
+    main()
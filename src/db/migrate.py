@@ -0,0 +1,229 @@
+"""
+数据库表结构升级工具
+
+把旧版数据库原地升级到当前表结构版本（database.SCHEMA_VERSION）:
+    版本1 → 2: ISO文本时间戳 + 自增id + 三个索引 → epoch毫秒ts + (motor_id, ts)主键的WITHOUT ROWID表
+    版本2 → 3: 新增每次轮询一行的宽表poll_snapshots
+    版本3 → 4: 新增降采样汇总表motor_rollups，由已有的原始数据生成
+    版本4 → 5: 新增最新值表motor_latest，由每台电机最新的一行生成
+    版本5 → 6: 新增统计表motor_stats，全表扫描统计一次已有的原始数据
+    版本6 → 7: 新增压缩块表motor_blocks（空表，由DatabaseManager.compress_blocks写入）
+    版本7 → 8: 新增设置表archive_settings（空表，开启死区/旋转门压缩的写入线程记录各字段的压缩方法）
+    版本8 → 9: 汇总表新增各字段的有效采样数<字段>_count，均值不再把缺失值按0计入；升级前的桶按桶内采样数填充
+
+DatabaseManager打开旧版数据库时会自动升级；数据量大时建议先停止采集服务，用本工具离线升级。
+
+用法:
+    python migrate.py --db motor_data.db [--backup] [--vacuum]
+"""
+
+import argparse
+import itertools
+import os
+import sqlite3
+import sys
+import time
+
+# 添加src目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.database import (CREATE_TABLE_SQL, CREATE_SNAPSHOT_TABLE_SQL, CREATE_ROLLUP_TABLE_SQL, CREATE_LATEST_TABLE_SQL,
+                         CREATE_STATS_TABLE_SQL, CREATE_BLOCK_TABLE_SQL, CREATE_SETTINGS_TABLE_SQL, NUMERIC_FIELDS,
+                         SCHEMA_VERSION, get_schema_version, batch_samples, recount_stats, to_epoch_ms, update_latest,
+                         update_rollups, write_stats)
+
+# 生成汇总表时每批读取的原始行数
+BACKFILL_BATCH = 50000
+
+
+def _iso_to_ms(value):
+    """旧版timestamp列转换为epoch毫秒，无法解析时返回None（该行被跳过）"""
+    try:
+        return to_epoch_ms(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _migrate_v1_to_v2(conn):
+    """ISO文本时间戳的旧表复制到新表，按(motor_id, 时间)顺序插入，新表的B树只在末尾追加"""
+    columns = ', '.join(NUMERIC_FIELDS)
+    conn.create_function('iso_to_ms', 1, _iso_to_ms, deterministic=True)
+    conn.execute(CREATE_TABLE_SQL.format(table='motor_data_v2'))
+    # ISO字符串的字典序即时间顺序；同一电机同一毫秒的重复行只保留一条
+    conn.execute(f'''
+        INSERT OR IGNORE INTO motor_data_v2 (motor_id, ts, {columns})
+        SELECT motor_id, ts, {columns} FROM (
+            SELECT motor_id, iso_to_ms(timestamp) AS ts, {columns}
+            FROM motor_data
+            ORDER BY motor_id, timestamp
+        ) WHERE ts IS NOT NULL
+    ''')
+    # 旧表的三个索引随表一起删除
+    conn.execute('DROP TABLE motor_data')
+    conn.execute('ALTER TABLE motor_data_v2 RENAME TO motor_data')
+
+
+def _migrate_v2_to_v3(conn):
+    """新增宽表，已有数据保留在motor_data中"""
+    conn.execute(CREATE_SNAPSHOT_TABLE_SQL)
+
+
+def _migrate_v3_to_v4(conn):
+    """新增汇总表，分批读取两种布局的原始数据合并进去（跨批次的同一时间桶由UPSERT合并）"""
+    conn.execute(CREATE_ROLLUP_TABLE_SQL)
+    cursor = conn.execute(f'SELECT motor_id, ts, {", ".join(NUMERIC_FIELDS)} FROM motor_data')
+    while True:
+        rows = cursor.fetchmany(BACKFILL_BATCH)
+        if not rows:
+            break
+        update_rollups(conn, batch_samples(rows))
+    cursor = conn.execute('SELECT station, ts, motor_count, data FROM poll_snapshots')
+    while True:
+        rows = cursor.fetchmany(BACKFILL_BATCH // 10)
+        if not rows:
+            break
+        for station, group in itertools.groupby(rows, key=lambda row: row[0]):
+            update_rollups(conn, batch_samples(list(group), 'wide'), station)
+
+
+def _migrate_v4_to_v5(conn):
+    """
+    新增最新值表
+
+    逐台电机取主键上最后一行（宽表为每个站点最近一次轮询），不扫描整表；
+    分区文件中的数据不参与，下一次写入后更新
+    """
+    conn.execute(CREATE_LATEST_TABLE_SQL)
+    rows = []
+    motor_id = conn.execute('SELECT MIN(motor_id) FROM motor_data').fetchone()[0]
+    while motor_id is not None:
+        rows.append(conn.execute(f'''
+            SELECT motor_id, ts, {", ".join(NUMERIC_FIELDS)} FROM motor_data 
+            WHERE motor_id = ? ORDER BY ts DESC LIMIT 1
+        ''', (motor_id,)).fetchone())
+        motor_id = conn.execute('SELECT MIN(motor_id) FROM motor_data WHERE motor_id > ?', (motor_id,)).fetchone()[0]
+    update_latest(conn, batch_samples(rows))
+    stations = conn.execute('SELECT DISTINCT station FROM poll_snapshots').fetchall()
+    for station, in stations:
+        row = conn.execute('''
+            SELECT station, ts, motor_count, data FROM poll_snapshots 
+            WHERE station = ? ORDER BY ts DESC LIMIT 1
+        ''', (station,)).fetchone()
+        update_latest(conn, batch_samples([row], 'wide'), station)
+
+
+def _migrate_v5_to_v6(conn):
+    """
+    新增统计表
+
+    只统计主数据库中的数据；分区文件中已有的数据在DatabaseManager.get_database_stats(exact=True)重新统计后计入
+    """
+    conn.execute(CREATE_STATS_TABLE_SQL)
+    write_stats(conn, recount_stats(conn))
+
+
+def _migrate_v6_to_v7(conn):
+    """新增压缩块表"""
+    conn.execute(CREATE_BLOCK_TABLE_SQL)
+
+
+def _migrate_v7_to_v8(conn):
+    """新增设置表"""
+    conn.execute(CREATE_SETTINGS_TABLE_SQL)
+
+
+def _migrate_v8_to_v9(conn):
+    """
+    汇总表新增各字段的有效采样数
+
+    升级前写入的桶已经把缺失值按0计入min/sum，无法区分，按桶内采样数填充（与升级前的均值相同）；
+    同一次升级中由版本3 → 4新建的汇总表已经有这些列
+    """
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(motor_rollups)')}
+    missing = [field for field in NUMERIC_FIELDS if f'{field}_count' not in columns]
+    for field in missing:
+        conn.execute(f'ALTER TABLE motor_rollups ADD COLUMN {field}_count INTEGER')
+    if missing:
+        conn.execute(f"UPDATE motor_rollups SET {', '.join(f'{field}_count = count' for field in missing)}")
+
+
+# 起始版本 → 升级到下一版本的函数
+MIGRATIONS = {
+    1: _migrate_v1_to_v2,
+    2: _migrate_v2_to_v3,
+    3: _migrate_v3_to_v4,
+    4: _migrate_v4_to_v5,
+    5: _migrate_v5_to_v6,
+    6: _migrate_v6_to_v7,
+    7: _migrate_v7_to_v8,
+    8: _migrate_v8_to_v9,
+}
+
+
+def migrate(conn):
+    """
+    把连接上的数据库升级到SCHEMA_VERSION，每一步在一个事务中完成，中途失败不改变数据库
+
+    Returns:
+        (升级前版本, 升级后版本)
+    """
+    conn.commit()
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # 手动管理事务，DDL也在事务中执行
+    try:
+        start_version = version = get_schema_version(conn)
+        while 0 < version < SCHEMA_VERSION:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                MIGRATIONS[version](conn)
+                version += 1
+                conn.execute(f'PRAGMA user_version = {version}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return start_version, version
+    finally:
+        conn.isolation_level = isolation_level
+
+
+def main():
+    parser = argparse.ArgumentParser(description='电机数据数据库表结构升级工具')
+    parser.add_argument('--db', required=True, help='数据库文件路径')
+    parser.add_argument('--backup', action='store_true', help='升级前备份到<数据库>.bak')
+    parser.add_argument('--vacuum', action='store_true', help='升级后执行VACUUM回收旧表占用的空间（并启用增量回收）')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"数据库文件 {args.db} 不存在")
+        return
+
+    size_before = os.path.getsize(args.db)
+    with sqlite3.connect(args.db) as conn:
+        rows_before = conn.execute('SELECT COUNT(*) FROM motor_data').fetchone()[0] \
+            if get_schema_version(conn) else 0
+        if args.backup:
+            backup_path = args.db + '.bak'
+            with sqlite3.connect(backup_path) as backup:
+                conn.backup(backup)
+            print(f"已备份到 {backup_path}")
+
+        started = time.time()
+        start_version, version = migrate(conn)
+        if start_version == version:
+            print(f"数据库表结构已是版本 {version}，无需升级")
+            return
+        rows_after = conn.execute('SELECT COUNT(*) FROM motor_data').fetchone()[0]
+        if args.vacuum:
+            # 同时转换为增量回收模式，之后的数据清理可以用PRAGMA incremental_vacuum逐步回收空间
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+    size_after = os.path.getsize(args.db)
+
+    print(f"表结构版本 {start_version} → {version}，耗时 {time.time() - started:.1f} 秒")
+    print(f"记录数: {rows_before} → {rows_after}（跳过 {rows_before - rows_after} 条时间戳重复或无法解析的记录）")
+    print(f"文件大小: {size_before / 1024 / 1024:.2f} MB → {size_after / 1024 / 1024:.2f} MB")
+
+
+if __name__ == '__main__':
+    main()
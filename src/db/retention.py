@@ -0,0 +1,149 @@
+import sqlite3
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from metrics import REGISTRY
+from db.database import retention_batches, to_epoch_ms
+
+logger = logging.getLogger(__name__)
+
+DELETED = REGISTRY.counter('db_retention_deleted_total', '数据保留任务删除的记录数')
+BATCH_SECONDS = REGISTRY.histogram('db_retention_batch_seconds', '数据保留任务一批压缩、删除或一次空间回收的耗时',
+                                   (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+COMPRESSED = REGISTRY.counter('db_blocks_compressed_total', '压缩为块的原始采样数')
+FREELIST_PAGES = REGISTRY.gauge('db_freelist_pages', '主数据库中尚未回收的空闲页数')
+
+# PRAGMA auto_vacuum的取值
+_AUTO_VACUUM_INCREMENTAL = 2
+
+
+class RetentionTask:
+    """
+    后台数据保留线程
+
+    每隔interval秒删除早于days_to_keep天的原始数据：主数据库中每批batch_rows行一个短事务，
+    批次之间暂停pause秒，让写入线程拿到写锁；分区时整个删除过期的分区文件。
+    DatabaseManager设置了block_seconds时，先把已经结束的时间块压缩为块，每个时间块一个短事务。
+    删除后用PRAGMA incremental_vacuum每次回收vacuum_pages页，逐步把空闲页还给文件系统，不做整库VACUUM。
+    """
+
+    def __init__(self, db_manager, days_to_keep, interval=3600, batch_rows=2000, pause=0.05, vacuum_pages=128):
+        """
+        初始化数据保留任务
+
+        Args:
+            db_manager: DatabaseManager（提供数据库路径、分区和压缩块设置）
+            days_to_keep: 保留最近多少天的原始数据，0表示不删除（只压缩）
+            interval: 两次清理的间隔（秒）
+            batch_rows: 每个删除事务最多删除的行数
+            pause: 批次之间的暂停（秒）
+            vacuum_pages: 每次incremental_vacuum回收的页数
+        """
+        self.db_manager = db_manager
+        self.days_to_keep = days_to_keep
+        self.interval = interval
+        self.batch_rows = batch_rows
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self.stop_event = threading.Event()
+        self.thread = None
+        self._warned = False
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='db-retention', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=10):
+        """在当前批次结束后停止"""
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join(timeout)
+        self.thread = None
+
+    def run_once(self):
+        """
+        执行一次清理
+
+        Returns:
+            (压缩的采样数, 删除的记录数, 回收的页数)
+        """
+        compressed = self._drain(self.db_manager.iter_compress_blocks(), COMPRESSED)
+        deleted = 0
+
+        conn = sqlite3.connect(self.db_manager.db_path)
+        try:
+            if self.days_to_keep > 0:
+                cutoff = to_epoch_ms(datetime.now() - timedelta(days=self.days_to_keep))
+                partitions = self.db_manager.partitions
+                if partitions:
+                    for key in partitions.keys():
+                        if self.stop_event.is_set():
+                            break
+                        if partitions.period(key)[1] <= cutoff:
+                            deleted += self.db_manager.drop_partition(key)
+                deleted += self._drain(retention_batches(conn, cutoff, self.batch_rows), DELETED)
+            freed = self._incremental_vacuum(conn)
+        finally:
+            conn.close()
+        return compressed, deleted, freed
+
+    def _drain(self, batches, counter):
+        """逐批执行生成器中的短事务，批次之间暂停，返回各批数量之和"""
+        total = 0
+        try:
+            while not self.stop_event.is_set():
+                started = time.perf_counter()
+                count = next(batches, None)
+                if count is None:
+                    break
+                BATCH_SECONDS.observe(time.perf_counter() - started)
+                counter.inc(count)
+                total += count
+                self.stop_event.wait(self.pause)
+        finally:
+            batches.close()
+        return total
+
+    def _incremental_vacuum(self, conn):
+        """分多次回收空闲页，返回回收的页数；数据库不是增量回收模式时只提示一次"""
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        FREELIST_PAGES.set(free)
+        if not free:
+            return 0
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != _AUTO_VACUUM_INCREMENTAL:
+            if not self._warned:
+                logger.warning(f"数据库不是增量回收模式，删除数据后的 {free} 个空闲页只能被复用，"
+                               f"执行一次DatabaseManager.optimize_database()或migrate.py --vacuum后生效")
+                self._warned = True
+            return 0
+
+        freed = 0
+        while free and not self.stop_event.is_set():
+            started = time.perf_counter()
+            # 每释放一页是一步；execute()只执行第一步，executescript会执行到结束
+            conn.executescript(f'PRAGMA incremental_vacuum({self.vacuum_pages});')
+            BATCH_SECONDS.observe(time.perf_counter() - started)
+            remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if remaining >= free:
+                break
+            freed += free - remaining
+            free = remaining
+            FREELIST_PAGES.set(free)
+            self.stop_event.wait(self.pause)
+        return freed
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                started = time.time()
+                compressed, deleted, freed = self.run_once()
+                if compressed or deleted or freed:
+                    logger.info(f"数据保留: 压缩 {compressed} 条，删除 {deleted} 条早于 {self.days_to_keep} 天的记录，"
+                                f"回收 {freed} 页，耗时 {time.time() - started:.1f} 秒")
+            except Exception as e:
+                logger.error(f"数据保留任务失败: {str(e)}")
+            self.stop_event.wait(self.interval)
@@ -0,0 +1,210 @@
+import sqlite3
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+from metrics import REGISTRY
+from db.database import (INSERT_SQL, INSERT_SNAPSHOT_SQL, LAYOUTS, PARTITIONS, UPSERT_SETTING_SQL, ArchivePartitions,
+                         motor_row, snapshot_row, batch_samples, unpack_snapshot, update_summaries, ROWS_WRITTEN,
+                         WRITE_ERRORS)
+from db.deadband import DeadbandFilter
+
+logger = logging.getLogger(__name__)
+
+COMMIT_SECONDS = REGISTRY.histogram('db_commit_duration_seconds', '后台写入线程一次批量提交的耗时')
+BATCH_ROWS = REGISTRY.histogram('db_commit_batch_rows', '后台写入线程每次提交的行数',
+                                (1, 5, 12, 24, 60, 120, 240, 500, 1000, 2500, 5000))
+QUEUE_DEPTH = REGISTRY.gauge('db_writer_queue_depth', '等待后台写入的快照数')
+DROPPED = REGISTRY.counter('db_writer_dropped_total', '写入队列已满时丢弃的快照数')
+SKIPPED = REGISTRY.counter('db_deadband_skipped_total', '死区/旋转门压缩后没有写入原始数据表的行数')
+
+_STOP = object()
+
+
+class DatabaseWriter:
+    """
+    后台批量写入线程（write-behind）
+
+    调用方只把每轮快照转换为行放入队列，写入线程持有一个长连接（WAL + synchronous=NORMAL），
+    攒够batch_rows行或距本批第一行超过flush_interval秒时用executemany一次提交，
+    同一事务中把这批数据合并进降采样汇总表，并更新最新值表和统计表。分区时原始数据写入附加到该连接上的分区文件。
+    设置了compression时原始数据只写入死区/旋转门压缩后需要保存的行（见deadband.py），汇总表和最新值表仍使用全部数据。
+    """
+
+    def __init__(self, db_path, batch_rows=500, flush_interval=0.2, max_pending=6000, layout='row', station='',
+                 partition='', compression=None):
+        """
+        初始化写入线程
+
+        Args:
+            db_path: 数据库文件路径（表结构由DatabaseManager初始化）
+            batch_rows: 达到该行数立即提交
+            flush_interval: 一批数据最长等待时间（秒）
+            max_pending: 队列中最多积压的快照数，满时submit等待
+            layout: 存储布局，row为每台电机一行，wide为每次轮询一行（见DatabaseManager）
+            station: 宽表中的站点标识
+            partition: 原始数据分区粒度（见ArchivePartitions），空字符串表示写入主数据库
+            compression: 死区/旋转门压缩设置（CompressionSpec，字段为NUMERIC_FIELDS），None表示每行都写入
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f"未知的存储布局: {layout}")
+        if partition not in PARTITIONS:
+            raise ValueError(f"未知的分区粒度: {partition}")
+        self.db_path = db_path
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.layout = layout
+        self.station = station
+        self.summary_station = station if layout == 'wide' else ''
+        self.insert_sql = INSERT_SNAPSHOT_SQL if layout == 'wide' else INSERT_SQL
+        self.table = 'poll_snapshots' if layout == 'wide' else 'motor_data'
+        self.partitions = ArchivePartitions(db_path, partition) if partition else None
+        self.attached = {}  # 分区名 → 附加库名，按最近使用排列
+        self.compression = compression
+        self.filter = DeadbandFilter(compression) if compression else None
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = None
+        QUEUE_DEPTH.set_function(self.queue.qsize)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, motors, timeout=None):
+        """
+        放入一轮电机数据，队列满时最多等待timeout秒（None表示一直等待）
+
+        Returns:
+            是否成功放入；超时放弃或写入线程没有运行时计入db_writer_dropped_total
+        """
+        if self.thread is None or not self.thread.is_alive():
+            # 写入线程已退出（如打开数据库失败），没有人取走队列中的数据，不能等待
+            DROPPED.inc()
+            return False
+        if self.layout == 'wide':
+            rows = [snapshot_row(motors, self.station)]
+        else:
+            rows = [motor_row(motor) for motor in motors]
+        try:
+            self.queue.put(rows, timeout=timeout)
+            return True
+        except queue.Full:
+            DROPPED.inc()
+            logger.warning("数据库写入队列已满，丢弃一轮数据")
+            return False
+
+    def stop(self, timeout=30):
+        """写完队列中剩余的数据后关闭连接"""
+        if self.thread is None:
+            return
+        if not self.thread.is_alive():
+            self.thread = None
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.error("数据库写入线程没有响应，放弃写入队列中剩余的数据")
+        self.thread.join(max(0.0, deadline - time.monotonic()))
+        self.thread = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # WAL模式下NORMAL只在检查点时fsync，掉电最多丢失最后几次提交，不会损坏数据库
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _attach(self, conn, key):
+        """附加分区文件，只保留最近用到的两个（跨越分区边界的批次），更早的分离"""
+        alias = self.attached.pop(key, None) or self.partitions.attach(conn, key)
+        self.attached[key] = alias
+        while len(self.attached) > 2:
+            conn.execute(f'DETACH DATABASE {self.attached.pop(next(iter(self.attached)))}')
+        return alias
+
+    def _filter(self, batch):
+        """压缩后需要写入原始数据表的行；row布局每台电机一个序列，wide布局每个站点一个序列"""
+        stored = []
+        for row in batch:
+            if self.layout == 'wide':
+                matrix = unpack_snapshot(row[3], row[2])
+                # 电机组成变化时作为新的序列
+                key, values = (row[0], matrix[:, 0].tobytes()), matrix[:, 1:].astype(np.float64)
+            else:
+                key, values = row[0], np.array(row[2:], dtype=np.float64)
+            stored += self.filter.add(key, row[1], values, row)
+        return stored
+
+    def _flush(self, conn, batch, final=False):
+        started = time.perf_counter()
+        state = self.filter.checkpoint() if self.filter else None
+        try:
+            stored = batch
+            if self.filter:
+                stored = self._filter(batch)
+                if final:
+                    stored += self.filter.flush()
+            if not stored and not batch:
+                return
+            if self.partitions:
+                # ATTACH/DETACH不能在事务中执行
+                groups = [(self._attach(conn, key), rows) for key, rows in self.partitions.group(stored).items()]
+            else:
+                groups = [('main', stored)]
+            with conn:
+                for schema, rows in groups:
+                    conn.executemany(self.insert_sql.format(table=f'{schema}.{self.table}'), rows)
+                samples = batch_samples(batch, self.layout)
+                update_summaries(conn, samples, self.summary_station,
+                                 batch_samples(stored, self.layout) if self.filter else samples)
+            if self.filter:
+                SKIPPED.inc(self.filter.skipped - state[1])
+            ROWS_WRITTEN.inc(len(stored))
+            BATCH_ROWS.observe(len(stored))
+            COMMIT_SECONDS.observe(time.perf_counter() - started)
+        except Exception as e:
+            if self.filter:
+                # 压缩状态只在写入成功后生效，否则之后的采样会以没有保存的采样为起点，重建误差超出容差
+                self.filter.rollback(state)
+            WRITE_ERRORS.inc()
+            logger.error(f"批量写入 {len(batch)} 行数据失败: {str(e)}")
+
+    def _run(self):
+        try:
+            conn = self._connect()
+        except Exception as e:
+            logger.error(f"打开数据库失败: {str(e)}")
+            return
+        if self.compression:
+            # 记录各字段的压缩方法，读取时据此插值重建
+            try:
+                with conn:
+                    conn.execute(UPSERT_SETTING_SQL, (self.summary_station, 'compression', self.compression.to_json()))
+            except Exception as e:
+                logger.error(f"记录压缩设置失败: {str(e)}")
+        batch = []
+        deadline = 0.0
+        try:
+            while True:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()) if batch else None)
+                except queue.Empty:
+                    item = None
+                if item is _STOP:
+                    break
+                if item:
+                    if not batch:
+                        deadline = time.monotonic() + self.flush_interval
+                    batch.extend(item)
+                if batch and (len(batch) >= self.batch_rows or time.monotonic() >= deadline):
+                    self._flush(conn, batch)
+                    batch = []
+        finally:
+            # 压缩时暂缓的最后一个采样也一并写入
+            if batch or self.filter:
+                self._flush(conn, batch, final=True)
+            conn.close()
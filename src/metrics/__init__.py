@@ -0,0 +1,10 @@
+"""
+指标模块
+
+提供进程内的计数器、仪表和固定分桶直方图，并以Prometheus文本格式通过本地HTTP端点导出
+"""
+
+from .registry import Counter, Gauge, Histogram, MetricsRegistry, REGISTRY
+from .http_server import MetricsServer
+
+__all__ = ['Counter', 'Gauge', 'Histogram', 'MetricsRegistry', 'REGISTRY', 'MetricsServer']
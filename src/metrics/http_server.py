@@ -0,0 +1,63 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .registry import MetricsRegistry, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsServer:
+    """在后台线程中通过HTTP导出指标（GET /metrics），默认只监听本机"""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, host='127.0.0.1', port=9100):
+        """
+        初始化指标服务
+
+        Args:
+            registry: 要导出的指标注册表
+            host: 监听地址
+            port: 监听端口
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def _make_handler(self):
+        registry = self.registry
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return MetricsHandler
+
+    def start(self):
+        """在后台线程中启动HTTP服务"""
+        self.server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        # logger.info(f"指标服务启动: http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        """停止HTTP服务"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
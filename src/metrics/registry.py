@@ -0,0 +1,193 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+# 默认直方图分桶上限（秒），覆盖从亚毫秒级的解码到秒级的Modbus轮询
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """
+    单调递增的计数器
+
+    记录不加锁：热路径上只有一次属性加法，极少数并发下丢失一次计数对容量分析没有影响。
+    """
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        yield self.name, '', self.value
+
+
+class Gauge:
+    """可增可减的仪表，也可以绑定一个在导出时求值的函数（连接数、队列深度等）"""
+
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """导出时调用function获取当前值"""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return math.nan
+        return self.value
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        yield self.name, '', self.get()
+
+
+class Histogram:
+    """
+    固定分桶的直方图
+
+    observe()只做一次二分查找和三次加法；导出时再累加为Prometheus要求的累计桶。
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为+Inf桶
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def time(self):
+        """计时上下文管理器，退出时记录耗时（秒）"""
+        return _Timer(self)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按分桶线性插值估算分位数（与PromQL的histogram_quantile相同的近似），没有样本时返回None"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and cumulative + count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        # 落在+Inf桶中，只能返回最大的有限上限
+        return self.buckets[-1] if self.buckets else None
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            yield f'{self.name}_bucket', f'le="{_format_value(bound)}"', cumulative
+        yield f'{self.name}_sum', '', self.sum
+        yield f'{self.name}_count', '', self.count
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+
+    同名指标只创建一次，多处模块（或多个服务器实例）获取到的是同一个对象。
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        self.lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, documentation, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标 {name} 已注册为 {metric.type_name}")
+            return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._get_or_create(Counter, name, documentation)
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation)
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, buckets=buckets)
+
+    def render(self) -> str:
+        """按Prometheus文本格式(0.0.4)导出所有指标"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{{{labels}}} {_format_value(value)}' if labels else f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# 进程内默认注册表
+REGISTRY = MetricsRegistry()
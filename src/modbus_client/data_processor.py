@@ -3,6 +3,7 @@ import os
 import importlib
 import logging
 import struct
+import time
 from datetime import datetime
 from dataclasses import dataclass
 from typing import List
@@ -10,8 +11,13 @@ from typing import List
 # 添加src目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+from metrics import REGISTRY
+
 logger = logging.getLogger(__name__)
 
+DECODE_SECONDS = REGISTRY.histogram('decode_calc_duration_seconds', '一次轮询数据的解码和励磁电流计算耗时')
+DECODE_ERRORS = REGISTRY.counter('decode_errors_total', '解析失败的轮询数据次数')
+
 @dataclass
 class MotorData:
     """电机数据类"""
@@ -103,6 +109,9 @@ class DataProcessor:
     def __init__(self, motor_count=12):
         self.motor_count = motor_count
         self.motors = [MotorData(i+1) for i in range(motor_count)]
+        # 最近一次处理的链路时间戳（epoch秒），供端到端延迟追踪使用
+        self.last_trace = {}
+        self.calc_seconds = 0.0
         # # logger.info(f"数据处理器初始化完成，支持 {motor_count} 台电机")
     
     def to_float(self, high, low):
@@ -145,8 +154,10 @@ class DataProcessor:
                     module_name = f"calc.calc_{(i//2)*2+1}_{(i//2)*2+2}"
                     try:
                         calc_module = importlib.import_module(module_name)
-                        # 计算励磁电流
+                        # 计算励磁电流（与解码交错进行，单独累计计算耗时）
+                        calc_started = time.perf_counter()
                         motor.calculate_excitation(calc_module)
+                        self.calc_seconds += time.perf_counter() - calc_started
                     except ImportError as e:
                         logger.error(f"导入计算模块 {module_name} 失败: {str(e)}")
                     except Exception as e:
@@ -177,6 +188,8 @@ class DataProcessor:
             if not raw_data:
                 logger.warning("收到空的原始数据")
                 return []
+            started = time.perf_counter()
+            self.calc_seconds = 0.0
             # 使用新的解析方法
             success = self.parse_motor_data(raw_data)
             if success:
@@ -186,8 +199,12 @@ class DataProcessor:
                         m.average_excitation_current_ratio = m.excitation_current_ratio
                     else:
                         m.average_excitation_current_ratio = (m.average_excitation_current_ratio + m.excitation_current_ratio) / 2
+                DECODE_SECONDS.observe(time.perf_counter() - started)
+                calc_end = time.time()
+                self.last_trace = {'decode_end': calc_end - self.calc_seconds, 'calc_end': calc_end}
                 return self.motors.copy()
             else:
+                DECODE_ERRORS.inc()
                 return []
         except Exception as e:
             logger.error(f"处理电机数据失败: {str(e)}")
@@ -0,0 +1,18 @@
+#!/bin/bash
+
+# Modbus采集服务启动脚本（无界面）
+# 供systemd或命令行使用，操作员通过WebSocket客户端查看数据
+
+# 获取脚本所在目录
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+PROJECT_ROOT="$(dirname "$(dirname "$SCRIPT_DIR")")"
+
+# 设置Python路径
+export PYTHONPATH="$PROJECT_ROOT:$PYTHONPATH"
+
+# 切换到项目根目录
+cd "$PROJECT_ROOT"
+
+# 启动采集服务，参数原样传递（例如 --config /etc/motor/config.json）
+echo "正在启动Modbus采集服务..."
+exec python3 "$SCRIPT_DIR/service.py" "$@"
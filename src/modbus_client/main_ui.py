@@ -1,26 +1,21 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 import json
-import threading
-import time
 import logging
 import sys
 import os
-import asyncio
 from datetime import datetime
 
 # 添加当前目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from modbus_client import ModbusClient
-from websocket_server.websocket_server import WebSocketServer
+from service import PipelineService
 # from db.database import DatabaseManager
 from ui.data_display import MotorDataDisplay
 from ui.chart_display import MotorChartDisplay
 from ui.bar_chart_display import MotorBarChart
 from ui.top_menu import TopMenu
 from ui.connection_status import ConnectionStatus
-from data_processor import DataProcessor
 
 logger = logging.getLogger(__name__)
 
@@ -32,23 +27,16 @@ class MainUI:
         self.root.title("电机监控系统")
         self.root.geometry("1400x900")
         
-        # 初始化组件
-        self.modbus_client = None
-        self.websocket_server = None
-        self.db_manager = None
-        self.data_processor = None
+        # 采集管道服务（轮询、计算、广播、入库），界面只负责配置和显示
+        self.service = None
         
         # 状态变量
         self.is_connected = False
         self.is_monitoring = False
-        self.monitoring_thread = None
         
         # 配置数据
         self.config = self.load_config()
         
-        # 最新数据缓存
-        self.latest_motors_data = []
-        
         # 创建UI
         self.create_ui()
         
@@ -189,27 +177,19 @@ class MainUI:
     def initialize_system(self):
         """初始化系统组件"""
         try:
-            # 初始化数据库 - 使用脚本目录
+            # 初始化数据库路径 - 使用脚本目录
             script_dir = self._get_script_directory()
             db_path = os.path.join(script_dir, "motor_data.db")
-            # self.db_manager = DatabaseManager(db_path)
-            # logger.info(f"数据库初始化完成: {db_path}")
-            
-            # 初始化数据处理器
-            motor_count = self.config['modbus']['motor_count']
-            self.data_processor = DataProcessor(motor_count)
-            # logger.info(f"数据处理器初始化完成，支持 {motor_count} 台电机")
             
-            # 初始化WebSocket服务器
-            ws_host = self.config['websocket']['host']
-            ws_port = self.config['websocket']['port']
-            self.websocket_server = WebSocketServer(self, host=ws_host, port=ws_port)
+            # 初始化采集管道服务（数据处理器、WebSocket/REST/指标服务）
+            self.service = PipelineService(self.config, db_path=db_path)
+            self.service.start_servers()
             
             # 设置客户端数量变化回调
-            self.websocket_server.set_client_count_changed_callback(self.on_websocket_client_count_changed)
+            self.service.set_client_count_changed_callback(self.on_websocket_client_count_changed)
             
-            self.websocket_server.start()
-            # logger.info(f"WebSocket服务器启动完成 - {ws_host}:{ws_port}")
+            # 每轮采集完成后在主线程中更新UI显示
+            self.service.on_data = lambda motors_data: self.root.after(0, self.update_motor_displays, motors_data)
             
             # 设置初始配置编辑状态（未连接时允许编辑）
             self.set_config_editable(True)
@@ -270,7 +250,7 @@ class MainUI:
             # 更新配置数据
             self.config['modbus'] = config_values['modbus']
             self.config['auto_update']['interval'] = config_values['auto_update']['interval']
-            self.config['websocket'] = config_values['websocket']
+            self.config['websocket'].update(config_values['websocket'])
             
             # 保存到文件
             self.save_config()
@@ -294,11 +274,8 @@ class MainUI:
             port = config_values['modbus']['port']
             motor_count = config_values['modbus']['motor_count']
             
-            # 创建Modbus客户端
-            self.modbus_client = ModbusClient(host, port, motor_count)
-            
-            # 尝试连接
-            if self.modbus_client.connect():
+            # 创建Modbus客户端并尝试连接
+            if self.service.connect(host, port, motor_count):
                 self.is_connected = True
                 self.update_connection_status()
                 self.create_motor_displays(motor_count)
@@ -317,8 +294,8 @@ class MainUI:
         """断开Modbus连接"""
         try:
             # logger.info("开始断开Modbus连接")
-            if self.modbus_client:
-                self.modbus_client.disconnect()
+            if self.service:
+                self.service.disconnect()
                 self.is_connected = False
                 # logger.info(f"断开连接后，is_connected={self.is_connected}")
                 self.update_connection_status()
@@ -399,9 +376,8 @@ class MainUI:
         if self.is_monitoring:
             return
         
-        self.is_monitoring = True
-        self.monitoring_thread = threading.Thread(target=self.monitoring_loop, daemon=True)
-        self.monitoring_thread.start()
+        interval = int(self.top_menu.get_config_values()['auto_update']['interval'])
+        self.is_monitoring = self.service.start_monitoring(interval)
         
         # 更新按钮状态
         self.top_menu.update_connection_status(self.is_connected, self.is_monitoring)
@@ -411,94 +387,14 @@ class MainUI:
     def stop_monitoring(self):
         """停止监控"""
         self.is_monitoring = False
+        if self.service:
+            self.service.stop_monitoring()
         
         # 更新按钮状态
         self.top_menu.update_connection_status(self.is_connected, self.is_monitoring)
         
         # logger.info("停止监控")
     
-    def monitoring_loop(self):
-        """监控循环"""
-        interval = int(self.top_menu.get_config_values()['auto_update']['interval'])
-        
-        while self.is_monitoring and self.is_connected:
-            try:
-                # 步骤2: 获取Modbus数据
-                raw_data = self.modbus_client.request_motor_data()
-                
-                if raw_data:
-                    # 处理数据
-                    motors_data = self.data_processor.process_motor_data(raw_data)
-                    
-                    # 更新最新数据缓存
-                    self.latest_motors_data = motors_data
-                    
-                    # 步骤3: 广播数据（使用线程安全的方式）
-                    if self.websocket_server:
-                        # 在新线程中运行异步广播
-                        broadcast_thread = threading.Thread(
-                            target=self.broadcast_data_async, 
-                            args=(motors_data,), 
-                            daemon=True
-                        )
-                        broadcast_thread.start()
-                    
-                    # 步骤4: 保存到数据库
-                    # if self.db_manager:
-                    #     self.db_manager.save_all_motors_data(motors_data)
-                    
-                    # 步骤5: 更新UI显示
-                    self.root.after(0, self.update_motor_displays, motors_data)
-                
-                time.sleep(interval)
-                
-            except Exception as e:
-                logger.error(f"监控循环错误: {str(e)}")
-                time.sleep(interval)
-    
-    def broadcast_data_async(self, motors_data):
-        """异步广播数据"""
-        try:
-            logger.debug(f"开始广播数据，数据类型: {type(motors_data)}, 长度: {len(motors_data)}")
-            
-            # 将MotorData对象列表转换为字典列表
-            formatted_data = []
-            for i, motor_data in enumerate(motors_data):
-                logger.debug(f"处理第 {i+1} 个电机数据，类型: {type(motor_data)}")
-                if hasattr(motor_data, 'to_dict'):
-                    formatted_motor_data = motor_data.to_dict()
-                    formatted_data.append(formatted_motor_data)
-                    logger.debug(f"电机 {motor_data.motor_id} 数据格式化成功")
-                else:
-                    logger.warning(f"电机数据对象缺少to_dict方法: {type(motor_data)}")
-                    continue
-            
-            if not formatted_data:
-                logger.warning("没有可广播的格式化数据")
-                return
-            
-            logger.debug(f"格式化完成，共 {len(formatted_data)} 条数据")
-            
-            # 创建新的事件循环
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            # 运行广播
-            loop.run_until_complete(self.websocket_server.broadcast_data(formatted_data))
-            
-            # 打印广播数据中所有电机的excitation_current_ratio值
-            # # logger.info("广播完成，电机excitation_current_ratio值:")
-            # for motor_data in motors_data:
-            #     # logger.info(f"电机 {motor_data.motor_id}: excitation_current_ratio = {motor_data.excitation_current_ratio:.2f}")
-            
-            
-        except Exception as e:
-            logger.error(f"广播数据失败: {str(e)}")
-            import traceback
-            logger.error(f"详细错误: {traceback.format_exc()}")
-        finally:
-            loop.close()
-    
     def update_motor_displays(self, motors_data):
         """更新电机显示"""
         try:
@@ -538,8 +434,8 @@ class MainUI:
         # 更新connection_status组件
         if self.is_connected:
             # 显示连接信息
-            if self.modbus_client:
-                info = self.modbus_client.get_connection_info()
+            if self.service and self.service.modbus_client:
+                info = self.service.modbus_client.get_connection_info()
                 self.connection_status.update_status(True, info)
         else:
             self.connection_status.update_status(False)
@@ -551,10 +447,6 @@ class MainUI:
         # 使用after确保在主线程中更新UI
         self.root.after(0, lambda: self.connection_status.update_websocket_client_count(count))
     
-    def get_latest_motors_data(self):
-        """获取最新电机数据（供WebSocket服务器使用）"""
-        return self.latest_motors_data
-    
     def run(self):
         """运行主UI"""
         # 运行主循环
@@ -567,11 +459,8 @@ class MainUI:
         try:
             self.stop_monitoring()
             
-            if self.modbus_client:
-                self.modbus_client.disconnect()
-            
-            if self.websocket_server:
-                self.websocket_server.stop()
+            if self.service:
+                self.service.stop()
             
             # 解绑鼠标滚轮事件
             try:
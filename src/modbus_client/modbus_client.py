@@ -8,6 +8,8 @@ import time
 # 添加上级目录到Python路径（必须在导入其他模块之前）
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from metrics import REGISTRY
+
 def load_config():
     """加载配置文件"""
     config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.json')
@@ -34,6 +36,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+POLL_SECONDS = REGISTRY.histogram('modbus_poll_duration_seconds', '一次完整Modbus轮询（所有电机）的耗时')
+POLL_ERRORS = REGISTRY.counter('modbus_poll_errors_total', '失败的Modbus轮询次数')
+
 class ModbusClient:
     """Modbus客户端，只负责与Modbus服务器通信"""
     
@@ -64,6 +69,7 @@ class ModbusClient:
 
     def request_motor_data(self):
         """请求电机数据，返回原始寄存器数据"""
+        started = time.perf_counter()
         try:
             # 读取保持寄存器数据 (每个电机9个浮点数，每个浮点数2个寄存器，总共18个寄存器)
             all_data = []
@@ -73,14 +79,17 @@ class ModbusClient:
                 result = self.client.read_holding_registers(start_addr, 18)
                 if result.isError():
                     logger.error(f"读取电机{i+1}数据错误: {result}")
+                    POLL_ERRORS.inc()
                     return None
                 all_data.extend(result.registers)
             
             # # logger.info(f"收到数据: {' '.join([f'{x:04X}' for x in all_data])}")
             
+            POLL_SECONDS.observe(time.perf_counter() - started)
             return all_data
         except Exception as e:
             logger.error(f"请求数据时出错: {str(e)}")
+            POLL_ERRORS.inc()
             return None
 
     def get_connection_info(self):
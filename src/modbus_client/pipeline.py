@@ -0,0 +1,151 @@
+"""
+分阶段采集管道
+
+采集、解码/计算、广播、入库各自运行在独立线程中，阶段之间用有界队列连接。
+每个队列满时按各自的背压策略处理，下游的阻塞（数据库fsync、慢客户端）不会推迟下一次轮询。
+"""
+
+import logging
+import sys
+import os
+import threading
+from collections import deque
+from typing import Any, Callable, List, Optional
+
+# 添加src目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# 背压策略
+BLOCK = 'block'              # 队列满时上游等待，不丢数据（入库）
+DROP_OLDEST = 'drop_oldest'  # 丢弃最旧的一项，保证最新数据能进入（计算、广播）
+CONFLATE = 'conflate'        # 只保留最新一项（界面刷新）
+POLICIES = (BLOCK, DROP_OLDEST, CONFLATE)
+
+
+class StageQueue:
+    """按背压策略处理溢出的有界队列，close()之后get()在取完剩余项后返回None"""
+
+    def __init__(self, maxsize: int, policy: str):
+        if policy not in POLICIES:
+            raise ValueError(f"未知的背压策略: {policy}")
+        self.policy = policy
+        self.maxsize = 1 if policy == CONFLATE else max(1, int(maxsize))
+        self.items = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item: Any) -> int:
+        """放入一项，返回因溢出被丢弃的项数；队列已关闭时直接丢弃"""
+        with self.condition:
+            if self.closed:
+                return 1
+            dropped = 0
+            if self.policy == BLOCK:
+                while len(self.items) >= self.maxsize and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return 1
+            else:
+                while len(self.items) >= self.maxsize:
+                    self.items.popleft()
+                    dropped += 1
+            self.items.append(item)
+            self.condition.notify_all()
+            return dropped
+
+    def get(self) -> Optional[Any]:
+        """取出一项，队列为空时等待"""
+        with self.condition:
+            while not self.items and not self.closed:
+                self.condition.wait()
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class Stage:
+    """
+    管道中的一个阶段：一个工作线程从输入队列取数据交给handler处理
+
+    指标（阶段名为name）:
+        pipeline_<name>_queue_depth       输入队列当前深度
+        pipeline_<name>_dropped_total     因背压策略丢弃的项数
+        pipeline_<name>_duration_seconds  handler处理一项的耗时
+        pipeline_<name>_errors_total      handler抛出异常的次数
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any], None], maxsize: int = 8, policy: str = DROP_OLDEST):
+        self.name = name
+        self.handler = handler
+        self.queue = StageQueue(maxsize, policy)
+        self.thread = None
+
+        prefix = f'pipeline_{name}'
+        REGISTRY.gauge(f'{prefix}_queue_depth', f'{name}阶段输入队列深度').set_function(lambda: len(self.queue))
+        self.dropped = REGISTRY.counter(f'{prefix}_dropped_total', f'{name}阶段因背压丢弃的项数')
+        self.duration = REGISTRY.histogram(f'{prefix}_duration_seconds', f'{name}阶段处理一项的耗时')
+        self.errors = REGISTRY.counter(f'{prefix}_errors_total', f'{name}阶段处理失败次数')
+
+    def submit(self, item: Any):
+        """交给本阶段处理，按队列的背压策略可能丢弃旧数据或等待"""
+        dropped = self.queue.put(item)
+        if dropped:
+            self.dropped.inc(dropped)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=f'pipeline-{self.name}', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """关闭输入队列，等待工作线程处理完剩余数据"""
+        self.queue.close()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                with self.duration.time():
+                    self.handler(item)
+            except Exception as e:
+                self.errors.inc()
+                logger.error(f"管道阶段 {self.name} 处理失败: {str(e)}")
+
+
+class Pipeline:
+    """按添加顺序排列的阶段集合，停止时从上游到下游依次排空"""
+
+    def __init__(self):
+        self.stages: List[Stage] = []
+
+    def add_stage(self, name: str, handler: Callable[[Any], None], maxsize: int = 8,
+                  policy: str = DROP_OLDEST) -> Stage:
+        stage = Stage(name, handler, maxsize, policy)
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        # 上游先停，剩余数据继续流入下游后下游再停
+        for stage in self.stages:
+            stage.stop(timeout)
@@ -0,0 +1,425 @@
+"""
+电机数据采集管道服务
+
+不依赖Tkinter，运行 轮询 → 解码/计算 → WebSocket广播 → 数据库 的完整管道，
+各阶段之间用有界队列连接（见pipeline.py）。
+Modbus客户端界面(main_ui.py)内部使用同一个服务；在机房服务器上可以无界面运行，
+操作员通过WebSocket客户端界面接入查看数据。
+
+用法:
+    python service.py [--config config.json]
+"""
+
+import argparse
+import copy
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from typing import Callable, List, Optional
+
+# 添加src目录和本目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modbus_client import ModbusClient
+from data_processor import DataProcessor, MotorData
+from websocket_server.websocket_server import WebSocketServer
+from websocket_server.edge_workers import EdgeWorkerPool
+from websocket_server.rest_server import RestServer
+from metrics import MetricsServer, REGISTRY
+from pipeline import Pipeline, BLOCK, CONFLATE, DROP_OLDEST
+from snapshot_store import SnapshotStore, DEFAULT_NAME as DEFAULT_SNAPSHOT_NAME
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+
+# 各阶段队列的默认容量和背压策略，可在config.json的pipeline节中覆盖
+DEFAULT_STAGES = {
+    'compute': {'maxsize': 4, 'policy': DROP_OLDEST},
+    'publish': {'maxsize': 16, 'policy': DROP_OLDEST},
+    'persist': {'maxsize': 600, 'policy': BLOCK},
+    'display': {'maxsize': 1, 'policy': CONFLATE},
+}
+
+POLL_OVERRUNS = REGISTRY.counter('pipeline_poll_overruns_total', '轮询耗时超过采集间隔的次数')
+
+
+def load_config(config_path: str = DEFAULT_CONFIG_PATH) -> dict:
+    """加载配置文件"""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class PipelineService:
+    """
+    采集管道服务
+
+    负责Modbus连接、监控循环、WebSocket/REST/指标服务和数据库写入，
+    同时作为WebSocket服务器的数据源（get_latest_motors_data/get_snapshot_version）。
+    采集线程只负责按固定节拍轮询，解码/计算、广播、入库、界面回调各有独立的阶段线程。
+    界面通过on_data回调接收电机数据，回调在display阶段线程中调用，只保证拿到最新一轮。
+    """
+
+    def __init__(self, config: dict, db_path: Optional[str] = None):
+        """
+        初始化管道服务
+
+        Args:
+            config: 配置字典（config.json的内容）
+            db_path: 数据库文件路径，默认使用config中database.path或本目录下的motor_data.db
+        """
+        self.config = config
+        self.db_path = db_path or config.get('database', {}).get('path') or \
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'motor_data.db')
+
+        self.modbus_client = None
+        self.websocket_server = None
+        self.rest_server = None
+        self.metrics_server = None
+        self.db_manager = None
+        self.db_writer = None
+        self.retention_task = None
+        self.data_processor = None
+        self.snapshot_store = None
+
+        # 状态变量
+        self.running = False
+        self.is_connected = False
+        self.is_monitoring = False
+        self.monitoring_thread = None
+        self.stop_event = threading.Event()
+        self.pipeline = None
+        self.stages = {}
+
+        # 最新数据缓存
+        self.latest_motors_data = []
+        self.snapshot_version = 0  # 每次新轮询递增，供WebSocket服务器判断缓存是否过期
+
+        # 回调函数
+        self.on_data: Optional[Callable[[List[MotorData]], None]] = None
+        self.on_client_count_changed: Optional[Callable[[int], None]] = None
+
+    def start_servers(self):
+        """初始化数据处理器、数据库以及WebSocket/REST/指标服务"""
+        motor_count = self.config['modbus']['motor_count']
+        self.data_processor = DataProcessor(motor_count)
+
+        # 共享内存实时快照，供其他线程或进程（导出、分析）按名称连接读取；
+        # 同名快照正被另一个运行中的服务使用时抛出FileExistsError，在启动其他组件之前拒绝启动
+        snapshot_config = self.config.get('snapshot', {})
+        if snapshot_config.get('enabled', 1):
+            self.snapshot_store = SnapshotStore(
+                name=snapshot_config.get('name', DEFAULT_SNAPSHOT_NAME),
+                motor_capacity=max(motor_count, 32), create=True
+            )
+
+        # 数据库（database.enabled开启时写入），写入由后台线程批量提交
+        db_config = self.config.get('database', {})
+        if db_config.get('enabled', 0):
+            from db.database import DatabaseManager, NUMERIC_FIELDS
+            from db.deadband import CompressionSpec
+            from db.writer import DatabaseWriter
+            layout = db_config.get('layout', 'row')
+            station = db_config.get('station', '')
+            partition = db_config.get('partition', '')
+            block_seconds = db_config.get('block_seconds', 0)
+            # 死区/旋转门压缩: 原始数据只写入在容差内重建信号所需的采样
+            compression = CompressionSpec.from_config(db_config.get('compression'), NUMERIC_FIELDS,
+                                                      self.config['auto_update']['interval'])
+            self.db_manager = DatabaseManager(self.db_path, layout=layout, station=station, partition=partition,
+                                              block_seconds=block_seconds)
+            self.db_writer = DatabaseWriter(
+                self.db_path,
+                batch_rows=db_config.get('batch_rows', 500),
+                flush_interval=db_config.get('flush_ms', 200) / 1000,
+                max_pending=db_config.get('max_pending', 6000),
+                layout=layout, station=station, partition=partition, compression=compression
+            )
+            self.db_writer.start()
+            self.db_submit_timeout = db_config.get('submit_timeout_ms', 1000) / 1000
+            # 后台数据保留：压缩已经结束的时间块、分批删除过期数据并增量回收空间
+            if db_config.get('retention_days', 0) > 0 or block_seconds > 0:
+                from db.retention import RetentionTask
+                self.retention_task = RetentionTask(
+                    self.db_manager, db_config.get('retention_days', 0),
+                    interval=db_config.get('retention_interval_s', 3600),
+                    batch_rows=db_config.get('retention_batch_rows', 2000),
+                    vacuum_pages=db_config.get('vacuum_pages', 128)
+                )
+                self.retention_task.start()
+
+        # WebSocket服务器
+        ws_config = self.config['websocket']
+        server_options = {
+            'write_high_water': ws_config.get('write_high_water', 1024 * 1024),
+            'replay_depth': ws_config.get('replay_depth', 600),
+            'replay_max_bytes': ws_config.get('replay_max_bytes', 8 * 1024 * 1024),
+            'history_points': ws_config.get('history_points', 3600),
+            'aggregate_bucket_seconds': ws_config.get('aggregate_bucket_seconds', 60),
+            'aggregate_buckets': ws_config.get('aggregate_buckets', 1440)
+        }
+        ws_workers = ws_config.get('workers', 0)
+        if ws_workers > 0:
+            # 多进程模式：快照写入共享内存，由工作进程在同一端口上扇出
+            self.websocket_server = EdgeWorkerPool(
+                host=ws_config['host'], port=ws_config['port'], workers=ws_workers,
+                motor_capacity=max(motor_count, 32), server_options=server_options, db_manager=self.db_manager
+            )
+        else:
+            self.websocket_server = WebSocketServer(
+                self, host=ws_config['host'], port=ws_config['port'], db_manager=self.db_manager, **server_options
+            )
+        self.websocket_server.set_client_count_changed_callback(self._on_client_count_changed)
+        self.websocket_server.start()
+
+        # REST服务，与WebSocket服务器共用快照缓存和历史存储
+        rest_config = self.config.get('rest', {})
+        if rest_config.get('enabled', 0):
+            if isinstance(self.websocket_server, WebSocketServer):
+                self.rest_server = RestServer(
+                    host=rest_config.get('host', '0.0.0.0'), port=rest_config.get('port', 8080),
+                    snapshot_cache=self.websocket_server.snapshot_cache,
+                    history=self.websocket_server.history
+                )
+            else:
+                # 多进程模式下主进程没有WebSocketServer，使用自己的快照缓存和工作进程池在主进程维护的历史存储
+                self.rest_server = RestServer(
+                    self, host=rest_config.get('host', '0.0.0.0'), port=rest_config.get('port', 8080),
+                    history=self.websocket_server.history, db_manager=self.db_manager
+                )
+            self.rest_server.start()
+
+        # 指标导出（Prometheus文本格式），默认只监听本机
+        metrics_config = self.config.get('metrics', {})
+        if metrics_config.get('enabled', 0):
+            self.metrics_server = MetricsServer(
+                host=metrics_config.get('host', '127.0.0.1'), port=metrics_config.get('port', 9100)
+            )
+            self.metrics_server.start()
+
+    def _on_client_count_changed(self, count):
+        if self.on_client_count_changed:
+            self.on_client_count_changed(count)
+
+    def set_client_count_changed_callback(self, callback):
+        """设置WebSocket客户端数量变化回调函数"""
+        self.on_client_count_changed = callback
+
+    def connect(self, host: str, port: int, motor_count: int) -> bool:
+        """连接Modbus服务器，返回是否成功"""
+        self.modbus_client = ModbusClient(host, port, motor_count)
+        self.is_connected = bool(self.modbus_client.connect())
+        return self.is_connected
+
+    def disconnect(self):
+        """断开Modbus连接（监控循环随之退出）"""
+        if self.modbus_client:
+            self.modbus_client.disconnect()
+        self.is_connected = False
+
+    def start_monitoring(self, interval: float) -> bool:
+        """启动管道各阶段和采集线程，未连接或已在监控时返回False"""
+        if not self.is_connected or self.is_monitoring:
+            return False
+        # 上一次监控的管道可能还在排空
+        if self.monitoring_thread and self.monitoring_thread.is_alive():
+            self.monitoring_thread.join()
+        self.pipeline = self._build_pipeline()
+        self.pipeline.start()
+        self.is_monitoring = True
+        self.stop_event.clear()
+        self.monitoring_thread = threading.Thread(target=self.monitoring_loop, args=(interval,), daemon=True)
+        self.monitoring_thread.start()
+        return True
+
+    def stop_monitoring(self):
+        """停止采集，管道在采集线程退出时排空（不阻塞调用方）"""
+        self.is_monitoring = False
+        self.stop_event.set()
+
+    def _build_pipeline(self) -> Pipeline:
+        """按配置创建 计算 → 广播/入库/界面 各阶段"""
+        stage_config = self.config.get('pipeline', {})
+        pipeline = Pipeline()
+
+        def add(name, handler):
+            options = dict(DEFAULT_STAGES[name], **stage_config.get(name, {}))
+            self.stages[name] = pipeline.add_stage(name, handler, options['maxsize'], options['policy'])
+
+        self.stages = {}
+        add('compute', self._compute)
+        if self.websocket_server:
+            add('publish', self._publish)
+        if self.db_writer:
+            add('persist', self._persist)
+        if self.on_data:
+            add('display', self._display)
+        return pipeline
+
+    def monitoring_loop(self, interval: float):
+        """采集循环：按固定节拍轮询，原始寄存器数据交给compute阶段"""
+        next_poll = time.monotonic()
+        try:
+            while self.is_monitoring and self.is_connected:
+                try:
+                    poll_start = time.time()
+                    raw_data = self.modbus_client.request_motor_data()
+                    poll_end = time.time()
+                    if raw_data:
+                        self.stages['compute'].submit((raw_data, poll_start, poll_end))
+                except Exception as e:
+                    logger.error(f"监控循环错误: {str(e)}")
+
+                # 节拍以开始时间计算，处理耗时不累积到间隔里；超时则从现在重新计时
+                next_poll += interval
+                delay = next_poll - time.monotonic()
+                if delay < 0:
+                    POLL_OVERRUNS.inc()
+                    next_poll = time.monotonic()
+                    delay = 0
+                if self.stop_event.wait(delay):
+                    break
+        finally:
+            self.is_monitoring = False
+            self.pipeline.stop()
+
+    def _compute(self, item):
+        """compute阶段：解码和励磁电流计算，结果分发给下游阶段"""
+        raw_data, poll_start, poll_end = item
+        motors_data = self.data_processor.process_motor_data(raw_data)
+        if not motors_data:
+            return
+        # 数据处理器复用MotorData对象，下游阶段拿到的是本轮的副本
+        motors_data = [copy.copy(motor) for motor in motors_data]
+
+        # 开启延迟追踪时，链路时间戳随消息下发给客户端
+        trace = None
+        if self.config['websocket'].get('trace', 0):
+            trace = dict(self.data_processor.last_trace, poll_start=poll_start, poll_end=poll_end)
+
+        # 更新最新数据缓存
+        self.latest_motors_data = motors_data
+        self.snapshot_version += 1
+        if self.snapshot_store:
+            self.snapshot_store.publish(motors_data)
+
+        for name in ('publish', 'persist', 'display'):
+            stage = self.stages.get(name)
+            if stage:
+                stage.submit((motors_data, trace) if name == 'publish' else motors_data)
+
+    def _publish(self, item):
+        """publish阶段：publish只把数据交给服务器自己的事件循环（或共享内存环）"""
+        motors_data, trace = item
+        self.websocket_server.publish([motor.to_dict() for motor in motors_data], trace=trace)
+
+    def _persist(self, motors_data):
+        """
+        persist阶段：交给后台写入线程，队列满时最多等待database.submit_timeout_ms（背压传回compute阶段），
+        超时丢弃这一轮，数据库故障不会卡住实时发布
+        """
+        self.db_writer.submit(motors_data, timeout=self.db_submit_timeout)
+
+    def _display(self, motors_data):
+        """display阶段：通知界面"""
+        if self.on_data:
+            self.on_data(motors_data)
+
+    def run_forever(self, reconnect_interval: float = 5):
+        """
+        无界面运行：连接Modbus服务器并持续监控，连接断开后自动重连，直到stop()被调用
+        """
+        modbus_config = self.config['modbus']
+        interval = self.config['auto_update']['interval']
+        self.running = True
+        while self.running:
+            if not self.is_connected:
+                try:
+                    if self.connect(modbus_config['host'], modbus_config['port'], modbus_config['motor_count']):
+                        logger.info(f"Modbus连接成功: {modbus_config['host']}:{modbus_config['port']}")
+                except Exception as e:
+                    logger.error(f"连接Modbus失败: {str(e)}")
+                if not self.is_connected:
+                    time.sleep(reconnect_interval)
+                    continue
+            if not self.is_monitoring:
+                self.start_monitoring(interval)
+            elif not self.modbus_client.is_connected():
+                logger.warning("Modbus连接已断开，准备重连")
+                self._join_monitoring()
+                self.disconnect()
+                continue
+            time.sleep(1)
+
+    def _join_monitoring(self, timeout: float = 30):
+        """停止采集并等待管道排空（剩余数据写入数据库）"""
+        self.stop_monitoring()
+        if self.monitoring_thread and self.monitoring_thread is not threading.current_thread():
+            self.monitoring_thread.join(timeout)
+
+    def get_latest_motors_data(self):
+        """获取最新电机数据（供WebSocket服务器使用）"""
+        return self.latest_motors_data
+
+    def get_snapshot_version(self):
+        """获取最新快照版本号（供WebSocket服务器使用）"""
+        return self.snapshot_version
+
+    def stop(self):
+        """停止监控并关闭所有服务"""
+        self.running = False
+        self._join_monitoring()
+        if self.modbus_client:
+            self.modbus_client.disconnect()
+        if self.retention_task:
+            self.retention_task.stop()
+        if self.db_writer:
+            self.db_writer.stop()
+        if self.websocket_server:
+            self.websocket_server.stop()
+        if self.rest_server:
+            self.rest_server.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if self.snapshot_store:
+            self.snapshot_store.close()
+            self.snapshot_store = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='电机数据采集管道服务（无界面）')
+    parser.add_argument('--config', default=DEFAULT_CONFIG_PATH, help='配置文件路径')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    service = PipelineService(load_config(args.config))
+
+    # systemd停止服务时发送SIGTERM
+    def handle_signal(signum, frame):
+        logger.info("收到停止信号，正在关闭服务")
+        service.running = False
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    service.start_servers()
+    ws_config = service.config['websocket']
+    logger.info(f"采集服务已启动，WebSocket: ws://{ws_config['host']}:{ws_config['port']}")
+    try:
+        service.run_forever()
+    finally:
+        service.stop()
+        logger.info("采集服务已停止")
+
+
+if __name__ == '__main__':
+    main()
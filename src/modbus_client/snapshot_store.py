@@ -0,0 +1,241 @@
+"""
+共享内存实时快照
+
+采集管道每轮把最新数据写入共享内存中的双缓冲区，同进程的其他线程或其他进程（导出、分析）
+按名称连接后直接读取NumPy视图，不复制、不加锁，也不需要接触采集线程。
+
+用法（在另一个进程中查看最新快照）:
+    python snapshot_store.py [--name motor_snapshot]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 添加src目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from websocket_server.snapshot_ring import SNAPSHOT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAME = 'motor_snapshot'
+
+# 每行的列，顺序即共享内存中的列顺序: motor_id + 数值字段 + last_update(epoch秒)
+COLUMNS = ['motor_id'] + SNAPSHOT_FIELDS + ['last_update']
+COLUMN_INDEX = {name: i for i, name in enumerate(COLUMNS)}
+
+FORMAT_VERSION = 1
+
+# 头部(uint64): 最新序号, 每个缓冲区的电机容量, 格式版本, 创建者进程号
+_HEADER_SIZE = 4 * 8
+# 每个缓冲区: 序列锁(uint64), 电机数量(uint64), 发布时间(float64)
+_META_OFFSET = _HEADER_SIZE
+_ROWS_OFFSET = _META_OFFSET + 3 * 2 * 8
+
+# 本进程创建的共享内存名称
+_OWNED_NAMES = set()
+
+
+def _pid_alive(pid: int) -> bool:
+    """进程是否仍在运行（0表示未记录创建者）"""
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # 其他用户的进程
+    return True
+
+
+class SnapshotStore:
+    """
+    双缓冲的共享内存快照
+
+    第seq次发布写入缓冲区seq % 2，写入期间该缓冲区的序列锁为奇数(2*seq-1)，写完为偶数(2*seq)，
+    最后更新头部序号。读者拿到的视图在下下次发布开始前保持不变，用validate(seq)确认，写者从不等待读者。
+    只允许一个写者（采集管道的compute阶段）。
+    """
+
+    def __init__(self, name: Optional[str] = DEFAULT_NAME, motor_capacity: int = 32, create: bool = False):
+        """
+        创建或连接共享内存快照
+
+        Args:
+            name: 共享内存名称
+            motor_capacity: 每个快照最多容纳的电机数量（连接已有快照时从头部读取）
+            create: True表示新建，False表示连接已有快照。
+                    同名共享内存的创建者进程已经退出时视为残留并替换；创建者仍在运行时抛出FileExistsError
+        """
+        if create:
+            size = _ROWS_OFFSET + 2 * motor_capacity * len(COLUMNS) * 8
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                stale = shared_memory.SharedMemory(name=name)
+                owner = int(np.ndarray((4,), dtype=np.uint64, buffer=stale.buf)[3]) if stale.size >= _HEADER_SIZE else 0
+                stale.close()
+                if _pid_alive(owner):
+                    raise FileExistsError(f"共享内存 {name} 正被进程 {owner} 使用，"
+                                          f"同一台机器上的多个采集服务须使用不同的snapshot.name")
+                # 上次异常退出残留的共享内存
+                logger.warning(f"共享内存 {name} 已存在（创建者进程 {owner} 已退出），重新创建")
+                stale.unlink()
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self.shm.buf[:size] = bytes(size)
+            _OWNED_NAMES.add(self.shm.name)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # 其他进程连接时，退出时不能让resource_tracker释放创建者的共享内存
+            if self.shm.name not in _OWNED_NAMES:
+                try:
+                    resource_tracker.unregister(self.shm._name, 'shared_memory')
+                except Exception:
+                    pass
+        self.owner = create
+
+        buf = self.shm.buf
+        self._header = np.ndarray((4,), dtype=np.uint64, buffer=buf)
+        if create:
+            self._header[1] = motor_capacity
+            self._header[2] = FORMAT_VERSION
+            self._header[3] = os.getpid()
+        elif int(self._header[2]) != FORMAT_VERSION:
+            raise ValueError(f"未知的共享内存快照格式版本: {int(self._header[2])}")
+        self.motor_capacity = int(self._header[1])
+        self._locks = np.ndarray((2,), dtype=np.uint64, buffer=buf, offset=_META_OFFSET)
+        self._counts = np.ndarray((2,), dtype=np.uint64, buffer=buf, offset=_META_OFFSET + 16)
+        self._published = np.ndarray((2,), dtype=np.float64, buffer=buf, offset=_META_OFFSET + 32)
+        self._rows = np.ndarray((2, self.motor_capacity, len(COLUMNS)), dtype=np.float64,
+                                buffer=buf, offset=_ROWS_OFFSET)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def sequence(self) -> int:
+        """最新已发布快照的序号，0表示还没有数据"""
+        return int(self._header[0])
+
+    def publish(self, motors_data: List[Any]) -> int:
+        """
+        写入一帧快照
+
+        Args:
+            motors_data: MotorData对象或字典列表
+
+        Returns:
+            本帧的序号
+        """
+        seq = self.sequence + 1
+        index = seq % 2
+        rows = self._rows[index]
+        self._locks[index] = 2 * seq - 1  # 奇数：写入中
+        count = 0
+        for motor in motors_data[:self.motor_capacity]:
+            values = motor if isinstance(motor, dict) else vars(motor)
+            rows[count, :-1] = [values.get('motor_id', 0)] + [values.get(field) or 0.0 for field in SNAPSHOT_FIELDS]
+            last_update = values.get('last_update')
+            rows[count, -1] = last_update.timestamp() if hasattr(last_update, 'timestamp') else 0.0
+            count += 1
+        self._counts[index] = count
+        self._published[index] = time.time()
+        self._locks[index] = 2 * seq  # 偶数：写入完成
+        self._header[0] = seq
+        return seq
+
+    def view(self, retries: int = 5) -> Optional[Tuple[int, np.ndarray]]:
+        """
+        最新快照的零拷贝视图
+
+        Returns:
+            (序号, rows)，rows形状为(电机数量, len(COLUMNS))；没有数据时返回None。
+            rows直接指向共享内存，用完后调用validate(序号)确认期间没有被覆盖，否则重新读取
+        """
+        for _ in range(retries):
+            seq = self.sequence
+            if seq == 0:
+                return None
+            index = seq % 2
+            if self._locks[index] != 2 * seq:
+                continue
+            rows = self._rows[index, :int(self._counts[index])]
+            if self._locks[index] == 2 * seq:
+                return seq, rows
+        return None
+
+    def validate(self, seq: int) -> bool:
+        """序号为seq的缓冲区是否仍未被覆盖"""
+        return int(self._locks[seq % 2]) == 2 * seq
+
+    def read(self, retries: int = 5) -> Optional[Tuple[int, float, np.ndarray]]:
+        """读取最新快照的一致副本，返回(序号, 发布时间, rows)；没有数据或一直读到写入中时返回None"""
+        for _ in range(retries):
+            snapshot = self.view()
+            if snapshot is None:
+                return None
+            seq, rows = snapshot
+            rows = rows.copy()
+            published_at = float(self._published[seq % 2])
+            if self.validate(seq):
+                return seq, published_at, rows
+        return None
+
+    def read_dicts(self) -> Optional[Tuple[int, List[Dict[str, Any]]]]:
+        """读取最新快照并转换为电机数据字典（last_update为epoch秒）"""
+        snapshot = self.read()
+        if snapshot is None:
+            return None
+        seq, _, rows = snapshot
+        motors = []
+        for row in rows.tolist():
+            motor = dict(zip(COLUMNS, row))
+            motor['motor_id'] = int(motor['motor_id'])
+            motors.append(motor)
+        return seq, motors
+
+    def close(self):
+        """断开共享内存，创建者同时释放"""
+        # 先释放NumPy视图，否则共享内存无法关闭
+        self._header = self._locks = self._counts = self._published = self._rows = None
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+                _OWNED_NAMES.discard(self.shm.name)
+        except Exception as e:
+            logger.error(f"释放共享内存失败: {str(e)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='查看共享内存中的最新电机快照')
+    parser.add_argument('--name', default=DEFAULT_NAME, help='共享内存名称')
+    args = parser.parse_args()
+
+    store = SnapshotStore(name=args.name)
+    try:
+        snapshot = store.read()
+        if snapshot is None:
+            print("共享内存中还没有数据")
+            return
+        seq, published_at, rows = snapshot
+        print(f"序号 {seq}，发布于 {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(published_at))}")
+        columns = ['motor_id', 'excitation_current', 'calculated_excitation_current', 'excitation_current_ratio']
+        print(''.join(f'{column:>32}' for column in columns))
+        for row in rows:
+            print(''.join(f'{row[COLUMN_INDEX[column]]:>32.3f}' for column in columns))
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -15,7 +15,8 @@ class WebSocketConfig:
         self.default_config = {
             "websocket": {
                 "host": "localhost",
-                "port": 8765
+                "port": 8765,
+                "max_rate": 0
             },
             "database": {
                 "path": "motor_data.db"
@@ -23,7 +24,9 @@ class WebSocketConfig:
             "ui": {
                 "auto_connect": False,
                 "auto_reconnect": True,
-                "reconnect_interval": 5
+                "reconnect_interval": 5,
+                "history_minutes": 10,
+                "history_max_points": 200
             }
         }
         self.config = self.load_config()
@@ -102,10 +105,9 @@ class WebSocketConfig:
     def set_websocket_config(self, host: str, port: int) -> bool:
         """设置WebSocket配置"""
         try:
-            self.config["websocket"] = {
-                "host": host,
-                "port": port
-            }
+            websocket_config = self.config.setdefault("websocket", {})
+            websocket_config["host"] = host
+            websocket_config["port"] = port
             return self.save_config()
         except Exception as e:
             logger.error(f"设置WebSocket配置失败: {str(e)}")
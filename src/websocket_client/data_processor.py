@@ -53,6 +53,10 @@ class DataProcessor:
         self.on_data_updated = None
         # 新增：历史数据缓存
         self.motors_history: Dict[int, deque] = {}
+        # 服务器历史查询：request_id -> 已收到的采样点
+        self.history_requests: Dict[Any, List[MotorData]] = {}
+        self.on_history_loaded = None
+        self.on_aggregate_result = None
         
         # logger.info("数据处理器初始化完成")
     
@@ -60,6 +64,14 @@ class DataProcessor:
         """设置数据更新回调函数"""
         self.on_data_updated = callback
     
+    def set_history_loaded_callback(self, callback):
+        """设置服务器历史数据加载完成回调函数，参数为(motor_id, MotorData列表)"""
+        self.on_history_loaded = callback
+    
+    def set_aggregate_result_callback(self, callback):
+        """设置窗口聚合查询结果回调函数，参数为aggregate_result消息"""
+        self.on_aggregate_result = callback
+    
     def _append_history(self, motor_id, motor_data):
         """添加数据到历史记录"""
         if motor_id not in self.motors_history:
@@ -82,8 +94,23 @@ class DataProcessor:
                 return self._process_motor_update(message)
             elif message_type == "latest_data":
                 return self._process_latest_data(message)
+            elif message_type == "resume_batch":
+                return self._process_resume_batch(message)
+            elif message_type == "history_chunk":
+                return self._process_history_chunk(message)
+            elif message_type == "history_end":
+                return self._process_history_end(message)
+            elif message_type == "aggregate_result":
+                if self.on_aggregate_result:
+                    self.on_aggregate_result(message)
+                return None
+            elif message_type == "error":
+                logger.error(f"服务器返回错误: {message.get('message')}")
+                return None
             elif message_type == "status":
                 return self._process_status_message(message)
+            elif message_type in ("hello_ack", "pong"):
+                return self._process_status_message(message)
             else:
                 logger.warning(f"未知消息类型: {message_type}")
                 return None
@@ -389,6 +416,56 @@ class DataProcessor:
             logger.error(f"处理最新数据失败: {str(e)}")
             return []
     
+    def _process_resume_batch(self, message: Dict[str, Any]) -> List[MotorData]:
+        """处理断线重连后的补发批次，按时间顺序逐条应用错过的更新"""
+        try:
+            updates = message.get("updates", [])
+            replayed = []
+            
+            # logger.info(f"补发 {len(updates)} 条更新: {message.get('from_seq')} -> {message.get('to_seq')}")
+            
+            for update in updates:
+                # 电机对象会被后续更新覆盖，保存每一条的副本以便趋势图逐点绘制
+                for motor in self._process_motor_update(update):
+                    replayed.append(copy.copy(motor))
+            
+            return replayed
+            
+        except Exception as e:
+            logger.error(f"处理补发批次失败: {str(e)}")
+            return []
+    
+    def _process_history_chunk(self, message: Dict[str, Any]) -> None:
+        """处理历史查询的一个分块，累积到对应请求中（不触发实时显示）"""
+        try:
+            motor_id = message.get("motor_id")
+            columns = message.get("columns", [])
+            history = self.history_requests.setdefault(message.get("request_id"), [])
+            
+            for point in message.get("points", []):
+                motor = MotorData(motor_id=motor_id)
+                for field, value in zip(columns, point):
+                    if field == "timestamp":
+                        motor.last_update = datetime.fromisoformat(value)
+                    elif hasattr(motor, field) and value is not None:
+                        setattr(motor, field, value)
+                history.append(motor)
+            
+        except Exception as e:
+            logger.error(f"处理历史数据分块失败: {str(e)}")
+        return None
+    
+    def _process_history_end(self, message: Dict[str, Any]) -> None:
+        """历史查询结束，回调完整的历史序列"""
+        try:
+            history = self.history_requests.pop(message.get("request_id"), [])
+            # logger.info(f"电机 {message.get('motor_id')} 历史数据加载完成，共 {len(history)} 个点，来源: {message.get('source')}")
+            if self.on_history_loaded:
+                self.on_history_loaded(message.get("motor_id"), history)
+        except Exception as e:
+            logger.error(f"处理历史数据结束消息失败: {str(e)}")
+        return None
+    
     def _process_status_message(self, message: Dict[str, Any]) -> List[MotorData]:
         """处理状态消息"""
         try:
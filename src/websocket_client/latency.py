@@ -0,0 +1,94 @@
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from metrics.registry import Histogram
+
+logger = logging.getLogger(__name__)
+
+# 链路上的时间戳（epoch秒），顺序即数据流经的顺序
+TRACE_POINTS = ['poll_start', 'poll_end', 'decode_end', 'calc_end', 'enqueue', 'send', 'receive', 'render']
+
+# 各阶段: (名称, 起点, 终点, 说明)
+STAGES = [
+    ('poll', 'poll_start', 'poll_end', 'Modbus轮询'),
+    ('decode', 'poll_end', 'decode_end', '寄存器解码'),
+    ('calc', 'decode_end', 'calc_end', '励磁电流计算'),
+    ('handoff', 'calc_end', 'enqueue', '交给广播线程'),
+    ('publish', 'enqueue', 'send', '服务器排队和序列化'),
+    ('network', 'send', 'receive', '网络传输'),
+    ('render', 'receive', 'render', '客户端处理和界面刷新'),
+    ('total', 'poll_start', 'render', '端到端'),
+]
+
+# 分桶上限（秒），比默认分桶更细，覆盖亚毫秒级的解码到秒级的轮询间隔
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LatencyTracker:
+    """
+    端到端延迟统计
+
+    服务器开启链路追踪后，每条motor_update携带trace时间戳；客户端补上receive和render，
+    按相邻时间戳之差累加到各阶段的固定分桶直方图。
+    network阶段跨越两台机器，两端时钟不同步时会出现偏差（甚至为负）。
+    """
+
+    def __init__(self):
+        self.histograms = {name: Histogram(f'latency_{name}_seconds', label, LATENCY_BUCKETS)
+                           for name, _, _, label in STAGES}
+        self.maximums: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def record(self, trace: Dict[str, Any]):
+        """记录一条消息的链路时间戳，缺少的时间戳对应的阶段跳过"""
+        with self.lock:
+            for name, begin, end, _ in STAGES:
+                if name == 'total' and 'render' not in trace:
+                    end = 'receive'  # 命令行工具没有界面刷新
+                if begin in trace and end in trace:
+                    duration = trace[end] - trace[begin]
+                    self.histograms[name].observe(duration)
+                    if duration > self.maximums.get(name, float('-inf')):
+                        self.maximums[name] = duration
+
+    def reset(self):
+        with self.lock:
+            for histogram in self.histograms.values():
+                histogram.reset()
+            self.maximums.clear()
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """各阶段的样本数、均值和分位数（毫秒）"""
+        rows = []
+        with self.lock:
+            for name, _, _, label in STAGES:
+                histogram = self.histograms[name]
+                if not histogram.count:
+                    continue
+                maximum = self.maximums[name]
+                # 分桶插值可能超过实际最大值，以最大值为上限
+                rows.append({
+                    'stage': name,
+                    'label': label,
+                    'count': histogram.count,
+                    'mean_ms': histogram.sum / histogram.count * 1000,
+                    'p50_ms': min(histogram.quantile(0.5), maximum) * 1000,
+                    'p95_ms': min(histogram.quantile(0.95), maximum) * 1000,
+                    'p99_ms': min(histogram.quantile(0.99), maximum) * 1000,
+                    'max_ms': maximum * 1000,
+                })
+        return rows
+
+    def report(self) -> Optional[str]:
+        """格式化的延迟报告文本，没有样本时返回None"""
+        rows = self.summary()
+        if not rows:
+            return None
+        # 中文表头每个字占两列，按显示宽度补齐
+        lines = [f"{'阶段':<10}{'样本':>6}{'均值ms':>8}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}{'最大ms':>8}  说明"]
+        for row in rows:
+            lines.append(f"{row['stage']:<12}{row['count']:>8}{row['mean_ms']:>10.2f}{row['p50_ms']:>10.2f}"
+                         f"{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['max_ms']:>10.2f}  {row['label']}")
+        return '\n'.join(lines)
@@ -0,0 +1,73 @@
+"""
+端到端延迟报告命令行工具
+
+连接WebSocket服务器，收集若干条携带链路时间戳的motor_update，按阶段输出延迟分布。
+需要在Modbus客户端的config.json中开启websocket.trace。
+
+用法:
+    python latency_report.py --host localhost --port 8765 --samples 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import websockets
+
+# 添加src目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from latency import LatencyTracker
+
+
+async def collect(host: str, port: int, samples: int, timeout: float) -> LatencyTracker:
+    """接收samples条带trace的更新，超时后返回已收集的结果"""
+    tracker = LatencyTracker()
+    received = 0
+    deadline = time.monotonic() + timeout
+    async with websockets.connect(f"ws://{host}:{port}") as websocket:
+        while received < samples:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                message = await asyncio.wait_for(websocket.recv(), remaining)
+            except asyncio.TimeoutError:
+                break
+            received_at = time.time()
+            if isinstance(message, bytes):
+                continue
+            data = json.loads(message)
+            trace = data.get('trace')
+            if data.get('type') != 'motor_update' or not isinstance(trace, dict):
+                continue
+            trace['receive'] = received_at
+            tracker.record(trace)
+            received += 1
+            print(f"\r已收集 {received}/{samples}", end='', flush=True)
+    print()
+    return tracker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端到端延迟报告')
+    parser.add_argument('--host', default='localhost', help='WebSocket服务器地址')
+    parser.add_argument('--port', type=int, default=8765, help='WebSocket服务器端口')
+    parser.add_argument('--samples', type=int, default=100, help='收集的更新条数')
+    parser.add_argument('--timeout', type=float, default=300, help='最长等待时间（秒）')
+    args = parser.parse_args()
+
+    tracker = asyncio.run(collect(args.host, args.port, args.samples, args.timeout))
+    report = tracker.report()
+    if report is None:
+        print("没有收到带链路时间戳的更新，请确认Modbus客户端已开启websocket.trace")
+        return
+    print(report)
+    print("\n注: network阶段依赖服务器与本机时钟同步；命令行工具没有界面刷新，total截止到receive")
+
+
+if __name__ == '__main__':
+    main()
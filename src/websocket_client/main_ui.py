@@ -17,6 +17,7 @@ from config import WebSocketConfig
 from websocket_client import WebSocketClient
 from data_processor import DataProcessor, MotorData
 from top_menu import WebSocketTopMenu
+from latency import LatencyTracker
 # from db.database import DatabaseManager
 from ui.data_display import MotorDataDisplay
 from ui.chart_display import MotorChartDisplay
@@ -40,6 +41,7 @@ class WebSocketClientUI:
         self.config = WebSocketConfig()
         self.websocket_client = None
         self.data_processor = DataProcessor()
+        self.latency_tracker = LatencyTracker()  # 服务器开启延迟追踪时统计各阶段耗时
         
         # 使用配置中的数据库路径
         # db_config = self.config.get_database_config()
@@ -80,7 +82,8 @@ class WebSocketClientUI:
             self.config.config,
             on_save_config=self.on_save_config,
             on_connect=self.on_connect,
-            on_disconnect=self.on_disconnect
+            on_disconnect=self.on_disconnect,
+            on_latency_report=self.show_latency_report
         )
         
         # 创建主要内容区域
@@ -163,6 +166,7 @@ class WebSocketClientUI:
         """设置回调函数"""
         # 数据处理器回调
         self.data_processor.set_data_updated_callback(self.on_data_updated)
+        self.data_processor.set_history_loaded_callback(self.on_history_loaded)
     
     def connect_to_websocket(self, host: str, port: int):
         """连接到WebSocket服务器"""
@@ -179,8 +183,9 @@ class WebSocketClientUI:
             # 启动数据处理线程
             self.start_data_thread()
             
-            # 创建WebSocket客户端
-            self.websocket_client = WebSocketClient(host, port)
+            # 创建WebSocket客户端（max_rate为0表示接收每一次轮询）
+            max_rate = self.config.get_websocket_config().get("max_rate") or None
+            self.websocket_client = WebSocketClient(host, port, max_rate=max_rate)
             
             # 设置回调函数
             self.websocket_client.set_callbacks(
@@ -233,8 +238,12 @@ class WebSocketClientUI:
                 # 检查UI更新队列
                 while True:
                     try:
-                        updated_motors = self.ui_update_queue.get_nowait()
+                        updated_motors, trace = self.ui_update_queue.get_nowait()
                         self.update_current_tab_only(updated_motors)
+                        if trace:
+                            # 界面控件更新完成的时间作为render时间戳
+                            trace['render'] = time.time()
+                            self.latency_tracker.record(trace)
                     except queue.Empty:
                         break
             except Exception as e:
@@ -380,12 +389,43 @@ class WebSocketClientUI:
             # 直接处理数据，不放入队列
             updated_motors = self.data_processor.process_websocket_message(message)
             if updated_motors:
-                # 将更新放入UI队列
-                self.ui_update_queue.put(updated_motors)
+                # 将更新放入UI队列，实时更新携带链路时间戳（补发批次不参与延迟统计）
+                trace = message.get('trace') if message.get('type') == 'motor_update' else None
+                self.ui_update_queue.put((updated_motors, trace))
                 
         except Exception as e:
             logger.error(f"WebSocket消息处理失败: {str(e)}")
     
+    def show_latency_report(self):
+        """显示端到端延迟报告窗口"""
+        report = self.latency_tracker.report()
+        if report is None:
+            messagebox.showinfo("延迟报告", "暂无延迟数据，请在Modbus客户端配置中开启websocket.trace")
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title("端到端延迟报告")
+        text = tk.Text(window, font=('Courier', 10), width=100, height=12)
+        text.pack(fill='both', expand=True, padx=5, pady=5)
+        text.insert('1.0', report)
+        text.config(state='disabled')
+        
+        button_frame = ttk.Frame(window)
+        button_frame.pack(fill='x', padx=5, pady=(0, 5))
+        
+        def refresh():
+            text.config(state='normal')
+            text.delete('1.0', 'end')
+            text.insert('1.0', self.latency_tracker.report() or '')
+            text.config(state='disabled')
+        
+        def reset():
+            self.latency_tracker.reset()
+            refresh()
+        
+        ttk.Button(button_frame, text="刷新", command=refresh).pack(side='left', padx=(0, 8))
+        ttk.Button(button_frame, text="重置", command=reset).pack(side='left')
+    
     def on_websocket_error(self, error: str):
         """WebSocket错误回调"""
         logger.error(f"WebSocket错误: {error}")
@@ -546,12 +586,44 @@ class WebSocketClientUI:
                                 self.bar_charts[motor_id].update_value(
                                     latest_data.average_excitation_current_ratio * 100
                                 )
+                
+                # 向服务器请求更长的历史趋势，返回后替换本地缓存的最近20条
+                self.request_motor_history(motor_id)
                         
         except Exception as e:
             logger.error(f"tab切换刷新数据失败: {str(e)}")
             import traceback
             logger.error(f"详细错误: {traceback.format_exc()}")
     
+    def request_motor_history(self, motor_id: int):
+        """向服务器请求指定电机最近一段时间的历史趋势（服务器端降采样）"""
+        if not self.websocket_client or not self.is_connected:
+            return
+        
+        ui_config = self.config.get_ui_config()
+        minutes = ui_config.get("history_minutes", 10)
+        end_time = datetime.now()
+        self.websocket_client.send_message_threadsafe({
+            "type": "history",
+            "request_id": f"{motor_id}-{end_time.timestamp()}",
+            "motor_id": motor_id,
+            "start": end_time.timestamp() - minutes * 60,
+            "end": end_time.timestamp(),
+            "fields": ["excitation_current_ratio", "average_excitation_current_ratio"],
+            "max_points": ui_config.get("history_max_points", 200)
+        })
+    
+    def on_history_loaded(self, motor_id: int, history: List[MotorData]):
+        """服务器历史数据加载完成回调（在WebSocket线程中调用）"""
+        if not history:
+            return
+        
+        def apply():
+            if motor_id in self.motor_charts:
+                self.motor_charts[motor_id].set_data_history(history)
+        
+        self.root.after(0, apply)
+    
     def run(self):
         """运行主程序"""
         try:
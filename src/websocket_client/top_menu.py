@@ -7,7 +7,8 @@ logger = logging.getLogger(__name__)
 class WebSocketTopMenu:
     """WebSocket客户端顶部配置菜单组件"""
     
-    def __init__(self, parent, config, on_save_config=None, on_connect=None, on_disconnect=None):
+    def __init__(self, parent, config, on_save_config=None, on_connect=None, on_disconnect=None,
+                 on_latency_report=None):
         """
         初始化顶部菜单
         
@@ -17,12 +18,14 @@ class WebSocketTopMenu:
             on_save_config: 保存配置回调函数
             on_connect: 连接回调函数
             on_disconnect: 断开连接回调函数
+            on_latency_report: 查看延迟报告回调函数
         """
         self.parent = parent
         self.config = config
         self.on_save_config = on_save_config
         self.on_connect = on_connect
         self.on_disconnect = on_disconnect
+        self.on_latency_report = on_latency_report
         
         # 创建UI变量
         self.ws_host_var = tk.StringVar(value=config['websocket']['host'])
@@ -61,6 +64,9 @@ class WebSocketTopMenu:
         self.disconnect_btn = ttk.Button(button_frame, text="断开", command=self._on_disconnect, state='normal')
         self.disconnect_btn.pack(side='left', padx=(0, 8))
         
+        self.latency_btn = ttk.Button(button_frame, text="延迟报告", command=self._on_latency_report)
+        self.latency_btn.pack(side='left', padx=(0, 8))
+        
         # 连接状态显示
         self.status_label = ttk.Label(button_frame, text="未连接", foreground="red")
         self.status_label.pack(side='right', padx=(0, 10))
@@ -80,6 +86,11 @@ class WebSocketTopMenu:
         if self.on_disconnect:
             self.on_disconnect()
     
+    def _on_latency_report(self):
+        """延迟报告回调"""
+        if self.on_latency_report:
+            self.on_latency_report()
+    
     def get_config_values(self):
         """获取配置值"""
         return {
@@ -12,11 +12,18 @@ logger = logging.getLogger(__name__)
 class WebSocketClient:
     """WebSocket客户端"""
     
-    def __init__(self, host: str = "localhost", port: int = 8765):
+    def __init__(self, host: str = "localhost", port: int = 8765, max_rate: Optional[float] = None):
         self.host = host
         self.port = port
         self.uri = f"ws://{host}:{port}"
         
+        # 期望的最大更新速率（次/秒），None表示接收每一次轮询
+        self.max_rate = max_rate
+        
+        # 最后收到的广播序号及其所属的服务器实例，重连后据此请求补发错过的更新
+        self.last_seq: Optional[int] = None
+        self.epoch: Optional[str] = None
+        
         # 连接状态
         self.is_connected = False
         self.is_connecting = False
@@ -145,6 +152,14 @@ class WebSocketClient:
             
             # logger.info("WebSocket连接成功")
             
+            # 握手：告知服务器本客户端需要的最大更新速率
+            if self.max_rate:
+                await self.send_message({'type': 'hello', 'max_rate': self.max_rate})
+            
+            # 重连：请求补发断线期间错过的更新
+            if self.last_seq is not None:
+                await self.send_message({'type': 'resume', 'last_seq': self.last_seq, 'epoch': self.epoch})
+            
             if self.on_connect:
                 self.on_connect()
                 
@@ -161,11 +176,22 @@ class WebSocketClient:
                     # logger.info("收到停止信号，退出消息监听")
                     break
                 
+                received_at = time.time()
                 try:
                     # 解析JSON消息
                     data = json.loads(message)
                     logger.debug(f"收到消息: {data}")
                     
+                    # 服务器开启延迟追踪时补上接收时间戳
+                    if isinstance(data.get('trace'), dict):
+                        data['trace']['receive'] = received_at
+                    
+                    # 记录最新序号（补发批次以to_seq为准）
+                    seq = data.get('to_seq', data.get('seq'))
+                    if seq is not None:
+                        self.last_seq = seq
+                        self.epoch = data.get('epoch')
+                    
                     if self.on_message:
                         self.on_message(data)
                         
@@ -200,6 +226,13 @@ class WebSocketClient:
             logger.error(f"发送消息失败: {str(e)}")
             return False
     
+    def send_message_threadsafe(self, message: Dict[str, Any]):
+        """从其他线程（如UI线程）发送消息，返回concurrent.futures.Future，未连接时返回None"""
+        if not self.is_connected or not self.loop or self.loop.is_closed():
+            logger.warning("WebSocket未连接，无法发送消息")
+            return None
+        return asyncio.run_coroutine_threadsafe(self.send_message(message), self.loop)
+    
     def get_connection_status(self) -> Dict[str, Any]:
         """获取连接状态"""
         return {
@@ -208,7 +241,8 @@ class WebSocketClient:
             "should_reconnect": self.should_reconnect,
             "uri": self.uri,
             "host": self.host,
-            "port": self.port
+            "port": self.port,
+            "max_rate": self.max_rate
         }
     
     def update_config(self, host: str, port: int):
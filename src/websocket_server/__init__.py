@@ -5,5 +5,7 @@ WebSocket服务器模块
 """
 
 from .websocket_server import WebSocketServer
+from .edge_workers import EdgeWorkerPool
+from .rest_server import RestServer
 
-__all__ = ['WebSocketServer']
+__all__ = ['WebSocketServer', 'EdgeWorkerPool', 'RestServer']
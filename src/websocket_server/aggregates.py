@@ -0,0 +1,250 @@
+import math
+import logging
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, List, Optional
+
+from .history import to_epoch
+
+logger = logging.getLogger(__name__)
+
+# 默认建立聚合索引的字段
+DEFAULT_AGGREGATE_FIELDS = [
+    'excitation_current_ratio',
+    'excitation_current',
+    'active_power',
+    'reactive_power',
+]
+
+
+class QuantileSketch:
+    """
+    对数分桶的近似分位数草图（DDSketch思路）
+
+    按相对误差alpha把数值映射到对数桶，可合并，分位数结果的相对误差不超过alpha。
+    """
+
+    __slots__ = ('bins', 'zeros', 'count')
+
+    def __init__(self):
+        self.bins: Dict[int, int] = {}  # 编码后的桶编号(偶数为正值，奇数为负值) -> 计数
+        self.zeros = 0
+        self.count = 0
+
+    @staticmethod
+    def key(value: float, gamma_log: float) -> int:
+        index = int(math.ceil(math.log(abs(value)) / gamma_log))
+        # index可能为负，乘2后用最低位区分正负值
+        return index * 2 if value > 0 else index * 2 + 1
+
+    def add(self, value: float, gamma_log: float):
+        self.count += 1
+        if value == 0:
+            self.zeros += 1
+            return
+        key = self.key(value, gamma_log)
+        self.bins[key] = self.bins.get(key, 0) + 1
+
+    def merge(self, other: 'QuantileSketch'):
+        self.count += other.count
+        self.zeros += other.zeros
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+
+    def quantile(self, q: float, gamma: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        # 还原每个桶的代表值后排序
+        values = []
+        for key, count in self.bins.items():
+            index, negative = key >> 1, key & 1
+            representative = 2 * gamma ** index / (gamma + 1)
+            values.append((-representative if negative else representative, count))
+        if self.zeros:
+            values.append((0.0, self.zeros))
+        values.sort()
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, count in values:
+            seen += count
+            if seen > rank:
+                return value
+        return values[-1][0]
+
+
+class FieldStats:
+    """单个字段在一个时间桶内的统计"""
+
+    __slots__ = ('count', 'total', 'min', 'max', 'sketch')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch()
+
+    def add(self, value: float, gamma_log: float):
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.sketch.add(value, gamma_log)
+
+    def merge(self, other: 'FieldStats'):
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+
+class AggregateIndex:
+    """
+    按电机、时间桶增量维护的聚合索引
+
+    每次广播把各字段值累加到当前时间桶，窗口查询合并所覆盖的桶，
+    回答min/max/mean/count/近似分位数只需扫描桶而不是原始采样。
+    窗口向外扩展到桶边界（见align），边界上的桶整桶计入；早于内存范围的部分从SQLite归档流式计算。
+
+    add和collect只能在同一个线程（WebSocket服务器的事件循环）中调用，collect返回的是副本，
+    之后合并归档部分可以放到工作线程。
+    """
+
+    def __init__(self, bucket_seconds: int = 60, max_buckets: int = 1440,
+                 fields: Optional[List[str]] = None, relative_accuracy: float = 0.01, db_manager=None):
+        """
+        初始化聚合索引
+
+        Args:
+            bucket_seconds: 时间桶宽度（秒）
+            max_buckets: 每台电机在内存中保留的时间桶数量（默认60秒×1440=24小时）
+            fields: 建立索引的字段，默认DEFAULT_AGGREGATE_FIELDS
+            relative_accuracy: 分位数的相对误差
+            db_manager: 可选的DatabaseManager，超出内存范围的窗口从归档计算
+        """
+        self.bucket_seconds = bucket_seconds
+        self.max_buckets = max_buckets
+        self.fields = list(fields or DEFAULT_AGGREGATE_FIELDS)
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.gamma_log = math.log(self.gamma)
+        self.db_manager = db_manager
+        # 电机ID -> (桶起始时间列表, 桶列表)，桶为 {字段: FieldStats}
+        self.starts: Dict[int, List[float]] = {}
+        self.buckets: Dict[int, List[Dict[str, FieldStats]]] = {}
+        self.last_sample: Dict[int, float] = {}
+
+    def add(self, motors_data: List[Dict[str, Any]]):
+        """把一帧广播数据累加到对应时间桶"""
+        for motor in motors_data:
+            motor_id = motor.get('motor_id')
+            ts = to_epoch(motor.get('last_update'))
+            if motor_id is None or ts is None:
+                continue
+            if ts <= self.last_sample.get(motor_id, -math.inf):
+                continue  # 同一采样点重复广播
+            self.last_sample[motor_id] = ts
+
+            bucket_start = ts - ts % self.bucket_seconds
+            starts = self.starts.setdefault(motor_id, [])
+            buckets = self.buckets.setdefault(motor_id, [])
+            if not starts or starts[-1] != bucket_start:
+                starts.append(bucket_start)
+                buckets.append({field: FieldStats() for field in self.fields})
+                if len(starts) > self.max_buckets:
+                    drop = len(starts) - self.max_buckets
+                    del starts[:drop]
+                    del buckets[:drop]
+            bucket = buckets[-1]
+            for field in self.fields:
+                value = motor.get(field)
+                if value is not None:
+                    bucket[field].add(float(value), self.gamma_log)
+
+    def motor_ids(self) -> List[int]:
+        return sorted(self.buckets.keys())
+
+    def oldest(self, motor_id: int) -> Optional[float]:
+        starts = self.starts.get(motor_id)
+        return starts[0] if starts else None
+
+    def align(self, start: float, end: float):
+        """窗口向外扩展到桶边界，返回[起点, 终点)；统计结果正好对应扩展后的窗口"""
+        return start - start % self.bucket_seconds, end - end % self.bucket_seconds + self.bucket_seconds
+
+    def collect_memory(self, motor_id: int, field: str, start: float, end: float) -> FieldStats:
+        """合并内存中与窗口[start, end)重叠的时间桶，返回新的FieldStats"""
+        result = FieldStats()
+        starts = self.starts.get(motor_id, [])
+        buckets = self.buckets.get(motor_id, [])
+        # 起点晚于start - bucket_seconds的桶与窗口重叠（epoch秒量级下加微小偏移会被舍入掉）
+        first = bisect_right(starts, start - self.bucket_seconds)
+        last = bisect_left(starts, end)
+        for bucket in buckets[first:last]:
+            stats = bucket.get(field)
+            if stats is not None and stats.count:
+                result.merge(stats)
+        return result
+
+    def collect_archive(self, motor_id: int, field: str, start: float, end: float) -> FieldStats:
+        """
+        从归档流式计算窗口统计（在工作线程中调用）
+
+        归档经过死区/旋转门压缩时只保存了部分采样，按采集间隔插值重建后再统计，计数和均值不受压缩影响
+        """
+        result = FieldStats()
+        if self.db_manager is None:
+            return result
+        if self.db_manager.get_compression():
+            rows = self.db_manager.iter_interpolated(motor_id, start, end, fields=[field])
+        else:
+            rows = self.db_manager.iter_data_by_time_range(motor_id, start, end, fields=[field])
+        for row in rows:
+            value = row.get(field)
+            if value is not None:
+                result.add(float(value), self.gamma_log)
+        return result
+
+    def collect(self, motor_id: int, field: str, start: float, end: float):
+        """
+        合并窗口[start, end)（已按align对齐）内的内存桶
+
+        Returns:
+            (FieldStats副本, 还需要从归档读取的(起点, 终点)，不需要时为None)
+        """
+        stats = self.collect_memory(motor_id, field, start, end)
+        oldest = self.oldest(motor_id)
+        if self.db_manager is None or (oldest is not None and oldest <= start):
+            return stats, None
+        # 归档部分截止到最旧内存桶的起点前1毫秒（归档时间戳精度），内存桶内的采样不会重复计入
+        return stats, (start, (end if oldest is None else min(end, oldest)) - 1e-3)
+
+    def query(self, motor_id: int, field: str, start: float, end: float):
+        """
+        计算窗口统计（窗口先按align对齐），返回(来源, FieldStats)
+
+        内存桶覆盖窗口时只合并内存桶；否则早于最旧内存桶的部分从归档流式计算后与内存桶合并，
+        读取归档时会阻塞，并且与add在同一线程中调用。
+        """
+        stats, archive = self.collect(motor_id, field, *self.align(start, end))
+        if archive is None:
+            return 'memory', stats
+        stats.merge(self.collect_archive(motor_id, field, *archive))
+        return 'archive', stats
+
+    def summarize(self, stats: FieldStats, requested: Iterable[str], percentiles: Iterable[float]) -> Dict[str, Any]:
+        """把合并后的统计转换为结果字典"""
+        result = {}
+        for name in requested:
+            if name == 'count':
+                result['count'] = stats.count
+            elif name == 'min':
+                result['min'] = stats.min if stats.count else None
+            elif name == 'max':
+                result['max'] = stats.max if stats.count else None
+            elif name == 'mean':
+                result['mean'] = stats.total / stats.count if stats.count else None
+        for p in percentiles:
+            result[f'p{p:g}'] = stats.sketch.quantile(p / 100.0, self.gamma)
+        return result
@@ -0,0 +1,142 @@
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    """
+    哈希时间轮
+    以固定tick为粒度管理大量定时项，调度和到期检查都是O(1)摊销
+    """
+
+    def __init__(self, tick: float = 0.05, slots: int = 512):
+        """
+        初始化时间轮
+
+        Args:
+            tick: 每个槽位的时间粒度（秒）
+            slots: 槽位数量，超过一圈的定时项按目标tick在对应槽位中等待
+        """
+        self.tick = tick
+        self.slots = [dict() for _ in range(slots)]
+        self.current_tick = int(time.monotonic() / tick)
+        self.slot_of: Dict[Any, int] = {}  # key -> 所在槽位下标，取消时不必扫描所有槽位
+
+    def schedule(self, key, deadline: float):
+        """在deadline（monotonic时间）到期时触发key，每个key只有一个定时，重复调度时替换原来的定时"""
+        target_tick = max(int(deadline / self.tick) + 1, self.current_tick + 1)
+        index = target_tick % len(self.slots)
+        previous = self.slot_of.get(key)
+        if previous is not None and previous != index:
+            self.slots[previous].pop(key, None)
+        self.slots[index][key] = target_tick
+        self.slot_of[key] = index
+
+    def cancel(self, key):
+        """取消key的定时"""
+        index = self.slot_of.pop(key, None)
+        if index is not None:
+            self.slots[index].pop(key, None)
+
+    def advance(self, now: float) -> List[Any]:
+        """推进时间轮到now，返回所有到期的key"""
+        expired = []
+        now_tick = int(now / self.tick)
+        # 落后超过一圈时只需扫描一圈，槽位内按目标tick判断是否到期
+        start_tick = max(self.current_tick + 1, now_tick - len(self.slots) + 1)
+        for t in range(start_tick, now_tick + 1):
+            slot = self.slots[t % len(self.slots)]
+            if not slot:
+                continue
+            for key, target_tick in list(slot.items()):
+                if target_tick <= now_tick:
+                    expired.append(key)
+                    del slot[key]
+                    del self.slot_of[key]
+        self.current_tick = max(self.current_tick, now_tick)
+        return expired
+
+
+class ConflationScheduler:
+    """
+    客户端更新速率合并调度器
+    限速客户端只保留最新一条待发送消息，按各自的最小发送间隔在时间轮上统一下发
+    """
+
+    def __init__(self, tick: float = 0.05):
+        self.wheel = TimerWheel(tick=tick)
+        self.min_intervals: Dict[Any, float] = {}  # 客户端 -> 最小发送间隔（秒）
+        self.last_sent: Dict[Any, float] = {}
+        self.pending: Dict[Any, Any] = {}  # 客户端 -> 合并后的最新消息
+
+    def set_max_rate(self, client, max_rate: Optional[float]):
+        """
+        设置客户端的最大更新速率
+
+        Args:
+            client: 客户端连接
+            max_rate: 每秒最多更新次数，None或<=0表示不限速
+        """
+        if max_rate is None or max_rate <= 0:
+            self.min_intervals.pop(client, None)
+            message = self.pending.pop(client, None)
+            self.wheel.cancel(client)
+            return message
+        self.min_intervals[client] = 1.0 / max_rate
+        return None
+
+    def get_max_rate(self, client) -> Optional[float]:
+        """获取客户端当前的最大更新速率"""
+        interval = self.min_intervals.get(client)
+        return 1.0 / interval if interval else None
+
+    def is_limited(self, client) -> bool:
+        """客户端是否设置了速率限制"""
+        return client in self.min_intervals
+
+    def offer(self, client, message, now: Optional[float] = None) -> bool:
+        """
+        提交一条待发送消息
+
+        Returns:
+            True表示应立即发送；False表示已合并到待发送队列，由时间轮稍后下发
+        """
+        interval = self.min_intervals.get(client)
+        if interval is None:
+            return True
+
+        if now is None:
+            now = time.monotonic()
+        next_allowed = self.last_sent.get(client, 0.0) + interval
+
+        if now >= next_allowed and client not in self.pending:
+            self.last_sent[client] = now
+            return True
+
+        # 合并：只保留最新消息，且每个客户端在时间轮上只挂一个定时
+        if client not in self.pending:
+            self.wheel.schedule(client, next_allowed)
+        self.pending[client] = message
+        return False
+
+    def due(self, now: Optional[float] = None) -> List[Tuple[Any, Any]]:
+        """取出所有已到发送时间的(客户端, 消息)"""
+        if now is None:
+            now = time.monotonic()
+        ready = []
+        for client in self.wheel.advance(now):
+            message = self.pending.pop(client, None)
+            if message is None:
+                continue
+            self.last_sent[client] = now
+            ready.append((client, message))
+        return ready
+
+    def remove(self, client):
+        """移除客户端的所有状态"""
+        self.min_intervals.pop(client, None)
+        self.last_sent.pop(client, None)
+        self.pending.pop(client, None)
+        self.wheel.cancel(client)
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+from typing import Optional
+
+from .history import HistoryStore
+from .snapshot_ring import SnapshotRing
+from .websocket_server import WebSocketServer
+
+logger = logging.getLogger(__name__)
+
+
+class RingDataSource:
+    """从共享内存环读取最新快照的数据源，供工作进程内的WebSocketServer使用"""
+
+    def __init__(self, ring: SnapshotRing):
+        self.ring = ring
+        self.latest_seq = 0
+        self.latest_motors_data = []
+        self.latest_trace = None
+
+    def refresh(self) -> bool:
+        """读取共享内存中的最新快照，有新数据时返回True"""
+        if self.ring.sequence == self.latest_seq:
+            return False
+        snapshot = self.ring.read()
+        if snapshot is None:
+            return False
+        self.latest_seq, _, self.latest_motors_data, self.latest_trace = snapshot
+        return True
+
+    def get_latest_motors_data(self):
+        return self.latest_motors_data
+
+    def get_snapshot_version(self):
+        return self.latest_seq
+
+
+def run_edge_worker(ring_name: str, worker_index: int, host: str, port: int,
+                    poll_interval: float = 0.01, server_options: Optional[dict] = None):
+    """
+    工作进程入口：连接共享内存环，在同一端口上（SO_REUSEPORT）运行WebSocket服务器，
+    检测到新快照后在本进程内序列化并扇出
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - edge-{worker_index} - %(name)s - %(levelname)s - %(message)s'
+    )
+    ring = SnapshotRing(name=ring_name)
+    data_source = RingDataSource(ring)
+    # 序号来自共享内存环，以环的名称作为实例标识，客户端重连到任一工作进程都能续传
+    server = WebSocketServer(data_source, host=host, port=port, reuse_port=True, epoch=ring_name,
+                             **(server_options or {}))
+    server.set_client_count_changed_callback(lambda count: ring.set_worker_count(worker_index, count))
+
+    async def relay():
+        while not server.running:
+            await asyncio.sleep(poll_interval)
+        while server.running:
+            if data_source.refresh():
+                # 使用共享内存序号作为广播序号，客户端重连到任一工作进程都能按序号续传
+                await server.broadcast_data(data_source.get_latest_motors_data(), seq=data_source.latest_seq,
+                                            trace=data_source.latest_trace)
+            await asyncio.sleep(poll_interval)
+
+    async def main():
+        relay_task = asyncio.create_task(relay())
+        serve_task = asyncio.create_task(server.start_server())
+
+        def terminate():
+            # 服务器已监听时正常关闭（向客户端发送关闭帧），还在启动时直接取消
+            if server.server:
+                server.stop()
+            else:
+                serve_task.cancel()
+
+        # EdgeWorkerPool.stop()用terminate()发送SIGTERM，默认处理会直接结束进程，跳过下面的清理
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, terminate)
+        try:
+            await serve_task
+        except asyncio.CancelledError:
+            pass
+        finally:
+            relay_task.cancel()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.set_worker_count(worker_index, 0)
+        ring.close()
+
+
+class EdgeWorkerPool:
+    """
+    多进程WebSocket边缘工作进程池
+
+    采集线程通过publish()把每帧快照写入共享内存环一次，
+    N个工作进程用SO_REUSEPORT监听同一端口，各自读取快照、序列化并发送。
+    客户端容量随CPU核数扩展，GUI线程卡顿也不会延迟下发。
+    接口与WebSocketServer保持一致，可直接替换（SO_REUSEPORT仅Linux可用）；
+    主进程同样维护一份历史存储（history），供同进程的REST服务查询。
+    """
+
+    def __init__(self, host='0.0.0.0', port=8765, workers=2, motor_capacity=32,
+                 ring_slots=8, poll_interval=0.01, server_options=None, db_manager=None):
+        """
+        初始化工作进程池
+
+        Args:
+            host: 监听地址
+            port: 监听端口（所有工作进程共享）
+            workers: 工作进程数量
+            motor_capacity: 每帧快照最多电机数量
+            ring_slots: 共享内存环槽位数量
+            poll_interval: 工作进程检查新快照的间隔（秒）
+            server_options: 传给每个WebSocketServer的额外参数
+            db_manager: 可选的DatabaseManager，各工作进程和主进程的历史查询超出内存范围时从归档读取
+        """
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.motor_capacity = motor_capacity
+        self.ring_slots = ring_slots
+        self.poll_interval = poll_interval
+        self.server_options = server_options or {}
+        self.db_manager = db_manager
+        self.history = HistoryStore(max_points=self.server_options.get('history_points', 3600), db_manager=db_manager)
+        self.ring = None
+        self.processes = []
+        self.running = False
+        self.on_client_count_changed = None
+        self.monitor_thread = None
+
+    def start(self):
+        """创建共享内存环并启动工作进程"""
+        self.ring = SnapshotRing(slots=self.ring_slots, motor_capacity=self.motor_capacity,
+                                 max_workers=max(self.workers, 1), create=True)
+        self.running = True
+        for index in range(self.workers):
+            process = multiprocessing.Process(
+                target=run_edge_worker,
+                args=(self.ring.name, index, self.host, self.port, self.poll_interval,
+                      dict(self.server_options, db_manager=self.db_manager)),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+
+        # 汇总各工作进程的客户端数量，变化时回调
+        self.monitor_thread = threading.Thread(target=self._monitor_client_count, daemon=True)
+        self.monitor_thread.start()
+
+    def _monitor_client_count(self):
+        last_count = 0
+        while self.running:
+            count = self.get_client_count()
+            if count != last_count and self.on_client_count_changed:
+                self.on_client_count_changed(count)
+            last_count = count
+            time.sleep(1)
+
+    def publish(self, data, trace=None):
+        """
+        把一帧快照写入共享内存环（线程安全：只允许采集线程单写者调用）
+
+        Args:
+            data: 电机数据字典列表
+            trace: 可选的链路时间戳字典，记录enqueue后随快照写入共享内存环，由工作进程补上send下发
+        """
+        if not self.running or not self.ring or not data:
+            return None
+        if trace is not None:
+            trace = dict(trace, enqueue=time.time())
+        self.history.append(data)
+        return self.ring.publish(data, trace=trace)
+
+    def stop(self):
+        """停止所有工作进程并释放共享内存"""
+        self.running = False
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join(timeout=3)
+            if process.is_alive():
+                # 关闭握手超时（如客户端不响应），强制结束
+                process.kill()
+                process.join()
+        self.processes = []
+        if self.ring:
+            self.ring.close()
+            self.ring = None
+
+    def get_client_count(self):
+        """获取所有工作进程的客户端数量之和"""
+        return self.ring.get_total_count() if self.ring else 0
+
+    def set_client_count_changed_callback(self, callback):
+        """设置客户端数量变化回调函数"""
+        self.on_client_count_changed = callback
@@ -0,0 +1,158 @@
+import logging
+import itertools
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .snapshot_ring import SNAPSHOT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+def to_epoch(value) -> Optional[float]:
+    """把ISO字符串、datetime或数字统一转换为epoch秒"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+class HistoryStore:
+    """
+    电机历史序列的内存环
+
+    每台电机保存最近max_points个采样点(epoch秒, 各字段值)，
+    超出内存范围的时间窗口回退到SQLite归档分批读取。
+    """
+
+    def __init__(self, max_points: int = 3600, db_manager=None):
+        """
+        初始化历史存储
+
+        Args:
+            max_points: 每台电机在内存中保留的采样点数
+            db_manager: 可选的DatabaseManager，内存不覆盖的时间范围从归档读取
+        """
+        self.max_points = max_points
+        self.db_manager = db_manager
+        self.series: Dict[int, deque] = {}
+
+    def append(self, motors_data: List[Dict[str, Any]]):
+        """追加一帧广播数据"""
+        for motor in motors_data:
+            motor_id = motor.get('motor_id')
+            ts = to_epoch(motor.get('last_update'))
+            if motor_id is None or ts is None:
+                continue
+            series = self.series.get(motor_id)
+            if series is None:
+                series = self.series[motor_id] = deque(maxlen=self.max_points)
+            if series and ts <= series[-1][0]:
+                continue  # 同一采样点重复广播
+            series.append((ts,) + tuple(motor.get(field) for field in SNAPSHOT_FIELDS))
+
+    def oldest(self, motor_id: int) -> Optional[float]:
+        """内存中该电机最早的采样时间"""
+        series = self.series.get(motor_id)
+        return series[0][0] if series else None
+
+    def covers(self, motor_id: int, start: float) -> bool:
+        """内存环是否覆盖从start开始的时间窗口"""
+        oldest = self.oldest(motor_id)
+        if oldest is None:
+            return False
+        series = self.series[motor_id]
+        # 内存环未满说明从启动起的数据都在内存中
+        return oldest <= start or len(series) < self.max_points
+
+    def iter_memory(self, motor_id: int, start: float, end: float, fields: List[str]) -> Iterator[tuple]:
+        """从内存环中按时间顺序读取窗口内的采样点"""
+        series = list(self.series.get(motor_id, ()))
+        times = [point[0] for point in series]
+        indexes = [SNAPSHOT_FIELDS.index(field) + 1 for field in fields]
+        for point in series[bisect_left(times, start):bisect_right(times, end)]:
+            yield (point[0],) + tuple(point[i] for i in indexes)
+
+    def iter_archive(self, motor_id: int, start: float, end: float, fields: List[str],
+                     batch_size: int = 1000, max_points: float = 0) -> Iterator[tuple]:
+        """从SQLite归档中分批读取窗口内的采样点，指定max_points时长范围由汇总表提供（每个时间桶的均值）"""
+        if self.db_manager is None:
+            return
+        for row in self.db_manager.iter_data_by_time_range(
+                motor_id, start, end, batch_size=batch_size, fields=fields, max_points=max_points):
+            yield (row['ts'] / 1000,) + tuple(row.get(field) for field in fields)
+
+    def query(self, motor_id: int, start: float, end: float, fields: List[str], max_points: int = 0):
+        """
+        选择数据来源并返回(来源, 采样点迭代器)
+
+        内存环覆盖窗口时直接从内存读取；否则早于内存环的部分从归档读取，
+        其余部分仍从内存读取（最近的采样可能尚未写入归档）。
+        max_points为调用方的降采样目标点数，归档部分据此选择汇总粒度
+        """
+        if self.covers(motor_id, start) or self.db_manager is None:
+            return 'memory', self.iter_memory(motor_id, start, end, fields)
+        oldest = self.oldest(motor_id)
+        if oldest is None or oldest > end:
+            return 'archive', self.iter_archive(motor_id, start, end, fields, max_points=max_points)
+        # 归档查询的结束时间早于内存环起点1毫秒（归档时间戳精度），避免边界采样重复；
+        # 点数预算按归档部分占窗口的比例分配
+        archive_points = max_points * (oldest - start) / (end - start) if end > start else 0
+        archive = self.iter_archive(motor_id, start, oldest - 1e-3, fields, max_points=archive_points)
+        return 'archive', _ClosingChain(archive, self.iter_memory(motor_id, oldest, end, fields))
+
+
+class _ClosingChain:
+    """按顺序串联多个迭代器，close()时关闭底层生成器（释放归档游标）"""
+
+    def __init__(self, *iterators):
+        self.iterators = iterators
+        self.chain = itertools.chain(*iterators)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.chain)
+
+    def close(self):
+        for iterator in self.iterators:
+            close = getattr(iterator, 'close', None)
+            if close:
+                close()
+
+
+def downsample(points: Iterable[tuple], start: float, end: float, max_points: int) -> Iterator[tuple]:
+    """
+    按时间分桶的流式降采样
+
+    把[start, end]均分为max_points个桶，每个桶输出一个点（时间取桶内首个采样，字段取均值），
+    输入按时间顺序流入，内存占用与窗口大小无关。
+    """
+    width = (end - start) / max_points if max_points > 0 else 0
+    if width <= 0:
+        yield from points
+        return
+
+    bucket = None
+    first_ts = None
+    sums = None
+    count = 0
+    for point in points:
+        index = min(int((point[0] - start) / width), max_points - 1)
+        if index != bucket and count:
+            yield (first_ts,) + tuple(s / count if s is not None else None for s in sums)
+            count = 0
+        if count == 0:
+            bucket = index
+            first_ts = point[0]
+            sums = list(point[1:])
+        else:
+            sums = [s + v if s is not None and v is not None else None for s, v in zip(sums, point[1:])]
+        count += 1
+    if count:
+        yield (first_ts,) + tuple(s / count if s is not None else None for s in sums)
@@ -0,0 +1,204 @@
+"""
+WebSocket扇出压力测试
+
+在本进程中启动WebSocketServer，由多个子进程建立大量客户端连接，
+按固定间隔发布12台电机的模拟数据，统计每条更新从发布到客户端收到的延迟。
+
+用法:
+    python3 src/websocket_server/load_test.py --clients 100 1000 5000
+
+注意: 5000个连接需要足够的文件描述符，运行前执行 ulimit -n 20000
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime
+
+import websockets
+
+# 添加src目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from websocket_server.websocket_server import WebSocketServer
+
+logger = logging.getLogger(__name__)
+
+
+class FakeDataSource:
+    """模拟数据源，压测开始前不提供数据，避免新连接收到latest_data干扰计数"""
+
+    def __init__(self):
+        self.latest_motors_data = []
+
+    def get_latest_motors_data(self):
+        return self.latest_motors_data
+
+
+def make_motors_data(motor_count, step):
+    """生成一帧模拟电机数据"""
+    now = datetime.now().isoformat()
+    return [
+        {
+            'motor_id': motor_id,
+            'phase_a_current': 1200.0 + step,
+            'phase_b_current': 1201.0 + step,
+            'phase_c_current': 1202.0 + step,
+            'frequency': 50.0,
+            'reactive_power': -100.0,
+            'active_power': 200.0,
+            'line_voltage': 20.0,
+            'excitation_voltage': 400.0,
+            'excitation_current': 2000.0,
+            'calculated_excitation_current': 1980.0,
+            'excitation_current_ratio': 1.01,
+            'average_excitation_current_ratio': 1.01,
+            'last_update': now
+        }
+        for motor_id in range(1, motor_count + 1)
+    ]
+
+
+def client_worker(uri, count, expected, timeout, result_queue):
+    """子进程：建立count个连接，记录每条消息的到达时间"""
+
+    async def one_client(semaphore):
+        arrivals = []
+        async with semaphore:
+            websocket = await websockets.connect(uri, max_queue=None, ping_interval=None)
+        try:
+            async for _ in websocket:
+                arrivals.append(time.time())
+                if len(arrivals) >= expected:
+                    break
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            await websocket.close()
+        return arrivals
+
+    async def run():
+        # 限制并发握手数量，避免瞬间建连压垮accept队列
+        semaphore = asyncio.Semaphore(200)
+        tasks = [asyncio.create_task(one_client(semaphore)) for _ in range(count)]
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        results = []
+        for task in tasks:
+            if task in done and not task.exception():
+                results.append(task.result())
+            else:
+                results.append([])
+        return results
+
+    result_queue.put(asyncio.run(run()))
+
+
+def percentile(sorted_values, p):
+    """计算已排序序列的百分位数"""
+    if not sorted_values:
+        return float('nan')
+    index = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_round(server, data_source, uri, client_count, updates, interval, procs, motor_count):
+    """执行一轮压测，返回统计结果"""
+    procs = max(1, min(procs, client_count))
+    per_proc = [client_count // procs + (1 if i < client_count % procs else 0) for i in range(procs)]
+    timeout = 60 + updates * interval * 2
+    result_queue = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=client_worker, args=(uri, n, updates, timeout, result_queue), daemon=True)
+        for n in per_proc
+    ]
+    for worker in workers:
+        worker.start()
+
+    # 等待所有客户端连接完成
+    deadline = time.time() + 60
+    while server.get_client_count() < client_count and time.time() < deadline:
+        time.sleep(0.1)
+    connected = server.get_client_count()
+
+    publish_times = []
+    fan_out_times = []
+    for step in range(updates):
+        data = make_motors_data(motor_count, step)
+        data_source.latest_motors_data = data
+        start = time.time()
+        publish_times.append(start)
+        future = server.publish(data)
+        if future is not None:
+            future.result()
+        fan_out_times.append(time.time() - start)
+        time.sleep(max(0.0, interval - (time.time() - start)))
+
+    latencies = []
+    missing = 0
+    for _ in workers:
+        for arrivals in result_queue.get(timeout=timeout + 30):
+            missing += updates - len(arrivals)
+            for published, arrived in zip(publish_times, arrivals):
+                latencies.append((arrived - published) * 1000)
+    for worker in workers:
+        worker.join(timeout=10)
+
+    # 等待服务器注销本轮所有连接
+    deadline = time.time() + 30
+    while server.get_client_count() > 0 and time.time() < deadline:
+        time.sleep(0.1)
+
+    latencies.sort()
+    fan_out_times.sort()
+    return {
+        'clients': client_count,
+        'connected': connected,
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': latencies[-1] if latencies else float('nan'),
+        'fan_out_p99_ms': percentile(fan_out_times, 99) * 1000,
+        'missing': missing
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WebSocket扇出压力测试')
+    parser.add_argument('--clients', type=int, nargs='+', default=[100, 1000, 5000], help='每轮的客户端数量')
+    parser.add_argument('--updates', type=int, default=50, help='每轮发布的更新次数')
+    parser.add_argument('--interval', type=float, default=0.2, help='发布间隔（秒）')
+    parser.add_argument('--motors', type=int, default=12, help='每帧电机数量')
+    parser.add_argument('--procs', type=int, default=os.cpu_count() or 4, help='客户端子进程数量')
+    parser.add_argument('--port', type=int, default=18765, help='测试服务器端口')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    data_source = FakeDataSource()
+    server = WebSocketServer(data_source, host='127.0.0.1', port=args.port)
+    server.start()
+    deadline = time.time() + 10
+    while not (server.running and server.loop) and time.time() < deadline:
+        time.sleep(0.05)
+    uri = f"ws://127.0.0.1:{args.port}"
+
+    print(f"{'客户端数':>8} | {'已连接':>6} | {'p50(ms)':>8} | {'p99(ms)':>8} | {'max(ms)':>8} | {'扇出p99(ms)':>10} | {'丢失':>6}")
+    print("-" * 78)
+    for client_count in args.clients:
+        data_source.latest_motors_data = []
+        result = run_round(server, data_source, uri, client_count, args.updates,
+                           args.interval, args.procs, args.motors)
+        print(f"{result['clients']:>8} | {result['connected']:>6} | {result['p50_ms']:>8.2f} | "
+              f"{result['p99_ms']:>8.2f} | {result['max_ms']:>8.2f} | {result['fan_out_p99_ms']:>10.2f} | "
+              f"{result['missing']:>6}")
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import logging
+from collections import deque
+from typing import Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayBuffer:
+    """
+    最近广播消息的内存环
+
+    按序号保存已序列化的motor_update消息，同时受条数和内存上限约束，
+    供断线重连的客户端按last_seq补齐错过的更新。
+    """
+
+    def __init__(self, max_entries: int = 600, max_bytes: int = 8 * 1024 * 1024):
+        """
+        初始化回放环
+
+        Args:
+            max_entries: 最多保留的消息条数
+            max_bytes: 最多占用的内存（按序列化后的消息长度估算）
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = deque()  # (seq, 消息JSON, 原始数据)
+        self.total_bytes = 0
+
+    def append(self, seq: int, message_json: str, data: Any = None):
+        """追加一条已广播的消息，超出上限时淘汰最旧的消息"""
+        self.entries.append((seq, message_json, data))
+        self.total_bytes += len(message_json)
+        while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            _, old_json, _ = self.entries.popleft()
+            self.total_bytes -= len(old_json)
+
+    @property
+    def first_seq(self) -> Optional[int]:
+        return self.entries[0][0] if self.entries else None
+
+    @property
+    def last_seq(self) -> Optional[int]:
+        return self.entries[-1][0] if self.entries else None
+
+    def latest(self):
+        """最新一条(seq, 消息JSON, 原始数据)，没有时返回None"""
+        return self.entries[-1] if self.entries else None
+
+    def since(self, last_seq: int) -> Optional[List[str]]:
+        """
+        获取序号大于last_seq的所有消息
+
+        Returns:
+            消息JSON列表；last_seq已被淘汰（无法连续补齐）时返回None
+        """
+        if not self.entries:
+            return None
+        if last_seq + 1 < self.entries[0][0]:
+            return None
+        # 序号单调递增但不一定连续（多进程模式下按共享内存序号），从尾部向前收集
+        missed = []
+        for seq, message_json, _ in reversed(self.entries):
+            if seq <= last_seq:
+                break
+            missed.append(message_json)
+        missed.reverse()
+        return missed
+
+    def __len__(self):
+        return len(self.entries)
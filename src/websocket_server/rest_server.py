@@ -0,0 +1,179 @@
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+from .snapshot_cache import SnapshotCache, archive_latest
+from .history import HistoryStore, downsample, to_epoch
+from .snapshot_ring import SNAPSHOT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+def format_motors_data(motors_data):
+    """把MotorData对象或字典统一转换为字典列表"""
+    formatted_data = []
+    for motor_data in motors_data:
+        if hasattr(motor_data, 'to_dict'):
+            formatted_data.append(motor_data.to_dict())
+        elif isinstance(motor_data, dict):
+            formatted_data.append(motor_data)
+    return formatted_data
+
+
+def parse_time(value) -> Optional[float]:
+    """解析查询参数中的时间（ISO时间或epoch秒），格式错误时抛出ValueError"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return to_epoch(value)
+
+
+class RestServer:
+    """
+    电机数据HTTP REST服务
+
+    与WebSocketServer共用同一个快照缓存和历史存储，为SCADA、历史库等轮询型集成提供普通HTTP接口：
+    GET /latest, /motors/<id>/latest, /motors/<id>/history?from&to&max_points&fields。
+    最新数据响应携带由快照版本生成的ETag/Last-Modified，快照未变化时返回304；历史数据分块流式返回。
+    """
+
+    def __init__(self, data_source=None, host='0.0.0.0', port=8080,
+                 snapshot_cache: Optional[SnapshotCache] = None,
+                 history: Optional[HistoryStore] = None, db_manager=None, chunk_size=500):
+        """
+        初始化REST服务
+
+        Args:
+            data_source: 数据源，未提供snapshot_cache时用于构建自己的快照缓存
+            host: 监听地址
+            port: 监听端口
+            snapshot_cache: 共用的快照缓存（通常为WebSocketServer.snapshot_cache）
+            history: 共用的历史存储（通常为WebSocketServer.history），未提供时只从归档读取
+            db_manager: 未提供history时用于读取归档的DatabaseManager
+            chunk_size: 历史数据每次从数据源读取的点数
+        """
+        self.host = host
+        self.port = port
+        self.snapshot_cache = snapshot_cache or SnapshotCache(
+            data_source, format_motors_data, archive_latest(db_manager) if db_manager else None)
+        self.history = history or HistoryStore(max_points=1, db_manager=db_manager)
+        self.chunk_size = chunk_size
+        self.app = self.create_app()
+        self.server = None
+        self.thread = None
+
+    def create_app(self) -> Flask:
+        """创建Flask应用并注册路由"""
+        app = Flask(__name__)
+        app.json.ensure_ascii = False
+        app.add_url_rule('/latest', 'latest', self.latest)
+        app.add_url_rule('/motors/<int:motor_id>/latest', 'motor_latest', self.motor_latest)
+        app.add_url_rule('/motors/<int:motor_id>/history', 'motor_history', self.motor_history)
+        return app
+
+    def _conditional(self, body, mimetype: str, etag: str, built_at: float) -> Response:
+        """构建带ETag/Last-Modified的响应，与请求的If-None-Match/If-Modified-Since匹配时返回304"""
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        # werkzeug把不带时区的datetime当作UTC
+        response.last_modified = datetime.fromtimestamp(built_at, tz=timezone.utc)
+        response.cache_control.no_cache = True  # 允许缓存，但每次都要重新验证
+        environ = request.environ
+        if request.if_none_match:
+            # Last-Modified只精确到秒，同一秒内可能有多个快照，以ETag为准：
+            # 带If-None-Match时忽略If-Modified-Since（RFC 9110 13.1.3）
+            environ = {key: value for key, value in environ.items() if key != 'HTTP_IF_MODIFIED_SINCE'}
+        return response.make_conditional(environ)
+
+    def latest(self):
+        """所有电机的最新数据，Accept为application/octet-stream时返回二进制快照"""
+        binary = request.accept_mimetypes.best_match(['application/json', 'application/octet-stream']) \
+            == 'application/octet-stream'
+        entry = self.snapshot_cache.get_entry('binary' if binary else 'json')
+        if entry is None:
+            return jsonify({'error': '暂无数据'}), 503
+        message, version, built_at, _ = entry
+        if binary:
+            return self._conditional(message, 'application/octet-stream', f'{version}-{built_at}-bin', built_at)
+        return self._conditional(message, 'application/json', f'{version}-{built_at}', built_at)
+
+    def motor_latest(self, motor_id: int):
+        """单台电机的最新数据"""
+        entry = self.snapshot_cache.get_entry('json')
+        if entry is None:
+            return jsonify({'error': '暂无数据'}), 503
+        _, version, built_at, motors_data = entry
+        motor = next((m for m in motors_data if m.get('motor_id') == motor_id), None)
+        if motor is None:
+            return jsonify({'error': f'电机 {motor_id} 不存在'}), 404
+        body = json.dumps({
+            'type': 'motor_data',
+            'motor_id': motor_id,
+            'data': motor,
+            'timestamp': datetime.fromtimestamp(built_at).isoformat()
+        }, ensure_ascii=False)
+        return self._conditional(body, 'application/json', f'{version}-{built_at}-{motor_id}', built_at)
+
+    def motor_history(self, motor_id: int):
+        """
+        单台电机的历史序列
+
+        参数: from/to（ISO时间或epoch秒，默认最近1小时）, max_points（降采样目标点数）, fields（逗号分隔）。
+        响应体按块流式生成，服务器内存只占用一个分块。
+        """
+        fields = [f for f in request.args.get('fields', '').split(',') if f] or SNAPSHOT_FIELDS
+        unknown = [field for field in fields if field not in SNAPSHOT_FIELDS]
+        if unknown:
+            return jsonify({'error': f'未知字段: {unknown}'}), 400
+        try:
+            end = parse_time(request.args.get('to')) or datetime.now().timestamp()
+            start = parse_time(request.args.get('from')) or end - 3600
+            max_points = int(request.args.get('max_points') or 0)
+        except ValueError as e:
+            return jsonify({'error': f'参数格式错误: {e}'}), 400
+
+        # 归档游标在生成器内创建和关闭，整个读取过程都在响应线程中
+        def generate():
+            source, source_points = self.history.query(motor_id, start, end, fields, max_points)
+            points = downsample(source_points, start, end, max_points) if max_points > 0 else source_points
+            count = 0
+            try:
+                yield (f'{{"motor_id": {motor_id}, "source": "{source}", '
+                       f'"columns": {json.dumps(["timestamp"] + list(fields))}, "points": [')
+                chunk = []
+                for point in points:
+                    chunk.append(json.dumps([datetime.fromtimestamp(point[0]).isoformat()] + list(point[1:])))
+                    if len(chunk) >= self.chunk_size:
+                        yield (',' if count else '') + ','.join(chunk)
+                        count += len(chunk)
+                        chunk = []
+                if chunk:
+                    yield (',' if count else '') + ','.join(chunk)
+                    count += len(chunk)
+                yield f'], "count": {count}}}'
+            finally:
+                close = getattr(source_points, 'close', None)
+                if close:
+                    close()
+
+        return Response(generate(), mimetype='application/json')
+
+    def start(self):
+        """在后台线程中启动HTTP服务"""
+        self.server = make_server(self.host, self.port, self.app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        # logger.info(f"REST服务启动: http://{self.host}:{self.port}")
+
+    def stop(self):
+        """停止HTTP服务"""
+        if self.server:
+            self.server.shutdown()
+            self.server = None
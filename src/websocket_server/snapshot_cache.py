@@ -0,0 +1,192 @@
+import json
+import math
+import struct
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from .snapshot_ring import SNAPSHOT_FIELDS, ROW_WIDTH
+
+logger = logging.getLogger(__name__)
+
+# 二进制latest_data头部: 魔数, 格式版本, 电机数量, 快照版本, 生成时间(epoch秒)
+BINARY_MAGIC = b'MSNP'
+BINARY_FORMAT_VERSION = 1
+_BINARY_HEADER = struct.Struct('<4sBHQd')
+
+# 由归档构建的冷启动快照的版本号，采集到第一轮数据后被替换
+ARCHIVE_VERSION = 0
+
+
+def encode_binary_snapshot(motors_data: List[Dict[str, Any]], version: int, timestamp: float) -> bytes:
+    """
+    把电机数据编码为紧凑的二进制帧
+
+    每台电机一行float64: motor_id, SNAPSHOT_FIELDS..., last_update(epoch秒)
+    """
+    rows = []
+    for motor in motors_data:
+        rows.append(float(motor.get('motor_id', 0)))
+        rows.extend(math.nan if motor.get(field) is None else float(motor[field]) for field in SNAPSHOT_FIELDS)
+        last_update = motor.get('last_update')
+        if isinstance(last_update, str):
+            last_update = datetime.fromisoformat(last_update)
+        rows.append(last_update.timestamp() if last_update else 0.0)
+    header = _BINARY_HEADER.pack(BINARY_MAGIC, BINARY_FORMAT_VERSION, len(motors_data), version & 0xFFFFFFFFFFFFFFFF, timestamp)
+    return header + struct.pack(f'<{len(rows)}d', *rows)
+
+
+def decode_binary_snapshot(payload: bytes) -> Dict[str, Any]:
+    """解码二进制latest_data帧，返回与JSON消息相同结构的字典"""
+    magic, format_version, count, version, timestamp = _BINARY_HEADER.unpack_from(payload, 0)
+    if magic != BINARY_MAGIC or format_version != BINARY_FORMAT_VERSION:
+        raise ValueError(f"未知的二进制快照格式: {magic!r} v{format_version}")
+    rows = struct.unpack_from(f'<{count * ROW_WIDTH}d', payload, _BINARY_HEADER.size)
+    data = []
+    for i in range(count):
+        base = i * ROW_WIDTH
+        motor = {'motor_id': int(rows[base])}
+        for j, field in enumerate(SNAPSHOT_FIELDS):
+            value = rows[base + 1 + j]
+            motor[field] = None if value != value else value
+        last_update = rows[base + ROW_WIDTH - 1]
+        motor['last_update'] = datetime.fromtimestamp(last_update).isoformat() if last_update else None
+        data.append(motor)
+    return {
+        'type': 'latest_data',
+        'version': version,
+        'data': data,
+        'timestamp': datetime.fromtimestamp(timestamp).isoformat()
+    }
+
+
+def archive_latest(db_manager) -> Callable[[], List[Dict[str, Any]]]:
+    """以DatabaseManager的最新值表作为冷启动快照的数据来源，last_update为该行的采样时间"""
+    def load():
+        return [
+            dict({'motor_id': row['motor_id']}, **{field: row.get(field) for field in SNAPSHOT_FIELDS},
+                 last_update=row['timestamp'])
+            for row in db_manager.get_all_latest_motor_data()
+        ]
+    return load
+
+
+class SnapshotCache:
+    """
+    最新快照的预序列化缓存
+
+    按快照版本缓存latest_data消息的JSON和二进制编码，只有新一轮轮询到达时才重新构建。
+    新连接和get_latest请求直接发送缓存的编码结果，重连风暴时不再重复格式化和序列化。
+    可被WebSocket事件循环和REST服务线程同时读取。
+    """
+
+    def __init__(self, data_source, formatter: Callable[[Any], List[Dict[str, Any]]],
+                 archive_source: Optional[Callable[[], List[Dict[str, Any]]]] = None):
+        """
+        初始化缓存
+
+        Args:
+            data_source: 数据源，需要提供get_latest_motors_data()，
+                         可选提供get_snapshot_version()返回单调递增的快照版本
+            formatter: 把数据源返回的电机数据转换为字典列表的函数
+            archive_source: 可选，数据源还没有数据时（服务刚启动）返回归档中最新电机数据字典的函数
+        """
+        self.data_source = data_source
+        self.formatter = formatter
+        self.archive_source = archive_source
+        self._get_version = getattr(data_source, 'get_snapshot_version', None)
+        self.version = None
+        self.data: List[Dict[str, Any]] = []
+        self.json_message: Optional[str] = None
+        self.binary_message: Optional[bytes] = None
+        self.built_at: Optional[float] = None
+        self.lock = threading.RLock()
+
+    def refresh(self) -> bool:
+        """数据源有新快照时重建缓存，返回缓存中是否有数据"""
+        with self.lock:
+            return self._refresh()
+
+    def _refresh(self) -> bool:
+        # 先读版本再读数据：生产者先替换数据再递增版本，两次读取之间恰好有更新时只会多重建一次，
+        # 而不会把旧数据缓存在新版本下。数据源不提供版本时以快照列表对象本身作为版本
+        version = self._get_version() if self._get_version else None
+        motors_data = self.data_source.get_latest_motors_data()
+        if not motors_data:
+            return self._refresh_from_archive()
+        if version is None:
+            version = id(motors_data)
+        if version == self.version and self.json_message is not None:
+            return True
+
+        self.data = self.formatter(motors_data)
+        self.built_at = datetime.now().timestamp()
+        message = {
+            'type': 'latest_data',
+            'data': self.data,
+            'timestamp': datetime.fromtimestamp(self.built_at).isoformat()
+        }
+        if self._get_version:
+            message['version'] = version
+        self.json_message = json.dumps(message, ensure_ascii=False)
+        self.binary_message = None  # 二进制编码按需生成
+        self.version = version
+        return True
+
+    def _refresh_from_archive(self) -> bool:
+        """用归档的最新值构建快照（带"source": "archive"），每次启动只查询一次，直到第一轮采集数据到达"""
+        if self.archive_source is None:
+            return False
+        if self.version == ARCHIVE_VERSION and self.json_message is not None:
+            return True
+
+        data = self.archive_source()
+        if not data:
+            return False
+        self.data = data
+        self.built_at = datetime.now().timestamp()
+        message = {
+            'type': 'latest_data',
+            'source': 'archive',
+            'data': self.data,
+            'timestamp': datetime.fromtimestamp(self.built_at).isoformat()
+        }
+        if self._get_version:
+            message['version'] = ARCHIVE_VERSION
+        self.json_message = json.dumps(message, ensure_ascii=False)
+        self.binary_message = None
+        self.version = ARCHIVE_VERSION
+        return True
+
+    def get(self, encoding: str = 'json'):
+        """
+        获取编码后的latest_data消息
+
+        Args:
+            encoding: 'json'返回文本帧内容，'binary'返回二进制帧内容
+
+        Returns:
+            编码后的消息，没有数据时返回None
+        """
+        entry = self.get_entry(encoding)
+        return entry[0] if entry else None
+
+    def get_entry(self, encoding: str = 'json'):
+        """
+        获取编码后的消息及其元数据
+
+        Returns:
+            (编码后的消息, 快照版本, 生成时间epoch秒, 电机数据字典列表)，没有数据时返回None
+        """
+        with self.lock:
+            if not self._refresh():
+                return None
+            if encoding == 'binary':
+                if self.binary_message is None:
+                    version = self.version if self._get_version else 0
+                    self.binary_message = encode_binary_snapshot(self.data, version, self.built_at)
+                message = self.binary_message
+            else:
+                message = self.json_message
+            return message, self.version, self.built_at, self.data
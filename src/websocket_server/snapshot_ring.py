@@ -0,0 +1,201 @@
+import struct
+import logging
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 快照中每台电机的数值字段，顺序即共享内存中的列顺序
+SNAPSHOT_FIELDS = [
+    'phase_a_current',
+    'phase_b_current',
+    'phase_c_current',
+    'frequency',
+    'reactive_power',
+    'active_power',
+    'line_voltage',
+    'excitation_voltage',
+    'excitation_current',
+    'calculated_excitation_current',
+    'excitation_current_ratio',
+    'average_excitation_current_ratio',
+]
+
+# 每行: motor_id + 数值字段 + last_update(epoch秒)
+ROW_WIDTH = len(SNAPSHOT_FIELDS) + 2
+
+# 头部: 最新序号, 槽位数, 每槽最大电机数, 最大工作进程数, 保留
+_HEADER = struct.Struct('<QIIII')
+# 快照携带的链路时间戳（开启延迟追踪时），顺序即槽位头中的顺序
+TRACE_FIELDS = ('poll_start', 'poll_end', 'decode_end', 'calc_end', 'enqueue')
+
+# 槽位头: 序列锁, 发布时间(epoch秒), 电机数量, 是否携带链路时间戳, 链路时间戳
+_SLOT_HEADER = struct.Struct(f'<QdII{len(TRACE_FIELDS)}d')
+_COUNTER = struct.Struct('<I')
+
+# 本进程创建的共享内存名称（fork出的工作进程继承该集合，与创建者共用同一个resource_tracker）
+_OWNED_NAMES = set()
+
+
+class SnapshotRing:
+    """
+    共享内存快照环形缓冲区
+
+    采集进程每次轮询把快照写入一次，多个工作进程只读访问。
+    每个槽位使用序列锁（写入时为奇数，写完为偶数），读者读前读后比较以获得一致的快照，
+    写者从不等待读者。
+    """
+
+    def __init__(self, name: Optional[str] = None, slots: int = 8, motor_capacity: int = 32,
+                 max_workers: int = 64, create: bool = False):
+        """
+        创建或连接共享内存环
+
+        Args:
+            name: 共享内存名称，连接已有环时必填
+            slots: 槽位数量
+            motor_capacity: 每个快照最多容纳的电机数量
+            max_workers: 最多记录多少个工作进程的客户端数量
+            create: True表示新建，False表示连接已有共享内存
+        """
+        if create:
+            self.slots = slots
+            self.motor_capacity = motor_capacity
+            self.max_workers = max_workers
+            size = self._total_size()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self.shm.buf[:size] = bytes(size)
+            _HEADER.pack_into(self.shm.buf, 0, 0, slots, motor_capacity, max_workers, 0)
+            _OWNED_NAMES.add(self.shm.name)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # 其他进程连接时，退出时不能让resource_tracker释放创建者的共享内存
+            if self.shm.name not in _OWNED_NAMES:
+                try:
+                    resource_tracker.unregister(self.shm._name, 'shared_memory')
+                except Exception:
+                    pass
+            _, self.slots, self.motor_capacity, self.max_workers, _ = _HEADER.unpack_from(self.shm.buf, 0)
+        self.owner = create
+        self._rows = struct.Struct(f'<{self.motor_capacity * ROW_WIDTH}d')
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def _counters_offset(self) -> int:
+        return _HEADER.size
+
+    def _slot_size(self) -> int:
+        return _SLOT_HEADER.size + self.motor_capacity * ROW_WIDTH * 8
+
+    def _slot_offset(self, index: int) -> int:
+        return _HEADER.size + self.max_workers * _COUNTER.size + index * self._slot_size()
+
+    def _total_size(self) -> int:
+        return self._slot_offset(self.slots)
+
+    @property
+    def sequence(self) -> int:
+        """最新已发布快照的序号，0表示还没有数据"""
+        return struct.unpack_from('<Q', self.shm.buf, 0)[0]
+
+    def publish(self, motors_data: List[Any], trace: Optional[Dict[str, float]] = None) -> int:
+        """
+        写入一帧快照
+
+        Args:
+            motors_data: MotorData对象或字典列表
+            trace: 可选的链路时间戳字典（TRACE_FIELDS），随快照写入槽位头
+
+        Returns:
+            本帧的序号
+        """
+        rows = [0.0] * (self.motor_capacity * ROW_WIDTH)
+        count = 0
+        for motor in motors_data[:self.motor_capacity]:
+            base = count * ROW_WIDTH
+            values = motor.to_dict() if hasattr(motor, 'to_dict') else motor
+            rows[base] = float(values.get('motor_id', 0))
+            for i, field in enumerate(SNAPSHOT_FIELDS):
+                rows[base + 1 + i] = float(values.get(field) or 0.0)
+            last_update = values.get('last_update')
+            if isinstance(last_update, str):
+                last_update = datetime.fromisoformat(last_update)
+            rows[base + ROW_WIDTH - 1] = last_update.timestamp() if last_update else 0.0
+            count += 1
+
+        seq = self.sequence + 1
+        offset = self._slot_offset(seq % self.slots)
+        buf = self.shm.buf
+        # 序列锁为奇数表示写入中
+        _SLOT_HEADER.pack_into(buf, offset, 2 * seq - 1, datetime.now().timestamp(), count, int(trace is not None),
+                               *[float((trace or {}).get(field) or 0.0) for field in TRACE_FIELDS])
+        self._rows.pack_into(buf, offset + _SLOT_HEADER.size, *rows)
+        struct.pack_into('<Q', buf, offset, 2 * seq)  # 偶数：写入完成
+        struct.pack_into('<Q', buf, 0, seq)
+        return seq
+
+    def read(self, seq: Optional[int] = None,
+             retries: int = 5) -> Optional[Tuple[int, float, List[Dict[str, Any]], Optional[Dict[str, float]]]]:
+        """
+        读取指定序号（默认最新）的快照
+
+        Returns:
+            (序号, 发布时间, 电机数据字典列表, 链路时间戳字典或None)；快照已被覆盖或不存在时返回None
+        """
+        for _ in range(retries):
+            target = seq if seq is not None else self.sequence
+            if target == 0:
+                return None
+            offset = self._slot_offset(target % self.slots)
+            buf = self.shm.buf
+            lock_before, published_at, count, traced, *trace = _SLOT_HEADER.unpack_from(buf, offset)
+            if lock_before != 2 * target:
+                if seq is not None and lock_before > 2 * target:
+                    return None  # 已被更新的快照覆盖
+                continue
+            rows = self._rows.unpack_from(buf, offset + _SLOT_HEADER.size)
+            lock_after = struct.unpack_from('<Q', buf, offset)[0]
+            if lock_after != lock_before:
+                continue
+            return (target, published_at, self._decode_rows(rows, count),
+                    dict(zip(TRACE_FIELDS, trace)) if traced else None)
+        return None
+
+    def _decode_rows(self, rows, count) -> List[Dict[str, Any]]:
+        """把扁平的float数组还原为电机数据字典"""
+        motors = []
+        for i in range(count):
+            base = i * ROW_WIDTH
+            motor = {'motor_id': int(rows[base])}
+            for j, field in enumerate(SNAPSHOT_FIELDS):
+                motor[field] = rows[base + 1 + j]
+            last_update = rows[base + ROW_WIDTH - 1]
+            motor['last_update'] = datetime.fromtimestamp(last_update).isoformat() if last_update else None
+            motors.append(motor)
+        return motors
+
+    def set_worker_count(self, worker_index: int, count: int):
+        """记录某个工作进程当前的客户端数量"""
+        if 0 <= worker_index < self.max_workers:
+            _COUNTER.pack_into(self.shm.buf, self._counters_offset() + worker_index * _COUNTER.size, count)
+
+    def get_total_count(self) -> int:
+        """所有工作进程客户端数量之和"""
+        offset = self._counters_offset()
+        return sum(
+            _COUNTER.unpack_from(self.shm.buf, offset + i * _COUNTER.size)[0]
+            for i in range(self.max_workers)
+        )
+
+    def close(self):
+        """断开共享内存，创建者同时释放"""
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+                _OWNED_NAMES.discard(self.shm.name)
+        except Exception as e:
+            logger.error(f"释放共享内存失败: {str(e)}")
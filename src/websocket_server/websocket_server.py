@@ -6,16 +6,37 @@ from datetime import datetime
 from typing import Dict, List, Any, Optional
 import threading
 import time
+import itertools
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import REGISTRY
+from .conflation import ConflationScheduler
+from .snapshot_cache import SnapshotCache, archive_latest
+from .replay_buffer import ReplayBuffer
+from .history import HistoryStore, downsample, to_epoch
+from .aggregates import AggregateIndex
+from .snapshot_ring import SNAPSHOT_FIELDS
 
 logger = logging.getLogger(__name__)
 
+BROADCAST_SECONDS = REGISTRY.histogram('ws_broadcast_duration_seconds', 'WebSocket广播耗时（序列化、记录和扇出）')
+FANOUT_SECONDS = REGISTRY.histogram('ws_fanout_duration_seconds', '把一条消息写入所有目标连接的耗时')
+MESSAGES_SENT = REGISTRY.counter('ws_messages_sent_total', '已写入连接的消息数（按连接计）')
+SKIPPED_UPDATES = REGISTRY.counter('ws_skipped_updates_total', '因写缓冲区积压跳过的更新数')
+SLOW_CLIENTS_CLOSED = REGISTRY.counter('ws_slow_clients_closed_total', '因持续积压被断开的慢客户端数')
+
 class WebSocketServer:
     """
     WebSocket服务器
     用于将电机数据广播给连接的WebSocket客户端
     """
     
-    def __init__(self, data_source, host='0.0.0.0', port=8765):
+    def __init__(self, data_source, host='0.0.0.0', port=8765,
+                 write_high_water=1024 * 1024, max_skipped_updates=30, reuse_port=False,
+                 replay_depth=600, replay_max_bytes=8 * 1024 * 1024,
+                 db_manager=None, history_points=3600,
+                 aggregate_bucket_seconds=60, aggregate_buckets=1440, aggregate_fields=None, epoch=None):
         """
         初始化WebSocket服务器
         
@@ -23,15 +44,60 @@ class WebSocketServer:
             data_source: 数据源对象，需要提供get_latest_motors_data()方法
             host: 服务器主机地址
             port: 服务器端口
+            write_high_water: 单个连接写缓冲区高水位（字节），超过时跳过该连接本次更新
+            max_skipped_updates: 连续跳过多少次更新后判定为慢客户端并断开
+            reuse_port: 是否启用SO_REUSEPORT，多个工作进程监听同一端口时使用
+            replay_depth: 断线补发环最多保留的更新条数
+            replay_max_bytes: 断线补发环最多占用的内存（字节）
+            db_manager: 可选的DatabaseManager，历史查询超出内存范围时从归档读取
+            history_points: 每台电机在内存中保留的历史采样点数
+            aggregate_bucket_seconds: 聚合索引的时间桶宽度（秒）
+            aggregate_buckets: 每台电机在内存中保留的聚合时间桶数量
+            aggregate_fields: 建立聚合索引的字段，默认比值、励磁电流和有功/无功功率
+            epoch: 序号所属的实例标识，默认每次启动随机生成（多进程模式下各工作进程使用同一个标识）
         """
         self.host = host
         self.port = port
+        self.reuse_port = reuse_port
         self.clients = set()  # 连接的客户端集合
         self.data_source = data_source  # 数据源
         self.running = False
         self.server = None
+        self.loop = None  # 服务器所在的事件循环，跨线程发布数据时使用
         self.on_client_count_changed = None  # 客户端数量变化回调
         
+        # 客户端限速合并：慢速客户端（看板、移动端）按协商速率只接收最新快照
+        self.conflation = ConflationScheduler()
+        
+        # 扇出背压：写缓冲区超过高水位的连接跳过本次更新，持续积压则断开
+        self.write_high_water = write_high_water
+        self.max_skipped_updates = max_skipped_updates
+        self.skipped_updates = {}  # 客户端 -> 连续跳过的更新次数
+        
+        # 预序列化的最新快照，新连接和get_latest直接发送缓存结果
+        self.snapshot_cache = SnapshotCache(data_source, self._format_motors_data,
+                                            archive_latest(db_manager) if db_manager else None)
+        self.client_encodings = {}  # 客户端 -> latest_data编码（json/binary）
+        
+        # 每条广播携带单调递增的序号，最近的广播保存在回放环中供重连客户端补齐；
+        # 序号只在同一实例内连续，重启后从头计数，带seq的帧都附上实例标识
+        self.sequence = 0
+        self.epoch = epoch or uuid.uuid4().hex[:12]
+        self.replay_buffer = ReplayBuffer(max_entries=replay_depth, max_bytes=replay_max_bytes)
+        
+        # 历史序列：最近的采样保存在内存环中，更早的从SQLite归档读取
+        self.db_manager = db_manager
+        self.history = HistoryStore(max_points=history_points, db_manager=db_manager)
+        
+        # 窗口聚合：按时间桶增量维护min/max/sum/count和分位数草图
+        self.aggregates = AggregateIndex(bucket_seconds=aggregate_bucket_seconds, max_buckets=aggregate_buckets,
+                                         fields=aggregate_fields, db_manager=db_manager)
+        
+        # 连接数和队列深度在导出指标时读取
+        REGISTRY.gauge('ws_connected_clients', '当前WebSocket连接数').set_function(lambda: len(self.clients))
+        REGISTRY.gauge('ws_conflation_pending', '限速合并队列中待发送的消息数').set_function(lambda: len(self.conflation.pending))
+        REGISTRY.gauge('ws_replay_buffer_bytes', '断线补发环占用的字节数').set_function(lambda: self.replay_buffer.total_bytes)
+        
     async def register(self, websocket):
         """注册新的WebSocket客户端"""
         self.clients.add(websocket)
@@ -47,6 +113,9 @@ class WebSocketServer:
     async def unregister(self, websocket):
         """注销WebSocket客户端"""
         self.clients.discard(websocket)
+        self.conflation.remove(websocket)
+        self.skipped_updates.pop(websocket, None)
+        self.client_encodings.pop(websocket, None)
         # logger.info(f"客户端断开，当前连接数: {len(self.clients)}")
         
         # 通知客户端数量变化
@@ -56,23 +125,11 @@ class WebSocketServer:
     async def send_latest_data_to_client(self, websocket):
         """向指定客户端发送最新数据"""
         try:
-            # logger.info("开始获取最新数据...")
-            motors_data = self.data_source.get_latest_motors_data()
-            # logger.info(f"获取到数据: {type(motors_data)}, 长度: {len(motors_data) if motors_data else 0}")
+            # 快照版本不变时直接复用已编码的消息
+            message = self.snapshot_cache.get(self.client_encodings.get(websocket, 'json'))
             
-            if motors_data:
-                # 确保数据是字典格式
-                formatted_data = self._format_motors_data(motors_data)
-                # logger.info(f"格式化后数据长度: {len(formatted_data)}")
-                
-                message = {
-                    'type': 'latest_data',
-                    'data': formatted_data,
-                    'timestamp': datetime.now().isoformat()
-                }
-                # logger.info(f"发送消息: {message['type']}, 数据条数: {len(formatted_data)}")
-                await websocket.send(json.dumps(message, ensure_ascii=False))
-                # logger.info("数据发送成功")
+            if message is not None:
+                await websocket.send(message)
             else:
                 logger.warning("没有获取到电机数据")
         except Exception as e:
@@ -110,20 +167,20 @@ class WebSocketServer:
             logger.error(f"详细错误: {traceback.format_exc()}")
             return []
     
-    async def broadcast_data(self, data):
+    async def broadcast_data(self, data, seq=None, trace=None):
         """
         向所有客户端广播数据
         
         Args:
             data: 要广播的数据（列表格式）
+            seq: 指定广播序号（多进程模式下使用共享内存序号），默认自增
+            trace: 可选的链路时间戳字典（开启延迟追踪时由采集端提供），补上send后随消息下发
         """
-        if not self.clients:
-            return
-        
         if not data:
             logger.warning("数据为空，跳过广播")
             return
         
+        started = time.perf_counter()
         try:
             # 验证数据格式
             logger.debug(f"广播数据，数据类型: {type(data)}, 长度: {len(data)}")
@@ -136,40 +193,306 @@ class WebSocketServer:
                 logger.error(f"数据不是列表格式: {type(data)}")
                 return
             
+            self.sequence = seq if seq is not None else self.sequence + 1
             message = {
                 'type': 'motor_update',
+                'epoch': self.epoch,
+                'seq': self.sequence,
                 'data': data,
                 'timestamp': datetime.now().isoformat()
             }
+            if trace is not None:
+                message['trace'] = dict(trace, send=time.time())
             
             message_json = json.dumps(message, ensure_ascii=False)
             logger.debug(f"消息序列化成功，长度: {len(message_json)}")
             
+            # 没有客户端时也要记录，重连的客户端需要补齐这段时间的更新
+            self.replay_buffer.append(self.sequence, message_json, data)
+            self.history.append(data)
+            self.aggregates.add(data)
+            
         except Exception as e:
             logger.error(f"准备广播数据失败: {str(e)}")
             import traceback
             logger.error(f"详细错误: {traceback.format_exc()}")
             return
         
-        # 创建发送任务列表
-        tasks = []
-        disconnected_clients = []
+        if self.clients:
+            # 限速客户端的消息合并到待发送队列，由时间轮按其速率下发
+            now = time.monotonic()
+            targets = [client for client in self.clients if self.conflation.offer(client, message_json, now)]
+            self.fan_out(targets, message_json)
+        BROADCAST_SECONDS.observe(time.perf_counter() - started)
+    
+    def fan_out(self, clients, message):
+        """
+        非阻塞地把同一条消息写入多个连接
+        
+        使用websockets.broadcast()直接写入各连接的写缓冲区，不为每个客户端创建任务；
+        写缓冲区超过高水位的连接跳过本次更新，连续跳过过多则关闭连接。
+        
+        Args:
+            clients: 目标客户端列表
+            message: 已序列化的消息
+        """
+        started = time.perf_counter()
+        healthy = []
+        for client in clients:
+            transport = getattr(client, 'transport', None)
+            buffered = transport.get_write_buffer_size() if transport else 0
+            if buffered <= self.write_high_water:
+                self.skipped_updates.pop(client, None)
+                healthy.append(client)
+                continue
+            
+            skipped = self.skipped_updates.get(client, 0) + 1
+            self.skipped_updates[client] = skipped
+            SKIPPED_UPDATES.inc()
+            logger.debug(f"客户端写缓冲区积压 {buffered} 字节，跳过本次更新（连续 {skipped} 次）")
+            if skipped >= self.max_skipped_updates:
+                logger.warning(f"客户端连续 {skipped} 次无法接收更新，断开慢客户端")
+                self.skipped_updates.pop(client, None)
+                SLOW_CLIENTS_CLOSED.inc()
+                asyncio.ensure_future(client.close(code=1013, reason='client too slow'))
+        
+        if healthy:
+            websockets.broadcast(healthy, message)
+            MESSAGES_SENT.inc(len(healthy))
+        FANOUT_SECONDS.observe(time.perf_counter() - started)
+    
+    def publish(self, data, trace=None):
+        """
+        线程安全地广播数据（供采集线程调用）
+        
+        Args:
+            data: 要广播的数据（列表格式）
+            trace: 可选的链路时间戳字典，记录enqueue后交给事件循环
+        
+        Returns:
+            concurrent.futures.Future，服务器未运行时返回None
+        """
+        if not self.loop or not self.running:
+            return None
+        if trace is not None:
+            trace = dict(trace, enqueue=time.time())
+        return asyncio.run_coroutine_threadsafe(self.broadcast_data(data, trace=trace), self.loop)
+    
+    async def flush_conflated(self):
+        """定时下发限速客户端合并后的最新消息"""
+        tick = self.conflation.wheel.tick
+        while self.running:
+            await asyncio.sleep(tick)
+            ready = self.conflation.due(time.monotonic())
+            if not ready:
+                continue
+            # 同一时刻到期的客户端大多共享同一条消息，按消息分组扇出
+            groups = {}
+            for client, message in ready:
+                if client in self.clients:
+                    groups.setdefault(id(message), (message, []))[1].append(client)
+            for message, clients in groups.values():
+                self.fan_out(clients, message)
+    
+    def _parse_max_rate(self, data):
+        """从hello/subscribe消息中解析客户端期望的最大更新速率（次/秒）"""
+        max_rate = data.get('max_rate')
+        if max_rate is None and data.get('min_interval'):
+            max_rate = 1.0 / float(data['min_interval'])
+        if max_rate is None:
+            return None
+        return float(max_rate)
+    
+    async def set_client_max_rate(self, websocket, max_rate):
+        """设置客户端最大更新速率并回复确认"""
+        # 取消限速时，把已合并的最新消息立即补发
+        pending = self.conflation.set_max_rate(websocket, max_rate)
+        if pending is not None:
+            await websocket.send(pending)
+        
+        await websocket.send(json.dumps({
+            'type': 'hello_ack',
+            'max_rate': self.conflation.get_max_rate(websocket),
+            'encoding': self.client_encodings.get(websocket, 'json'),
+            'epoch': self.epoch,
+            'timestamp': datetime.now().isoformat()
+        }))
+    
+    async def resume_client(self, websocket, last_seq, epoch=None):
+        """
+        补发客户端断线期间错过的更新
+        
+        last_seq属于本实例（epoch相同）且回放环仍覆盖其后的全部更新时，合并为一个resume_batch帧发送；
+        客户端落后太多、服务器已重启（epoch不同）或客户端没有提供epoch时发送最新一帧作为关键帧。
+        """
+        missed = None
+        if epoch == self.epoch and last_seq is not None and 0 <= last_seq <= self.sequence:
+            missed = self.replay_buffer.since(last_seq)
+        
+        if missed is not None:
+            # 补发消息已是序列化好的JSON，直接拼接，避免重新序列化
+            await websocket.send(
+                '{"type": "resume_batch", "epoch": %s, "from_seq": %d, "to_seq": %d, "updates": [%s]}'
+                % (json.dumps(self.epoch), last_seq, self.sequence, ', '.join(missed))
+            )
+            return
+        
+        latest = self.replay_buffer.latest()
+        if latest is None:
+            await self.send_latest_data_to_client(websocket)
+            return
+        seq, _, data = latest
+        await websocket.send(json.dumps({
+            'type': 'latest_data',
+            'keyframe': True,
+            'epoch': self.epoch,
+            'seq': seq,
+            'data': data,
+            'timestamp': datetime.now().isoformat()
+        }, ensure_ascii=False))
+    
+    async def send_history(self, websocket, data):
+        """
+        分块流式发送电机历史序列
         
-        for client in self.clients:
+        请求字段: motor_id, start/end（ISO时间或epoch秒，默认最近1小时）, fields, max_points（降采样目标点数）,
+        chunk_size, request_id。依次回复若干history_chunk帧，最后回复history_end。
+        """
+        request_id = data.get('request_id')
+        motor_id = data.get('motor_id')
+        fields = data.get('fields') or SNAPSHOT_FIELDS
+        unknown = [field for field in fields if field not in SNAPSHOT_FIELDS]
+        if motor_id is None or unknown:
+            await websocket.send(json.dumps({
+                'type': 'error',
+                'request': 'history',
+                'request_id': request_id,
+                'message': f"缺少motor_id或未知字段: {unknown}" if unknown else "缺少motor_id",
+                'timestamp': datetime.now().isoformat()
+            }, ensure_ascii=False))
+            return
+        
+        end = to_epoch(data.get('end')) or time.time()
+        start = to_epoch(data.get('start')) or end - 3600
+        max_points = int(data.get('max_points') or 0)
+        chunk_size = max(1, int(data.get('chunk_size') or 500))
+        
+        source, source_points = self.history.query(motor_id, start, end, fields, max_points)
+        points = source_points
+        if max_points > 0:
+            points = downsample(points, start, end, max_points)
+        
+        def take():
+            return list(itertools.islice(points, chunk_size))
+        
+        # 归档读取在专用线程中进行（SQLite连接不能跨线程），不阻塞事件循环；
+        # 每块发送完成后再读取下一块，服务器内存只占用一个分块
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1) if source == 'archive' else None
+        total = 0
+        chunk_index = 0
+        try:
+            while True:
+                chunk = await loop.run_in_executor(executor, take) if executor else take()
+                if not chunk:
+                    break
+                await websocket.send(json.dumps({
+                    'type': 'history_chunk',
+                    'request_id': request_id,
+                    'motor_id': motor_id,
+                    'chunk': chunk_index,
+                    'columns': ['timestamp'] + list(fields),
+                    'points': [[datetime.fromtimestamp(point[0]).isoformat()] + list(point[1:]) for point in chunk]
+                }, ensure_ascii=False))
+                total += len(chunk)
+                chunk_index += 1
+        finally:
+            if executor:
+                # 在同一线程中关闭归档游标，客户端中途断开时也能及时释放连接
+                await loop.run_in_executor(executor, source_points.close)
+                executor.shutdown(wait=False)
+        
+        await websocket.send(json.dumps({
+            'type': 'history_end',
+            'request_id': request_id,
+            'motor_id': motor_id,
+            'count': total,
+            'chunks': chunk_index,
+            'source': source,
+            'timestamp': datetime.now().isoformat()
+        }))
+    
+    async def send_aggregate(self, websocket, data):
+        """
+        回复窗口聚合查询
+        
+        请求字段: motor_id（单个或列表，缺省为所有电机）, fields（或单个field）, start/end（默认最近1小时）,
+        stats（min/max/mean/count）, percentiles（如[50, 99]）, request_id。回复一条aggregate_result。
+        """
+        request_id = data.get('request_id')
+        fields = data.get('fields') or ([data['field']] if data.get('field') else self.aggregates.fields)
+        unknown = [field for field in fields if field not in self.aggregates.fields]
+        stats = data.get('stats') or ['min', 'max', 'mean', 'count']
+        try:
+            percentiles = [float(p) for p in data.get('percentiles') or []]
+        except (TypeError, ValueError):
+            percentiles = None
+        if unknown or percentiles is None or any(not 0 <= p <= 100 for p in percentiles):
+            await websocket.send(json.dumps({
+                'type': 'error',
+                'request': 'aggregate',
+                'request_id': request_id,
+                'message': f"未建立聚合索引的字段: {unknown}" if unknown else "percentiles必须是0~100之间的数字",
+                'timestamp': datetime.now().isoformat()
+            }, ensure_ascii=False))
+            return
+        
+        motor_ids = data.get('motor_id')
+        if motor_ids is None:
+            motor_ids = self.aggregates.motor_ids()
+        elif not isinstance(motor_ids, list):
+            motor_ids = [motor_ids]
+        end = to_epoch(data.get('end')) or time.time()
+        start = to_epoch(data.get('start')) or end - 3600
+        
+        start, end = self.aggregates.align(start, end)
+        started = time.perf_counter()
+        # 内存桶在事件循环线程中合并为副本（广播也在这个线程更新时间桶），工作线程只读取归档
+        parts = [(motor_id, field) + self.aggregates.collect(motor_id, field, start, end)
+                 for motor_id in motor_ids for field in fields]
+        
+        def compute():
+            results = []
+            for motor_id, field, merged, archive in parts:
+                if archive:
+                    merged.merge(self.aggregates.collect_archive(motor_id, field, *archive))
+                result = {'motor_id': motor_id, 'field': field}
+                result.update(self.aggregates.summarize(merged, stats, percentiles))
+                results.append(result)
+            return results
+        
+        source = 'archive' if any(archive for *_, archive in parts) else 'memory'
+        if source == 'archive':
+            # 归档部分在专用线程中读取（SQLite连接不能跨线程），不阻塞事件循环
+            executor = ThreadPoolExecutor(max_workers=1)
             try:
-                task = asyncio.create_task(client.send(message_json))
-                tasks.append(task)
-            except Exception as e:
-                logger.error(f"发送数据到客户端失败: {str(e)}")
-                disconnected_clients.append(client)
-        
-        # 移除断开的客户端
-        for client in disconnected_clients:
-            await self.unregister(client)
-        
-        # 等待所有发送任务完成
-        if tasks:
-            await asyncio.gather(*tasks, return_exceptions=True)
+                results = await asyncio.get_running_loop().run_in_executor(executor, compute)
+            finally:
+                executor.shutdown(wait=False)
+        else:
+            results = compute()
+        
+        await websocket.send(json.dumps({
+            'type': 'aggregate_result',
+            'request_id': request_id,
+            'start': datetime.fromtimestamp(start).isoformat(),
+            'end': datetime.fromtimestamp(end).isoformat(),
+            'bucket_seconds': self.aggregates.bucket_seconds,
+            'source': source,
+            'elapsed_us': int((time.perf_counter() - started) * 1e6),
+            'results': results,
+            'timestamp': datetime.now().isoformat()
+        }, ensure_ascii=False))
     
     async def handle_client(self, websocket, path):
         """处理客户端连接"""
@@ -199,11 +522,34 @@ class WebSocketServer:
                 'timestamp': datetime.now().isoformat()
             }))
         
+        elif msg_type == 'hello':
+            # 客户端握手，协商latest_data编码和最大更新速率
+            if data.get('encoding') in ('json', 'binary'):
+                self.client_encodings[websocket] = data['encoding']
+            await self.set_client_max_rate(websocket, self._parse_max_rate(data))
+        
+        elif msg_type == 'resume':
+            # 断线重连后按序号补齐错过的更新
+            last_seq = data.get('last_seq')
+            await self.resume_client(websocket, int(last_seq) if last_seq is not None else None, data.get('epoch'))
+        
+        elif msg_type == 'history':
+            # 历史序列查询，分块流式返回
+            await self.send_history(websocket, data)
+        
+        elif msg_type == 'aggregate':
+            # 窗口聚合查询，直接从时间桶索引回答
+            await self.send_aggregate(websocket, data)
+        
         elif msg_type == 'get_latest':
             # 获取最新数据
             await self.send_latest_data_to_client(websocket)
         
         elif msg_type == 'subscribe':
+            # 订阅时也可以携带最大更新速率
+            if 'max_rate' in data or 'min_interval' in data:
+                await self.set_client_max_rate(websocket, self._parse_max_rate(data))
+            
             # 订阅特定电机数据
             motor_id = data.get('motor_id')
             if motor_id:
@@ -314,23 +660,28 @@ class WebSocketServer:
     async def start_server(self):
         """启动WebSocket服务器"""
         self.running = True
+        self.loop = asyncio.get_running_loop()
         # 注释掉数据监控线程，避免与Modbus客户端的直接广播冲突
         # self.start_data_monitoring()
         
         self.server = await websockets.serve(
             self.handle_client,
             self.host,
-            self.port
+            self.port,
+            reuse_port=self.reuse_port
         )
         
         # logger.info(f"WebSocket服务器启动: ws://{self.host}:{self.port}")
         
+        flush_task = asyncio.create_task(self.flush_conflated())
+        
         try:
             await self.server.wait_closed()
         except KeyboardInterrupt:
             logger.info("服务器关闭")
         finally:
             self.running = False
+            flush_task.cancel()
     
     def start(self):
         """在后台线程中启动服务器"""
@@ -345,7 +696,10 @@ class WebSocketServer:
         """停止服务器"""
         self.running = False
         if self.server:
-            self.server.close()
+            if self.loop and self.loop.is_running():
+                self.loop.call_soon_threadsafe(self.server.close)
+            else:
+                self.server.close()
         # logger.info("WebSocket服务器已停止")
     
     def get_client_count(self):
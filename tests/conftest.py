@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 与各启动脚本相同，以src为根目录导入db、websocket_server等包
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
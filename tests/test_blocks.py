@@ -0,0 +1,40 @@
+import numpy as np
+
+from db.blocks import decode_block, encode_block
+
+
+def _round_trip(ts, values, columns=None):
+    decoded_ts, decoded = decode_block(encode_block(ts, values), columns)
+    np.testing.assert_array_equal(decoded_ts, ts)
+    for column in (range(values.shape[1]) if columns is None else columns):
+        # 按位比较，NaN和-0.0也必须原样还原
+        np.testing.assert_array_equal(decoded[column].view(np.uint64), values[:, column].view(np.uint64))
+    return decoded
+
+
+def test_round_trip_irregular_timestamps_and_random_values():
+    rng = np.random.default_rng(0)
+    ts = 1_700_000_000_000 + np.cumsum(rng.integers(1, 70_000, 500))
+    values = rng.normal(0, 1000, (500, 4))
+    _round_trip(ts, values)
+
+
+def test_round_trip_constant_and_special_values():
+    ts = np.arange(10, dtype=np.int64) * 1000
+    values = np.zeros((10, 3))
+    values[:, 1] = 50.0
+    values[[2, 3, 7], 2] = np.nan
+    values[5, 2] = -0.0
+    values[6, 2] = np.inf
+    _round_trip(ts, values)
+
+
+def test_round_trip_single_sample():
+    _round_trip(np.array([42], dtype=np.int64), np.array([[1.5, np.nan]]))
+
+
+def test_decode_selected_columns_only():
+    ts = np.arange(20, dtype=np.int64)
+    values = np.arange(60, dtype=np.float64).reshape(20, 3)
+    decoded = _round_trip(ts, values, columns=[2])
+    assert set(decoded) == {2}
@@ -0,0 +1,73 @@
+import numpy as np
+
+from db.deadband import CompressionSpec, DeadbandFilter, interpolate
+
+FIELDS = ('ratio', 'current', 'power')
+SETTINGS = {
+    'ratio': {'method': 'swinging_door', 'tolerance': 0.01},
+    'current': {'method': 'deadband', 'tolerance': 0.5},
+    'power': {'method': 'percent', 'tolerance': 2},
+}
+
+
+def _compress(spec, ts, values):
+    """逐个采样经过死区过滤器，返回保存的行号"""
+    deadband = DeadbandFilter(spec)
+    stored = []
+    for index in range(len(ts)):
+        stored += deadband.add(1, int(ts[index]), values[index], index)
+    stored += deadband.flush()
+    assert stored == sorted(set(stored))
+    assert deadband.skipped == len(ts) - len(stored)
+    return np.array(stored)
+
+
+def _signal(count=2000, seed=1):
+    rng = np.random.default_rng(seed)
+    ts = np.arange(count, dtype=np.int64) * 1000
+    t = np.arange(count)
+    values = np.column_stack([
+        0.8 + 0.05 * np.sin(t / 50) + rng.normal(0, 0.002, count),
+        100 + 3 * np.sin(t / 80) + rng.normal(0, 0.1, count),
+        500 + 20 * np.sin(t / 120) + rng.normal(0, 1, count),
+    ])
+    return ts, values
+
+
+def test_reconstruction_within_tolerance():
+    spec = CompressionSpec(FIELDS, SETTINGS, max_interval=60)
+    ts, values = _signal()
+    stored = _compress(spec, ts, values)
+    assert len(stored) < len(ts) / 2
+
+    valid, rebuilt = interpolate(ts[stored], values[stored], ts, spec.linear_mask(FIELDS), spec.max_interval_ms)
+    assert valid.all()
+    error = np.abs(rebuilt - values)
+    assert (error[:, 0] <= 0.01 + 1e-12).all()
+    assert (error[:, 1] <= 0.5 + 1e-12).all()
+    # 百分比死区的容差按保存时的值计算
+    previous = values[stored][np.searchsorted(ts[stored], ts, 'right') - 1, 2]
+    assert (error[:, 2] <= np.abs(previous) * 0.02 + 1e-9).all()
+
+
+def test_max_interval_forces_save():
+    spec = CompressionSpec(FIELDS, SETTINGS, max_interval=10)
+    ts = np.arange(100, dtype=np.int64) * 1000
+    stored = _compress(spec, ts, np.ones((100, 3)))
+    assert (np.diff(ts[stored]) <= 10_000).all()
+
+
+def test_missing_value_change_is_saved():
+    spec = CompressionSpec(FIELDS, SETTINGS)
+    ts = np.arange(6, dtype=np.int64) * 1000
+    values = np.ones((6, 3))
+    values[3, 1] = np.nan
+    stored = _compress(spec, ts, values)
+    assert 3 in stored and 4 in stored
+
+
+def test_gap_longer_than_max_interval_is_not_rebuilt():
+    ts = np.array([0, 1000, 100_000], dtype=np.int64)
+    values = np.array([[1.0], [2.0], [3.0]])
+    valid, _ = interpolate(ts, values, np.array([500, 50_000, 100_000]), np.array([True]), 60_000)
+    assert valid.tolist() == [True, False, True]
@@ -0,0 +1,77 @@
+import sqlite3
+
+import pytest
+
+from db.database import NUMERIC_FIELDS, SCHEMA_VERSION, DatabaseManager, get_schema_version, to_epoch_ms
+from db.migrate import migrate
+
+# 版本1的motor_data表: ISO文本时间戳 + 自增id
+V1_TABLE_SQL = f'''
+    CREATE TABLE motor_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        motor_id INTEGER NOT NULL,
+        timestamp DATETIME NOT NULL,
+        {', '.join(f'{field} REAL' for field in NUMERIC_FIELDS)},
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+@pytest.fixture
+def v1_database(tmp_path):
+    path = str(tmp_path / 'motor_data.db')
+    rows = []
+    for motor_id in (1, 2):
+        for second in range(120):
+            values = [float(motor_id * 1000 + second + i) for i in range(len(NUMERIC_FIELDS))]
+            rows.append((motor_id, f'2024-06-10T08:{second // 60:02d}:{second % 60:02d}', *values))
+    rows.append(rows[0])  # 同一时刻的重复行
+    rows.append((1, 'not a time', *[0.0] * len(NUMERIC_FIELDS)))  # 无法解析的时间戳
+    with sqlite3.connect(path) as conn:
+        conn.execute(V1_TABLE_SQL)
+        conn.execute('CREATE INDEX idx_motor_timestamp ON motor_data (motor_id, timestamp)')
+        conn.executemany(f'''
+            INSERT INTO motor_data (motor_id, timestamp, {', '.join(NUMERIC_FIELDS)})
+            VALUES ({', '.join('?' * (len(NUMERIC_FIELDS) + 2))})
+        ''', rows)
+    conn.close()
+    return path
+
+
+def test_migrate_v1_to_current(v1_database):
+    with sqlite3.connect(v1_database) as conn:
+        assert get_schema_version(conn) == 1
+        assert migrate(conn) == (1, SCHEMA_VERSION)
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION == 9
+
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(motor_data)')]
+        assert 'timestamp' not in columns and 'ts' in columns
+        assert conn.execute('SELECT COUNT(*) FROM motor_data').fetchone()[0] == 240
+
+        # 汇总表: 每台电机两个1分钟桶，各字段的有效采样数等于桶内采样数
+        buckets = conn.execute(f'''
+            SELECT motor_id, count, frequency_count, frequency_sum / frequency_count FROM motor_rollups
+            WHERE resolution = 60 ORDER BY motor_id, bucket
+        ''').fetchall()
+        frequency = NUMERIC_FIELDS.index('frequency')
+        assert buckets == [(motor_id, 60, 60, motor_id * 1000 + start + 29.5 + frequency)
+                           for motor_id in (1, 2) for start in (0, 60)]
+
+        assert conn.execute('SELECT SUM(record_count) FROM motor_stats').fetchone()[0] == 240
+        for table in ('poll_snapshots', 'motor_blocks', 'archive_settings'):
+            assert conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] == 0
+        # 再次升级不做任何事
+        assert migrate(conn) == (SCHEMA_VERSION, SCHEMA_VERSION)
+    conn.close()
+
+    latest = DatabaseManager(v1_database).get_latest_motor_data(2)
+    assert latest['ts'] == to_epoch_ms('2024-06-10T08:01:59')
+    assert latest['frequency'] == 2000 + 119 + frequency
+
+
+def test_database_manager_upgrades_on_open(v1_database):
+    rows = DatabaseManager(v1_database).get_motor_data(1, limit=3)
+    assert [row['ts'] for row in rows] == [to_epoch_ms(f'2024-06-10T08:01:{second}') for second in (59, 58, 57)]
+    with sqlite3.connect(v1_database) as conn:
+        assert get_schema_version(conn) == SCHEMA_VERSION
+    conn.close()
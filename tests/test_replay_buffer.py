@@ -0,0 +1,37 @@
+from websocket_server.replay_buffer import ReplayBuffer
+
+
+def _buffer(seqs, **kwargs):
+    buffer = ReplayBuffer(**kwargs)
+    for seq in seqs:
+        buffer.append(seq, f'm{seq}')
+    return buffer
+
+
+def test_empty_buffer_cannot_resume():
+    assert ReplayBuffer().since(0) is None
+
+
+def test_since_edges():
+    buffer = _buffer(range(5, 10))
+    assert buffer.since(4) == ['m5', 'm6', 'm7', 'm8', 'm9']
+    assert buffer.since(3) is None
+    assert buffer.since(7) == ['m8', 'm9']
+    assert buffer.since(9) == []
+    assert buffer.since(20) == []
+
+
+def test_non_contiguous_sequences():
+    buffer = _buffer([2, 4, 8])
+    assert buffer.since(1) == ['m2', 'm4', 'm8']
+    assert buffer.since(5) == ['m8']
+
+
+def test_evicted_by_entries_and_bytes():
+    buffer = _buffer(range(1, 11), max_entries=4)
+    assert (buffer.first_seq, buffer.last_seq) == (7, 10)
+    assert buffer.since(5) is None
+
+    buffer = _buffer(range(1, 11), max_bytes=7)
+    assert len(buffer) == 3 and buffer.total_bytes == 7
+    assert buffer.since(7) == ['m8', 'm9', 'm10']
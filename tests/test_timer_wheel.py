@@ -0,0 +1,43 @@
+from websocket_server.conflation import TimerWheel
+
+
+def _wheel():
+    wheel = TimerWheel(tick=0.1, slots=8)
+    wheel.current_tick = 0
+    return wheel
+
+
+def test_expires_at_deadline():
+    wheel = _wheel()
+    wheel.schedule('a', 0.25)
+    assert wheel.advance(0.2) == []
+    assert wheel.advance(0.35) == ['a']
+    assert wheel.advance(1.0) == []
+
+
+def test_cancel():
+    wheel = _wheel()
+    wheel.schedule('a', 0.25)
+    wheel.schedule('b', 0.25)
+    wheel.cancel('a')
+    wheel.cancel('missing')
+    assert wheel.advance(1.0) == ['b']
+    assert wheel.slot_of == {}
+
+
+def test_reschedule_replaces_previous_timer():
+    wheel = _wheel()
+    wheel.schedule('a', 0.25)
+    wheel.schedule('a', 0.55)
+    assert wheel.advance(0.4) == []
+    assert wheel.advance(0.7) == ['a']
+
+
+def test_deadline_beyond_one_revolution():
+    wheel = _wheel()
+    wheel.schedule('a', 2.0)
+    assert wheel.advance(1.0) == []
+    wheel.cancel('a')
+    assert wheel.advance(5.0) == []
+    wheel.schedule('b', 6.0)
+    assert wheel.advance(10.0) == ['b']